@@ -0,0 +1,501 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+from pm4py.objects.petri_net.obj import PetriNet, Marking
+from pm4py.objects.petri_net.importer.variants import pnml as pm4py_pnml
+from pm4py.objects.petri_net.utils.petri_utils import add_arc_from_to
+
+from pnv.importer import epnml, pnvb
+from pnv.importer.epnml import ExtendedTransition, add_floating_arc_from_to
+
+GRAPHICS_WIDTH = 40
+GRID_STEP = 100
+
+
+def generate_level(size: int, depth: int, fanout: int, layout: bool, rnd: random.Random, prefix: str = '',
+                   outer: list[PetriNet.Place] = None, components: int = 1) -> tuple[PetriNet, Marking, Marking]:
+    net = PetriNet(f'{prefix}generated_{size}')
+    places = [PetriNet.Place(f'{prefix}p{i}') for i in range(size)]
+    transitions = []
+    for i in range(size):
+        if depth > 0 and i < fanout:
+            transitions.append(ExtendedTransition(f'{prefix}t{i}', f'{prefix}t{i}'))
+        else:
+            transitions.append(PetriNet.Transition(f'{prefix}t{i}', f'{prefix}t{i}'))
+    net.places.update(places)
+    net.transitions.update(transitions)
+    if layout:
+        cols = max(1, int(size ** 0.5))
+        for i in range(size):
+            x, y = (i % cols) * 2 * GRID_STEP, (i // cols) * GRID_STEP
+            places[i].properties['layout_information_petri'] = ((x, y), (GRAPHICS_WIDTH, GRAPHICS_WIDTH))
+            transitions[i].properties['layout_information_petri'] = ((x + GRID_STEP, y),
+                                                                     (GRAPHICS_WIDTH, GRAPHICS_WIDTH))
+    # rings per component with some random chords inside of it
+    block = max(1, size // components)
+    for i in range(size):
+        start = min(i // block, components - 1) * block
+        end = size if i // block >= components - 1 else start + block
+        add_arc_from_to(places[i], transitions[i], net)
+        add_arc_from_to(transitions[i], places[start + (i + 1 - start) % (end - start)], net)
+        if rnd.random() < 0.2:
+            add_arc_from_to(transitions[i], places[rnd.randrange(start, end)], net, weight=rnd.randint(1, 3))
+    # boundary arcs of an inner net go to the places of the enclosing one
+    if outer:
+        add_floating_arc_from_to(outer[0], transitions[0], net, inner_fr=False)
+        add_floating_arc_from_to(transitions[-1], outer[-1], net, inner_fr=True)
+    for i, t in enumerate(transitions):
+        if isinstance(t, ExtendedTransition):
+            inner = generate_level(max(2, size // 10), depth - 1, fanout, layout, rnd, f'{t.name}_', places)
+            t.inject_net(*inner)
+    im = Marking()
+    im[places[0]] = 1
+    fm = Marking()
+    fm[places[-1]] = 1
+    return net, im, fm
+
+
+def generate_net(size: int, depth: int = 0, fanout: int = 3, layout: bool = True, seed: int = 0,
+                 components: int = 1) -> tuple[PetriNet, Marking, Marking]:
+    return generate_level(size, depth, fanout, layout, random.Random(seed), components=components)
+
+
+def generate_hierarchy(groups: int, group_size: int, deep: bool, seed: int = 0) -> tuple[PetriNet, Marking, Marking]:
+    # groups side by side in one net or nested into each other as a chain
+    rnd = random.Random(seed)
+    net, im, fm = generate_level(group_size, 0, 0, True, rnd)
+    top = [net]
+    outer = list(net.places)
+    holder = None
+    for g in range(groups):
+        t = ExtendedTransition(f'g{g}', f'g{g}')
+        inner = generate_level(group_size, 0, 0, True, rnd, f'g{g}_', outer)
+        t.inject_net(*inner)
+        if deep and holder is not None:
+            holder.inner_net.transitions.add(t)
+        else:
+            top[0].transitions.add(t)
+        if deep:
+            holder, outer = t, list(inner[0].places)
+    return net, im, fm
+
+
+def materialize(net: PetriNet) -> PetriNet:
+    # builds every deferred inner net
+    for t in net.transitions:
+        if isinstance(t, ExtendedTransition):
+            materialize(t.inner_net)
+    return net
+
+
+def best_of(fn: Callable, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        ret = fn()
+        elapsed = time.perf_counter() - start
+        del ret
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(title: str, cases: list[tuple[str, Callable]], repeat: int):
+    print(title)
+    base = None
+    for name, fn in cases:
+        elapsed = best_of(fn, repeat)
+        base = elapsed if base is None else base
+        print(f'  {name:<28} {elapsed:9.3f}s  x{base / elapsed:.2f}')
+
+
+# the repository before the single pass walker and the streaming importer, the baseline of bench_import
+BASELINE_REVISION = 'e83dfed'
+
+
+def baseline_epnml() -> Optional[types.ModuleType]:
+    # pnv.importer.epnml of BASELINE_REVISION read from git as a module of its own, None without the history
+    source = f'{BASELINE_REVISION}:pnv/importer/epnml.py'
+    try:
+        code = subprocess.run(['git', 'show', source], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    module = types.ModuleType('baseline_epnml')
+    exec(compile(code, source, 'exec'), module.__dict__)
+    return module
+
+
+def bench_import(sizes: list[int], depth: int, repeat: int):
+    baseline = baseline_epnml()
+    if baseline is None:
+        print(f'  {BASELINE_REVISION} not found in git, no baseline', file=sys.stderr)
+    for size in sizes:
+        net, im, fm = generate_net(size, depth)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'generated.epnml')
+            epnml.export_net(net, im, path, fm)
+            del net, im, fm
+            # speedups are against the importer before the single pass walker
+            cases = [] if baseline is None else [('previous epnml (DOM)', lambda: baseline.import_net(path))]
+            if depth == 0:
+                cases.append(('pm4py pnml (3 passes)', lambda: pm4py_pnml.import_net(path)))
+            cases += [('epnml.import_net', lambda: epnml.import_net(path)),
+                      ('epnml.import_net_stream', lambda: epnml.import_net_stream(path))]
+            if depth > 0:
+                # the previous importer built every inner net right away
+                cases.append(('  + all inner nets built', lambda: materialize(epnml.import_net_stream(path)[0])))
+            report(f'import: {size} places/transitions, depth {depth} ({os.path.getsize(path) // 1024} KiB)',
+                   cases, repeat)
+
+
+def bench_export(sizes: list[int], depth: int, repeat: int):
+    def tree_export(net, im, fm, path):
+        tree = epnml.export_petri_tree(net, im, final_marking=fm)
+        with open(path, 'wb') as F:
+            tree.write(F, pretty_print=True, xml_declaration=True, encoding='utf-8')
+
+    for size in sizes:
+        net, im, fm = generate_net(size, depth)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'generated.epnml')
+            report(f'export: {size} places/transitions, depth {depth}',
+                   [('etree + pretty_print', lambda: tree_export(net, im, fm, path)),
+                    ('epnml.export_net_stream', lambda: epnml.export_net(net, im, path, fm))], repeat)
+
+
+def bench_binary(sizes: list[int], depth: int, repeat: int):
+    for size in sizes:
+        net, im, fm = generate_net(size, depth)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'generated.epnml')
+            epnml.export_net(net, im, path, fm)
+            binary = os.path.join(tmp, 'generated.pnvb')
+            pnvb.epnml_to_binary(path, binary)
+            del net, im, fm
+            report(f'open: {size} places/transitions, depth {depth} '
+                   f'({os.path.getsize(path) // 1024} KiB xml, {os.path.getsize(binary) // 1024} KiB binary)',
+                   [('epnml.import_net', lambda: epnml.import_net(path)),
+                    ('pnvb.import_net', lambda: pnvb.import_net(binary)),
+                    ('  + all inner nets built', lambda: materialize(pnvb.import_net(binary)[0]))], repeat)
+
+
+def tile_net(path: str, nodes: int) -> tuple[PetriNet, Marking, Marking]:
+    # copies of a real net side by side, ids prefixed per copy, until it has the requested number of nodes
+    base, base_im, base_fm = pm4py_pnml.import_net(path)
+    xs = [p.properties['layout_information_petri'][0][0] for p in [*base.places, *base.transitions]
+          if 'layout_information_petri' in p.properties]
+    width = (max(xs) - min(xs) if xs else 0) + 4 * GRID_STEP
+    per_copy = len(base.places) + len(base.transitions)
+    net, im, fm = PetriNet(f'tiled_{nodes}'), Marking(), Marking()
+    for c in range(-(-nodes // per_copy)):
+        copies = {}
+        for node in [*base.places, *base.transitions]:
+            if isinstance(node, PetriNet.Place):
+                copy = PetriNet.Place(f'c{c}_{node.name}')
+                net.places.add(copy)
+            else:
+                copy = PetriNet.Transition(f'c{c}_{node.name}', node.label)
+                net.transitions.add(copy)
+            copy.properties.update(node.properties)
+            if 'layout_information_petri' in node.properties:
+                (x, y), shape = node.properties['layout_information_petri']
+                copy.properties['layout_information_petri'] = ((x + c * width, y), shape)
+            copies[node] = copy
+        for a in base.arcs:
+            add_arc_from_to(copies[a.source], copies[a.target], net, weight=a.weight)
+        for p, n in base_im.items():
+            im[copies[p]] = n
+        for p, n in base_fm.items():
+            fm[copies[p]] = n
+    return net, im, fm
+
+
+def bench_pnml(source: str, sizes: list[int], repeat: int):
+    for size in sizes:
+        net, im, fm = tile_net(source, size)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tiled.pnml')
+            epnml.export_net(net, im, path, fm, hierarchical=False)
+            nodes = len(net.places) + len(net.transitions)
+            del net, im, fm
+            report(f'pnml: {os.path.basename(source)} tiled to {nodes} places/transitions '
+                   f'({os.path.getsize(path) // 1024} KiB)',
+                   [('pm4py.read_pnml', lambda: pm4py_pnml.import_net(path)),
+                    ('epnml.import_pnml', lambda: epnml.import_pnml(path))], repeat)
+
+
+def bench_multi(counts: list[int], size: int, repeat: int):
+    # the loading step of the GUI for several files: parse, write the binary form, read it back
+    from main import load_net_process
+
+    def sequential(paths, tmp):
+        for i, path in enumerate(paths):
+            out = os.path.join(tmp, f'{i}.pnvb')
+            load_net_process(path, out, 'auto')
+            pnvb.import_net(out)
+
+    def pooled(paths, tmp):
+        with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            outs = [os.path.join(tmp, f'{i}.pnvb') for i in range(len(paths))]
+            for _ in pool.map(load_net_process, paths, outs, ['auto'] * len(paths)):
+                pass
+        for out in outs:
+            pnvb.import_net(out)
+
+    for count in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(count):
+                net, im, fm = generate_net(size, seed=i)
+                paths.append(os.path.join(tmp, f'net{i}.pnml'))
+                epnml.export_net(net, im, paths[-1], fm, hierarchical=False)
+            del net, im, fm
+            report(f'multi: {count} files of {size} places/transitions, {os.cpu_count()} cores',
+                   [('one after another', lambda: sequential(paths, tmp)),
+                    ('process pool', lambda: pooled(paths, tmp))], repeat)
+
+
+def bench_hierarchy(counts: list[int], group_size: int, repeat: int):
+    # the exporter and the tree importer recurse once per nesting level
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * max(counts) + 1000))
+    for deep in (False, True):
+        for groups in counts:
+            net, im, fm = generate_hierarchy(groups, group_size, deep)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'generated.epnml')
+                epnml.export_net(net, im, path, fm)
+                del net, im, fm
+                report(f'hierarchy: {groups} groups of {group_size}, {"nested" if deep else "side by side"} '
+                       f'({os.path.getsize(path) // 1024} KiB)',
+                       [('epnml.import_net', lambda: epnml.import_net(path)),
+                        ('epnml.import_net_stream', lambda: epnml.import_net_stream(path)),
+                        ('  + all inner nets built', lambda: materialize(epnml.import_net_stream(path)[0]))],
+                       repeat)
+
+
+def pairwise_min_distance(coords) -> float:
+    # the scaling step of the layout generation as it was: every pair of vertices in Python
+    min_dist = GRAPHICS_WIDTH
+    for i, (x, y) in enumerate(coords):
+        for j, (x1, y1) in enumerate(coords):
+            if i != j:
+                min_dist = min(min_dist, ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5)
+    return min_dist
+
+
+def bench_layout(sizes: list[int], components: int, pairwise_limit: int, repeat: int):
+    from igraph import Graph
+    from pnv import layout
+    for size in sizes:
+        net, im, fm = generate_net(size // 2, layout=False, components=components)
+        del im, fm
+        nodes = {n: i for i, n in enumerate([*net.places, *net.transitions])}
+        coords = Graph(len(nodes), [(nodes[a.source], nodes[a.target]) for a in net.arcs]).layout('auto').coords
+        array = np.array(coords)
+        cases = [('pairwise loop', lambda: pairwise_min_distance(coords))] if len(nodes) <= pairwise_limit else []
+        cases += [('k-d tree', lambda: layout.min_distance(array))]
+        report(f'layout scaling: {len(nodes)} places/transitions', cases, repeat)
+        report(f'layout: {len(nodes)} places/transitions in {components} components, {os.cpu_count()} cores',
+               [(f'{mode}', lambda mode=mode: (layout.clear_layout(net), layout.generate_layout(net, mode)))
+                for mode in (layout.IGRAPH_GEN_MODE_AUTO, layout.IGRAPH_GEN_MODE_COMPONENTS)], 1)
+
+
+def layout_quality(coords: np.ndarray, edges) -> tuple[float, int, float]:
+    """
+    Returns
+    -------
+    variance of the edge lengths over the squared mean (0 for all equal), overlaps: pairs of vertices closer than a
+    node width (less a pixel, touching ones are fine), bounding box area per vertex in squares of two widths (1 on an
+    even grid)
+    """
+    from scipy.spatial import cKDTree
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    lengths = np.linalg.norm(coords[edges[:, 0]] - coords[edges[:, 1]], axis=1)
+    variance = float(lengths.var() / max(lengths.mean(), 1e-12) ** 2)
+    overlaps = len(cKDTree(coords).query_pairs(GRAPHICS_WIDTH - 1, output_type='ndarray'))
+    spread = float(np.prod(coords.max(axis=0) - coords.min(axis=0)) / len(coords) / (2 * GRAPHICS_WIDTH) ** 2)
+    return variance, overlaps, spread
+
+
+def bench_multilevel(sizes: list[int], igraph_limit: int):
+    from pnv import layout
+    for size in sizes:
+        net, im, fm = generate_net(size // 2, layout=False)
+        nodes, edges = layout.net_graph(net)
+        n_vertices = len(nodes)
+        del net, im, fm, nodes
+        print(f'layout quality: {n_vertices} places/transitions')
+        modes = [layout.IGRAPH_GEN_MODE_MULTILEVEL] + ([layout.IGRAPH_GEN_MODE_AUTO] if n_vertices <= igraph_limit else [])
+        for mode in modes:
+            gc.collect()
+            start = time.perf_counter()
+            coords = layout.layout_coords(n_vertices, edges, mode)
+            elapsed = time.perf_counter() - start
+            variance, overlaps, spread = layout_quality(coords, edges)
+            print(f'  {mode:<28} {elapsed:9.3f}s  edge length variance {variance:.3f}, overlaps {overlaps}, '
+                  f'area per vertex {spread:.1f}')
+
+
+def overlapping_pairs(coords: np.ndarray) -> int:
+    # pairs of node squares that overlap, touching ones are fine
+    from scipy.spatial import cKDTree
+    pairs = cKDTree(coords).query_pairs(GRAPHICS_WIDTH, p=np.inf, output_type='ndarray').reshape(-1, 2)
+    d = np.abs(coords[pairs[:, 1]] - coords[pairs[:, 0]])
+    return int((d < GRAPHICS_WIDTH - 1e-6).all(axis=1).sum())
+
+
+def bench_overlaps(sizes: list[int], densities: list[float]):
+    from pnv import layout
+    rnd = np.random.default_rng(0)
+    for size in sizes:
+        print(f'overlap removal: {size} places/transitions')
+        for density in densities:
+            # density: nodes per square of two widths
+            side = np.sqrt(size / density) * 2 * GRAPHICS_WIDTH
+            coords = rnd.uniform(0, side, (size, 2))
+            before, old = overlapping_pairs(coords), coords.copy()
+            gc.collect()
+            start = time.perf_counter()
+            left = layout.remove_overlaps(coords)
+            elapsed = time.perf_counter() - start
+            shift = np.linalg.norm(coords - old, axis=1)
+            print(f'  density {density:<19} {elapsed:9.3f}s  overlaps {before} -> {overlapping_pairs(coords)} '
+                  f'({left} closer than the gap), moved {int((shift > 0).sum())}, by {shift.mean():.1f} on average, '
+                  f'at most {shift.max():.1f}')
+
+
+def bench_render(size: int, scales: list[float], repeat: int):
+    # frames are painted into an image, the scene needs no display
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+    from PyQt5.QtWidgets import QApplication, QGraphicsScene
+    from main import APP_NAME
+    from pnv.graphics import PnvDetail
+    from pnv.render import PnvDrawer, PnvViewScaler
+    from pnv.utils import PnvConfig, PnvConfigConstants
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    PnvConfig.INSTANCE = PnvConfig(APP_NAME)
+    PnvConfig.INSTANCE.global_mode = PnvConfigConstants.GLOBAL_MODE_MUTATE
+    net, im, fm = generate_net(size // 2)
+    scene = QGraphicsScene()
+    drawer = PnvDrawer(scene, net)
+    drawer.draw_petri_net()
+    rnd = random.Random(0)
+    for p in net.places:
+        drawer.mapper[p].markings = rnd.choice([0, 0, 1, 2, 3, 4, 12])
+    # the index is built by the first query, not by the first frame measured
+    scene.items(scene.sceneRect())
+    image = QImage(1600, 1000, QImage.Format_RGB32)
+    center = scene.sceneRect().center()
+
+    def frame(source: QRectF):
+        image.fill(0xdadada)
+        painter = QPainter(image)
+        scene.render(painter, QRectF(image.rect()), source)
+        painter.end()
+
+    for scale in scales:
+        w, h = image.width() / scale, image.height() / scale
+        source = QRectF(center.x() - w / 2, center.y() - h / 2, w, h)
+        detail = PnvViewScaler.detail_at(scale)
+        cases = [('full detail', lambda: (setattr(drawer, 'detail', PnvDetail.FULL), frame(source)))]
+        if detail != PnvDetail.FULL:
+            cases.append((f'detail level {detail}', lambda: (setattr(drawer, 'detail', detail), frame(source))))
+        report(f'frame of {image.width()}x{image.height()} at zoom {scale}: '
+               f'{len(scene.items(source))} of {size} places/transitions and their arcs, labels', cases, repeat)
+    del app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Petri Net Visualizer benchmarks on generated nets')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    imp = sub.add_parser('import', help='(E)PNML import')
+    imp.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    imp.add_argument('--depth', type=int, default=0)
+    imp.add_argument('--repeat', type=int, default=3)
+
+    exp = sub.add_parser('export', help='(E)PNML export')
+    exp.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    exp.add_argument('--depth', type=int, default=0)
+    exp.add_argument('--repeat', type=int, default=3)
+
+    binary = sub.add_parser('binary', help='open from the binary cache format against (E)PNML')
+    binary.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    binary.add_argument('--depth', type=int, default=0)
+    binary.add_argument('--repeat', type=int, default=3)
+
+    pnml = sub.add_parser('pnml', help='plain PNML import of a real net tiled up, against pm4py')
+    pnml.add_argument('--source', default=os.path.join('test_graphs', 'big', 'petri_net.pnml'))
+    pnml.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    pnml.add_argument('--repeat', type=int, default=3)
+
+    multi = sub.add_parser('multi', help='opening several .pnml files one after another and in a process pool')
+    multi.add_argument('--counts', type=int, nargs='+', default=[4, 12])
+    multi.add_argument('--size', type=int, default=20_000)
+    multi.add_argument('--repeat', type=int, default=3)
+
+    hier = sub.add_parser('hierarchy', help='(E)PNML import of many groups')
+    hier.add_argument('--groups', type=int, nargs='+', default=[10, 100, 1000])
+    hier.add_argument('--group-size', type=int, default=10)
+    hier.add_argument('--repeat', type=int, default=3)
+
+    lay = sub.add_parser('layout', help='scaling of generated layouts, against the pairwise loop it replaced')
+    lay.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    lay.add_argument('--components', type=int, default=1, help='connected components of the generated nets')
+    lay.add_argument('--pairwise-limit', type=int, default=5_000, help='larger nets skip the pairwise loop')
+    lay.add_argument('--repeat', type=int, default=3)
+
+    multilevel = sub.add_parser('multilevel', help='time and quality of the multilevel layout, against igraph')
+    multilevel.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    multilevel.add_argument('--igraph-limit', type=int, default=20_000, help='larger nets skip the igraph layout')
+
+    overlaps = sub.add_parser('overlaps', help='overlap removal of randomly placed nodes')
+    overlaps.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    overlaps.add_argument('--densities', type=float, nargs='+', default=[0.1, 0.4],
+                          help='nodes per square of two widths')
+
+    render = sub.add_parser('render', help='frame times at zoom levels, in full detail and at the level of detail')
+    render.add_argument('--size', type=int, default=20_000)
+    render.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.5, 0.25, 0.1, 0.05])
+    render.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args()
+    if args.bench == 'import':
+        bench_import(args.sizes, args.depth, args.repeat)
+    elif args.bench == 'export':
+        bench_export(args.sizes, args.depth, args.repeat)
+    elif args.bench == 'binary':
+        bench_binary(args.sizes, args.depth, args.repeat)
+    elif args.bench == 'pnml':
+        bench_pnml(args.source, args.sizes, args.repeat)
+    elif args.bench == 'multi':
+        bench_multi(args.counts, args.size, args.repeat)
+    elif args.bench == 'hierarchy':
+        bench_hierarchy(args.groups, args.group_size, args.repeat)
+    elif args.bench == 'layout':
+        bench_layout(args.sizes, args.components, args.pairwise_limit, args.repeat)
+    elif args.bench == 'multilevel':
+        bench_multilevel(args.sizes, args.igraph_limit)
+    elif args.bench == 'overlaps':
+        bench_overlaps(args.sizes, args.densities)
+    elif args.bench == 'render':
+        bench_render(args.size, args.scales, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,83 +1,410 @@
+import time
+
+STARTED_AT = time.perf_counter()
+
+import copy
+import multiprocessing
 import os
 import pathlib
 import sys
+import tempfile
 import traceback
-from typing import Union, Optional
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Union, Optional, TYPE_CHECKING
 
-import pm4py
 from PyQt5.QtGui import QPixmap
-from pm4py import PetriNet, Marking
 from PyQt5 import QtCore, QtGui
 from PyQt5.QtWidgets import QApplication, QMainWindow, QMenu, QMenuBar, QFileDialog, QStackedWidget, \
     QGraphicsScene, QGraphicsView, QLabel, QTabWidget, QMessageBox, QAction, QStyle, QVBoxLayout, QWidget, QPushButton, \
-    QHBoxLayout
+    QHBoxLayout, QProgressBar
 from PyQt5.Qt import Qt
-from pnv.importer import epnml
-from pnv.render import PnvViewer, PnvDrawer
+from pnv.cache import PnvCache
+from pnv.importer import compression
+from pnv.journal import PnvJournalStore, PnvJournal, replay
 from pnv.utils import PnvMessageBoxes, PnvConfig, PnvIcons, PnvConfigConstants
 
+if TYPE_CHECKING:
+    # pm4py, igraph, numpy and the renderer take seconds to import, they are loaded with the first net,
+    # see StartupProfile.deferred_imports
+    from pm4py import PetriNet, Marking
+    from pnv.render import PnvViewer, PnvDrawer, PnvEditState
+
 CURRENT_VERSION = '1.23'
 APP_NAME = "Petri Net Visualizer"
 
 
+class StartupProfile:
+    FLAG = '--startup-profile'
+    ENABLED = False
+
+    __last = STARTED_AT
+
+    @staticmethod
+    def phase(name: str):
+        now = time.perf_counter()
+        if StartupProfile.ENABLED:
+            print(f'[startup] {name:<20} {(now - StartupProfile.__last) * 1000:8.1f} ms '
+                  f'(total {(now - STARTED_AT) * 1000:8.1f} ms)')
+        StartupProfile.__last = now
+
+    @staticmethod
+    def deferred_imports():
+        if 'pnv.render' in sys.modules:
+            return
+        start = time.perf_counter()
+        import pnv.render
+        import pnv.importer.epnml
+        import pnv.importer.pnvb
+        if StartupProfile.ENABLED:
+            print(f'[startup] {"deferred imports":<20} {(time.perf_counter() - start) * 1000:8.1f} ms '
+                  f'(on first net)')
+
+
 class GraphData:
-    def __init__(self, path: str, exact_pn: tuple[PetriNet, Marking, Marking], viewer: PnvViewer, tab_idx: int):
+    def __init__(self, path: str, exact_pn: tuple['PetriNet', 'Marking', 'Marking'], viewer: 'PnvViewer',
+                 tab_idx: int):
         self.path = path
         self.petri_net = exact_pn[0]
         self.init_marks = exact_pn[1]
         self.fin_marks = exact_pn[2]
-        self.viewer: PnvViewer = viewer
+        self.viewer: 'PnvViewer' = viewer
         self.tab_idx: int = tab_idx
 
 
+class PnvSaveJob:
+    """
+    Snapshot of a net taken on the GUI thread and the way it is written, see PnvSaveWorker.
+    """
+
+    def __init__(self, path: str, write, status: 'PnvEditState', state: 'PnvEditState'):
+        self.path = path
+        # write(output path)
+        self.write = write
+        # edit state of the viewer and the changes the snapshot holds, put back when the save fails
+        self.status = status
+        self.state = state
+        # journal of the tab and its records held by the snapshot
+        self.journal: Optional[PnvJournal] = None
+        self.offset = 0
+
+    def write_out(self):
+        compression.write_atomic(self.path, self.write)
+
+    def failed(self):
+        self.status.merge(self.state)
+
+
 class MethodsIO:
     PNML_FORMAT = '.pnml'
     EPNML_FORMAT = '.epnml'
+    PNVB_FORMAT = '.pnvb'
+
+    @staticmethod
+    def net_format(path: str) -> str:
+        # '.epnml' for both 'net.epnml' and 'net.epnml.gz', compressed files are streamed, see pnv.importer.compression
+        for suffix in compression.COMPRESSED_SUFFIXES:
+            if path.endswith(suffix):
+                path = path[:-len(suffix)]
+                break
+        return os.path.splitext(path)[1]
 
     @staticmethod
-    def import_net(path: str) -> tuple[PetriNet, Marking, Marking]:
-        if path.endswith(MethodsIO.PNML_FORMAT):
-            pn, im, fm = pm4py.read_pnml(path)
-        elif path.endswith(MethodsIO.EPNML_FORMAT):
-            pn, im, fm = epnml.import_net(path, None)
+    def name_filter(formats: list[str]) -> str:
+        return ' '.join(f'*{f}' + ''.join(f' *{f}{c}' for c in compression.COMPRESSED_SUFFIXES) for f in formats)
+
+    @staticmethod
+    def import_net(path: str, progress=None) -> tuple['PetriNet', 'Marking', 'Marking']:
+        # progress: called with the number of bytes read so far, may raise to stop reading
+        from pnv.importer import epnml, pnvb
+        fmt = MethodsIO.net_format(path)
+        if fmt == MethodsIO.PNML_FORMAT:
+            with compression.open_net_file(path, progress=progress) as F:
+                pn, im, fm = epnml.import_pnml(F)
+        elif fmt == MethodsIO.EPNML_FORMAT:
+            with compression.open_net_file(path, progress=progress) as F:
+                pn, im, fm = epnml.import_net_stream(F, None)
+        elif path.endswith(MethodsIO.PNVB_FORMAT):
+            pn, im, fm = pnvb.import_net(path)
         else:
             raise ValueError(f'Unknown file format {path}!')
         return pn, im, fm
 
     @staticmethod
-    def export_net(g: GraphData, path: str, force: bool):
-        if path.endswith(MethodsIO.PNML_FORMAT):
+    def export_net(g: GraphData, path: str, force: bool) -> Optional[PnvSaveJob]:
+        fmt = MethodsIO.net_format(path)
+        if fmt == MethodsIO.PNML_FORMAT:
             if g.viewer.is_drawn_hierarchical() and \
                     not PnvMessageBoxes.is_accepted(PnvMessageBoxes.accept(f"Данная сеть является иерархической!",
                                            f"Выбранный формат файла не поддерживает хранение иерархических сетей, "
                                            f"поэтому часть данных будет потеряна!").exec()):
-                return
-            MethodsIO.save_as_pnml(g, path, force)
-        elif path.endswith(MethodsIO.EPNML_FORMAT):
-            MethodsIO.save_as_epnml(g, path, force)
+                return None
+            return MethodsIO.save_as_pnml(g, path, force)
+        elif fmt == MethodsIO.EPNML_FORMAT:
+            return MethodsIO.save_as_epnml(g, path, force)
+        elif path.endswith(MethodsIO.PNVB_FORMAT):
+            return MethodsIO.save_as_pnvb(g, path, force)
         else:
             raise ValueError(f'Unknown file format {path}!')
 
     @staticmethod
-    def save_as_pnml(g: GraphData, file_path: str, force: bool):
+    def snapshot(g: GraphData):
+        # positions and markings of the scene go to the net, then the net is copied for writing
+        from pnv.importer import epnml
+        g.viewer.inject_all_positions()
+        init, fin = g.viewer.retrieve_markings()
+        state = copy.copy(g.viewer.drawer.status)
+        g.viewer.drawer.status.reset()
+        return epnml.snapshot_net(g.petri_net, init, fin), state
+
+    @staticmethod
+    def save_as_pnml(g: GraphData, file_path: str, force: bool) -> Optional[PnvSaveJob]:
+        from pnv.importer import epnml
         if g.viewer.drawer.status.is_changed() or force:
-            g.viewer.inject_all_positions()
-            init, fin = g.viewer.retrieve_markings()
-            g.viewer.drawer.status.reset()
-            pm4py.write_pnml(g.petri_net, init, fin, file_path)
+            (pn, im, fm), state = MethodsIO.snapshot(g)
+            return PnvSaveJob(file_path, lambda path: epnml.export_net(pn, im, path, fm, hierarchical=False),
+                              g.viewer.drawer.status, state)
+        return None
 
     @staticmethod
-    def save_as_epnml(g: GraphData, file_path: str, force: bool):
+    def save_as_epnml(g: GraphData, file_path: str, force: bool) -> Optional[PnvSaveJob]:
+        from pnv.importer import epnml
         if g.viewer.drawer.status.is_changed() or force:
-            g.viewer.inject_all_positions()
-            init, fin = g.viewer.retrieve_markings()
-            g.viewer.drawer.status.reset()
-            epnml.export_net(g.petri_net, init, file_path, fin)
+            (pn, im, fm), state = MethodsIO.snapshot(g)
+            return PnvSaveJob(file_path, lambda path: epnml.export_net(pn, im, path, fm),
+                              g.viewer.drawer.status, state)
+        return None
+
+    @staticmethod
+    def save_as_pnvb(g: GraphData, file_path: str, force: bool) -> Optional[PnvSaveJob]:
+        from pnv.importer import pnvb
+        if g.viewer.drawer.status.is_changed() or force:
+            # every level is written, inner nets not built yet are built by the saving thread
+            (pn, im, fm), state = MethodsIO.snapshot(g)
+            return PnvSaveJob(file_path, lambda path: pnvb.export_net(pn, im, path, fm),
+                              g.viewer.drawer.status, state)
+        return None
+
+
+class PnvSaveWorker(QtCore.QThread):
+    """
+    Writes a save job to a temporary file and renames it over the target, an interrupted save leaves the old file.
+    """
+
+    def __init__(self, job: PnvSaveJob, parent=None):
+        super().__init__(parent)
+        self.job = job
+        self.error: Optional[Exception] = None
+
+    def run(self):
+        try:
+            self.job.write_out()
+        except Exception as ex:
+            traceback.print_exc()
+            self.error = ex
+
+
+class PnvLoadCancelled(Exception):
+    pass
+
+
+class PnvLoadResult:
+    def __init__(self, path: str):
+        self.path = path
+        self.petri_net: Optional['PetriNet'] = None
+        self.init_marks: Optional['Marking'] = None
+        self.fin_marks: Optional['Marking'] = None
+        self.cache_key: Optional[str] = None
+        self.from_cache = False
+        self.layout_generated = False
+        # drawn with a fast initial layout, refined once shown
+        self.refine = False
+
+    def is_drawable(self) -> bool:
+        return any(len(t) != 0 for t in [self.petri_net.places, self.petri_net.transitions]) and \
+            len(self.petri_net.arcs) != 0
+
+
+def load_net_process(path: str, output: str, gen_mode: str) -> tuple[bool, bool]:
+    """
+    Loading of one file in a process of PnvLoadWorker's pool: the net is parsed, gets a layout if it has none
+    and is written to output in the binary net format, the compact form it is handed back in. Inner nets are
+    handed back as read and built on first access, as when the file is opened in the loading thread. The other
+    files take the other cores, so the layout is generated in this process only.
+
+    Returns
+    -------
+    drawable, layout generated
+    """
+    from pnv import layout
+    from pnv.importer import pnvb
+    pn, im, fm = MethodsIO.import_net(path)
+    result = PnvLoadResult(path)
+    result.petri_net = pn
+    layout_generated = False
+    if result.is_drawable() and not layout.has_full_layout(pn):
+        layout.generate_layout(pn, gen_mode, workers=1)
+        layout_generated = True
+    pnvb.export_net(pn, im, output, fm)
+    return result.is_drawable(), layout_generated
+
+
+class PnvLoadWorker(QtCore.QThread):
+    """
+    Reads net files and generates their layouts off the GUI thread. The scenes are built from the handed back
+    PnvLoadResult-s, as graphics items belong to the GUI thread. A single file is read here, several files are
+    spread over a process pool.
+    """
+    # phase, percent or -1 when unknown
+    progress = QtCore.pyqtSignal(str, int)
+    loaded = QtCore.pyqtSignal(object)
+    # path, exception
+    failed = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, paths: list[str], parent=None):
+        super(PnvLoadWorker, self).__init__(parent)
+        self.paths = paths
+        self.__cancelled = False
+        self.__reported = None
+
+    def cancel(self):
+        self.__cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelled
+
+    def report(self, phase: str, percent: int = -1):
+        if self.__cancelled:
+            raise PnvLoadCancelled()
+        if self.__reported != (phase, percent):
+            self.__reported = (phase, percent)
+            self.progress.emit(phase, percent)
+
+    def run(self):
+        try:
+            self.report('Загрузка модулей')
+            StartupProfile.deferred_imports()
+            if len(self.paths) == 1:
+                self.run_single(self.paths[0])
+            else:
+                self.run_pool()
+        except PnvLoadCancelled:
+            pass
+
+    def run_single(self, path: str):
+        try:
+            result = self.load(path)
+        except PnvLoadCancelled:
+            raise
+        except Exception as ex:
+            traceback.print_exc()
+            self.failed.emit(path, ex)
+        else:
+            self.loaded.emit(result)
+
+    @staticmethod
+    def cache_key(path: str) -> Optional[str]:
+        if PnvCache.enabled() and MethodsIO.net_format(path) in (MethodsIO.PNML_FORMAT, MethodsIO.EPNML_FORMAT):
+            return PnvCache.key_of(path)
+        return None
+
+    def load(self, path: str) -> PnvLoadResult:
+        from pnv import layout
+        from pnv.render import PnvDrawer
+        result = PnvLoadResult(path)
+        self.report('Поиск в кэше')
+        result.cache_key = PnvLoadWorker.cache_key(path)
+        if result.cache_key is not None:
+            cached = PnvCache.INSTANCE.load(result.cache_key)
+            if cached:
+                result.petri_net, result.init_marks, result.fin_marks, result.layout_generated = cached
+                result.from_cache = True
+        if result.petri_net is None:
+            size = max(os.path.getsize(path), 1)
+            self.report('Чтение файла', 0)
+            result.petri_net, result.init_marks, result.fin_marks = MethodsIO.import_net(
+                path, lambda pos: self.report('Чтение файла', min(pos * 100 // size, 100)))
+        if not result.is_drawable():
+            return result
+        pn = result.petri_net
+        if not all(PnvDrawer.has_layout(obj) for obj in [*pn.places, *pn.transitions]):
+            progressive = PnvConfig.INSTANCE.progressive_layout_nodes
+            if 0 < progressive <= len(pn.places) + len(pn.transitions):
+                self.report('Начальная разметка')
+                layout.generate_initial_layout(pn)
+                result.refine = True
+            else:
+                self.report('Генерация разметки')
+                PnvDrawer.generate_layout(pn)
+            result.layout_generated = True
+        # an initial layout is not worth caching, the refined one is kept by saving the net
+        if result.cache_key is not None and not result.from_cache and not result.refine:
+            self.report('Сохранение в кэш')
+            PnvCache.INSTANCE.store(result.cache_key, pn, result.init_marks, result.fin_marks,
+                                    result.layout_generated)
+        self.report('Построение сцены', 0)
+        return result
+
+    def run_pool(self):
+        from pnv.importer import pnvb
+        total = len(self.paths)
+        done = 0
+        # outputs of the processes, kept while nets read from them are open; mapped files may not be removable
+        self.outputs = tempfile.TemporaryDirectory(prefix='pnv_load_', ignore_cleanup_errors=True)
+        pending: dict[Future, tuple[PnvLoadResult, str]] = {}
+        # spawned, a forked Qt application is not safe
+        pool = ProcessPoolExecutor(max_workers=min(total, os.cpu_count() or 1),
+                                   mp_context=multiprocessing.get_context('spawn'))
+        try:
+            for i, path in enumerate(self.paths):
+                self.report(f'Открыто {done} из {total}', done * 100 // total)
+                result = PnvLoadResult(path)
+                try:
+                    result.cache_key = PnvLoadWorker.cache_key(path)
+                    cached = PnvCache.INSTANCE.load(result.cache_key) if result.cache_key is not None else None
+                except Exception as ex:
+                    traceback.print_exc()
+                    self.failed.emit(path, ex)
+                    done += 1
+                    continue
+                if cached:
+                    result.petri_net, result.init_marks, result.fin_marks, result.layout_generated = cached
+                    result.from_cache = True
+                    self.loaded.emit(result)
+                    done += 1
+                    continue
+                output = os.path.join(self.outputs.name, f'{i}{MethodsIO.PNVB_FORMAT}')
+                future = pool.submit(load_net_process, path, output, PnvConfig.INSTANCE.igraph_gen_mode)
+                pending[future] = (result, output)
+            while pending:
+                self.report(f'Открыто {done} из {total}', done * 100 // total)
+                # woken up regularly to notice cancellation
+                finished, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result, output = pending.pop(future)
+                    done += 1
+                    try:
+                        drawable, result.layout_generated = future.result()
+                        if drawable and result.cache_key is not None and \
+                                PnvCache.INSTANCE.adopt(result.cache_key, pathlib.Path(output), result.layout_generated):
+                            cached = PnvCache.INSTANCE.load(result.cache_key)
+                            if cached:
+                                result.petri_net, result.init_marks, result.fin_marks, _ = cached
+                        if result.petri_net is None:
+                            result.petri_net, result.init_marks, result.fin_marks = pnvb.import_net(output)
+                    except Exception as ex:
+                        traceback.print_exc()
+                        self.failed.emit(result.path, ex)
+                    else:
+                        self.loaded.emit(result)
+        finally:
+            # files already being read are finished by their processes, the rest is dropped
+            pool.shutdown(wait=not self.is_cancelled(), cancel_futures=True)
 
 
 class PnvMainWindow(QMainWindow):
     WINDOW_MIN_WIDTH = 768
     WINDOW_MIN_HEIGHT = 512
+    SAVED_MESSAGE_MS = 3000
 
     CONFIG = None
 
@@ -87,10 +414,23 @@ class PnvMainWindow(QMainWindow):
         self.menu_bar: Union[QMenuBar, None] = None
         self.save_action: Union[QAction, None] = None
         self.save_as_action: Union[QAction, None] = None
+        self.overlaps_action: Union[QAction, None] = None
         self.stacked_widget: Union[QStackedWidget, None] = None
         self.graph_view: Union[QGraphicsView, None] = None
         self.graph_scene: Union[QGraphicsScene, None] = None
         self.tabs: Union[QTabWidget, None] = None
+        self.load_progress: Union[QProgressBar, None] = None
+        self.load_cancel_btn: Union[QPushButton, None] = None
+        self.refine_stop_btn: Union[QPushButton, None] = None
+        # what is being opened: read by self.loader, then drawn on the GUI thread one result at a time
+        self.loading: Union[str, None] = None
+        self.loader: Union[PnvLoadWorker, None] = None
+        self.__loaded: list[PnvLoadResult] = []
+        self.__rendering = False
+        self.__render_cancelled = False
+        # one running save per file, edits saved meanwhile wait as a single newer snapshot
+        self.saving: dict[str, PnvSaveWorker] = {}
+        self.__pending_saves: dict[str, PnvSaveJob] = {}
         # load icons
         PnvIcons.MAIN_ICON = QtGui.QIcon('resources/pnv_icon.ico')
         PnvIcons.SETTINGS_ICON = QtGui.QIcon('resources/settings.ico')
@@ -106,6 +446,7 @@ class PnvMainWindow(QMainWindow):
         PnvIcons.UNWRAP_ICON = QtGui.QIcon('resources/unwrap_icon.ico')
         PnvIcons.EPNML_FILE_ICON = QtGui.QIcon('resources/epnml_file_icon.ico')
         PnvIcons.PNML_FILE_ICON = QtGui.QIcon('resources/pnml_file_icon.ico')
+        StartupProfile.phase('icons')
         # config
         try:
             PnvConfig.INSTANCE = PnvConfig(APP_NAME)
@@ -119,19 +460,33 @@ class PnvMainWindow(QMainWindow):
                 PnvMessageBoxes.warning(f'Ошибка загрузки конфигурации программы!',
                                         f'Часть данных конфигурационного файла содержит неверный тип данных! '
                                         f'Ошибочные значения установлены по умолчанию.').exec()
+        StartupProfile.phase('config')
+        try:
+            PnvCache.INSTANCE = PnvCache(PnvConfig.INSTANCE.file.parent)
+        except Exception:
+            traceback.print_exc()
+        try:
+            PnvJournalStore.INSTANCE = PnvJournalStore(PnvConfig.INSTANCE.file.parent)
+        except Exception:
+            traceback.print_exc()
+        StartupProfile.phase('cache')
         # init
         self.setWindowIcon(PnvIcons.MAIN_ICON)
         self.setWindowTitle(APP_NAME)
         self.setMinimumSize(PnvMainWindow.WINDOW_MIN_WIDTH, PnvMainWindow.WINDOW_MIN_HEIGHT)
         self.create_menu_bar()
+        self.create_status_bar()
         self.__global_mode_display = QLabel(f"Режим: {PnvConfig.INSTANCE.global_mode}")
         self.create_stacked_wid()
 
         self.graphs: list[GraphData] = []
 
         self.file_dialog = QFileDialog(self)
-        self.file_dialog.setFileMode(QFileDialog.FileMode.ExistingFile)
-        self.file_dialog.setNameFilter("Petri-net file (*.pnml *.epnml)")
+        self.file_dialog.setFileMode(QFileDialog.FileMode.ExistingFiles)
+        self.file_dialog.setNameFilter(f"Petri-net file "
+                                       f"({MethodsIO.name_filter([MethodsIO.PNML_FORMAT, MethodsIO.EPNML_FORMAT])} "
+                                       f"*{MethodsIO.PNVB_FORMAT})")
+        StartupProfile.phase('widgets')
 
     def create_stacked_wid(self):
         self.stacked_widget = QStackedWidget(self)
@@ -162,12 +517,30 @@ class PnvMainWindow(QMainWindow):
         self.tabs = QTabWidget(self)
         self.tabs.setTabsClosable(True)
         self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.currentChanged.connect(self.refinement_changed)
 
         welcome.setLayout(layout)
         self.stacked_widget.addWidget(welcome)
         self.stacked_widget.addWidget(self.tabs)
         self.setCentralWidget(self.stacked_widget)
 
+    def create_status_bar(self):
+        self.load_progress = QProgressBar(self)
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.hide()
+        self.load_cancel_btn = QPushButton(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogCancelButton),
+                                           'Отмена', self)
+        self.load_cancel_btn.clicked.connect(self.cancel_loading)
+        self.load_cancel_btn.hide()
+        # stops the layout refinement of the current tab
+        self.refine_stop_btn = QPushButton(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaStop),
+                                           'Остановить разметку', self)
+        self.refine_stop_btn.clicked.connect(self.stop_refinement)
+        self.refine_stop_btn.hide()
+        self.statusBar().addPermanentWidget(self.load_progress)
+        self.statusBar().addPermanentWidget(self.load_cancel_btn)
+        self.statusBar().addPermanentWidget(self.refine_stop_btn)
+
     def create_menu_bar(self):
         self.menu_bar = QMenuBar(self)
         self.setMenuBar(self.menu_bar)
@@ -186,6 +559,13 @@ class PnvMainWindow(QMainWindow):
         file_menu.addAction(self.save_action)
         file_menu.addAction(self.save_as_action)
 
+        layout_menu = QMenu("&Разметка", self)
+        layout_menu.aboutToShow.connect(self.layout_menu_update)
+        self.menu_bar.addMenu(layout_menu)
+        self.overlaps_action = QAction("&Убрать наложения", self)
+        self.overlaps_action.triggered.connect(self.remove_overlaps)
+        layout_menu.addAction(self.overlaps_action)
+
         help_menu = QMenu("&Помощь", self)
         self.menu_bar.addMenu(help_menu)
         help_menu.addAction(self.style().standardIcon(QStyle.StandardPixmap.SP_MessageBoxInformation), "&О программе",
@@ -206,6 +586,25 @@ class PnvMainWindow(QMainWindow):
         self.save_action.setEnabled(self.stacked_widget.currentWidget() is self.tabs)
         self.save_as_action.setEnabled(self.stacked_widget.currentWidget() is self.tabs)
 
+    @QtCore.pyqtSlot()
+    def layout_menu_update(self):
+        self.overlaps_action.setEnabled(self.stacked_widget.currentWidget() is self.tabs)
+
+    @QtCore.pyqtSlot()
+    def remove_overlaps(self):
+        if self.stacked_widget.currentWidget() is not self.tabs:
+            return
+        g = self.find_graph(self.tabs.currentIndex())
+        name = os.path.basename(g.path)
+        displacement = g.viewer.drawer.remove_overlaps()
+        if len(displacement) == 0:
+            self.statusBar().showMessage(f'{name}: наложений нет', PnvMainWindow.SAVED_MESSAGE_MS)
+        else:
+            # kept until the next message
+            self.statusBar().showMessage(f'{name}: наложения убраны, сдвинуто элементов: {len(displacement)}, '
+                                         f'в среднем на {displacement.mean():.0f}, '
+                                         f'самое большее на {displacement.max():.0f}')
+
     @QtCore.pyqtSlot()
     def open_dev_info(self):
         wm = QMessageBox()
@@ -232,20 +631,81 @@ class PnvMainWindow(QMainWindow):
     def close_tab(self, idx: int):
         self.on_close_tab(idx, True)
 
-    def save_graph(self, g: GraphData, path: str, notify: bool = True, force: bool = False):
+    def save_graph(self, g: GraphData, path: str, notify: bool = True, force: bool = False) -> Optional[PnvSaveJob]:
         changes = g.viewer.drawer.status.changes()
         if not g.viewer.can_be_saved():
             if notify:
                 PnvMessageBoxes.warning("Сеть-Петри не может быть сохранена!",
                                         f"Данная конфигурацию сети нельзя сохранить.").exec()
-            return
+            return None
         if notify:
             if len(changes) != 0 and not PnvMessageBoxes.is_accepted(
                     PnvMessageBoxes.accept(f"В загруженную сеть были внесены изменения!",
                                            f"Изменения: {','.join(changes)}. "
                                            f"Сохранить изменённую версию, перезаписав файл?").exec()):
-                return
-        MethodsIO.export_net(g, path, force)
+                return None
+        job = MethodsIO.export_net(g, path, force)
+        if job is not None:
+            job.journal = g.viewer.drawer.journal
+            if job.journal is not None:
+                job.offset = job.journal.checkpoint()
+            self.start_save(job)
+        return job
+
+    def start_save(self, job: PnvSaveJob):
+        if job.path in self.saving:
+            dropped = self.__pending_saves.get(job.path)
+            if dropped is not None:
+                # never written, its changes are in the newer snapshot
+                job.state.merge(dropped.state)
+            self.__pending_saves[job.path] = job
+            return
+        worker = PnvSaveWorker(job, self)
+        worker.finished.connect(lambda: self.on_save_finished(worker))
+        worker.finished.connect(worker.deleteLater)
+        self.saving[job.path] = worker
+        self.statusBar().showMessage(f'Сохранение {os.path.basename(job.path)}...')
+        worker.start()
+
+    def on_save_finished(self, worker: PnvSaveWorker):
+        path = worker.job.path
+        if self.saving.get(path) is not worker:
+            # already waited for on exit
+            return
+        del self.saving[path]
+        self.save_done(worker.job, worker.error)
+        pending = self.__pending_saves.pop(path, None)
+        if pending is not None:
+            self.start_save(pending)
+
+    def save_done(self, job: PnvSaveJob, error: Optional[Exception]):
+        name = os.path.basename(job.path)
+        if error is not None:
+            job.failed()
+            self.statusBar().clearMessage()
+            PnvMessageBoxes.warning("Возникла ошибка при сохранении файла!",
+                                    inf_text=f"{name}: {error.__class__.__name__}: {error}").exec()
+            return
+        if job.journal is not None:
+            job.journal.saved(job.path, job.offset)
+        if not self.saving and self.loading is None:
+            self.statusBar().showMessage(f'Сохранено {name}', PnvMainWindow.SAVED_MESSAGE_MS)
+
+    def finish_saves(self):
+        # on exit: running saves are waited for, the pending ones are written right away
+        for path, worker in list(self.saving.items()):
+            worker.wait()
+            del self.saving[path]
+            self.save_done(worker.job, worker.error)
+        pending, self.__pending_saves = self.__pending_saves, {}
+        for job in pending.values():
+            error = None
+            try:
+                job.write_out()
+            except Exception as ex:
+                traceback.print_exc()
+                error = ex
+            self.save_done(job, error)
 
     def on_close_tab(self, idx: int, request) -> bool:
         if request and not PnvMessageBoxes.is_accepted(
@@ -253,7 +713,13 @@ class PnvMainWindow(QMainWindow):
                                          f"Вы уверены?").exec()):
             return False
         g = self.find_graph(idx)
-        self.save_graph(g, g.path)
+        g.viewer.drawer.stop_refinement()
+        g.viewer.drawer.stop_subnet_layouts()
+        g.viewer.drawer.stop_relaxation()
+        job = self.save_graph(g, g.path)
+        if g.viewer.drawer.journal is not None:
+            # kept until the save is written
+            g.viewer.drawer.journal.close(discard=job is None)
 
         self.tabs.removeTab(idx)
         self.graphs.remove(g)
@@ -263,37 +729,159 @@ class PnvMainWindow(QMainWindow):
                 g.tab_idx = g.tab_idx - 1
         if self.tabs.count() == 0:
             self.stacked_widget.setCurrentIndex(0)
+        self.refinement_changed()
         return True
 
     def closeEvent(self, e: Optional[QtGui.QCloseEvent]):
+        if self.loading is not None:
+            self.cancel_loading()
+            if self.loader is not None:
+                self.loader.wait()
         if self.stacked_widget.currentWidget() is self.tabs:
             while self.tabs.count() != 0:
                 if not self.on_close_tab(0, False):
                     e.ignore()
                     return
+        self.finish_saves()
         if PnvConfig.INSTANCE:
             PnvConfig.INSTANCE.save()
         e.accept()
 
-    def get_existing_file_path(self):
+    @QtCore.pyqtSlot()
+    def stop_refinement(self):
+        if self.tabs.count() != 0:
+            drawer = self.find_graph(self.tabs.currentIndex()).viewer.drawer
+            # in this order, the end of a refinement starts the inner nets layouts
+            drawer.stop_refinement()
+            drawer.stop_subnet_layouts()
+
+    def refinement_changed(self, *_):
+        # on switching tabs and on the end of a refinement or of the inner nets layouts
+        current = [g for g in self.graphs if g.tab_idx == self.tabs.currentIndex()]
+        self.refine_stop_btn.setVisible(bool(current) and (current[0].viewer.drawer.is_refining() or
+                                                           current[0].viewer.drawer.is_laying_out_subnets()))
+
+    def start_subnet_layouts(self, drawer: 'PnvDrawer', name: str):
+        drawer.start_subnet_layouts()
+        drawer.subnet_layouter.progress.connect(
+            lambda level, levels, done, total: self.subnet_layouts_progress(name, level, levels, done, total))
+        drawer.subnet_layouter.finished.connect(lambda: self.subnet_layouts_finished(name))
+        self.refinement_changed()
+
+    def subnet_layouts_progress(self, name: str, level: int, levels: int, done: int, total: int):
+        # loading messages come first
+        if self.loading is None:
+            self.statusBar().showMessage(f'{name}: разметка подсетей, уровень {level} из {levels}: '
+                                         f'{done} из {total}')
+
+    def subnet_layouts_finished(self, name: str):
+        if self.loading is None:
+            self.statusBar().showMessage(f'{name}: разметка подсетей завершена', PnvMainWindow.SAVED_MESSAGE_MS)
+        self.refinement_changed()
+
+    def get_existing_file_paths(self) -> list[str]:
         if self.file_dialog.exec():
-            files = self.file_dialog.selectedFiles()
-            if files:
-                return files[0]
-            return None
+            return self.file_dialog.selectedFiles()
+        return []
 
     def get_new_file_path(self):
-        return QFileDialog.getSaveFileName(self, filter="Extended Petri-net file (*.epnml)")[0]
+        return QFileDialog.getSaveFileName(self, filter=f"Extended Petri-net file "
+                                                        f"({MethodsIO.name_filter([MethodsIO.EPNML_FORMAT])});;"
+                                                        f"Binary Petri-net file (*{MethodsIO.PNVB_FORMAT})")[0]
 
     def load_petri_net_file(self, path: str):
-        pn = im = fm = None
-        for gd in self.graphs:
-            if gd.path == path:
-                self.tabs.setCurrentIndex(gd.tab_idx)
-                return
+        self.load_petri_net_files([path])
+
+    def load_petri_net_files(self, paths: list[str]):
+        opened = {gd.path: gd for gd in self.graphs}
+        for path in paths:
+            if path in opened:
+                self.tabs.setCurrentIndex(opened[path].tab_idx)
+        paths = [path for path in paths if path not in opened]
+        if not paths:
+            return
+        if self.loading is not None:
+            PnvMessageBoxes.warning("Дождитесь окончания загрузки!",
+                                    f"Загружается {self.loading}.").exec()
+            return
+        self.loading = os.path.basename(paths[0]) if len(paths) == 1 else f'{len(paths)} файлов'
+        self.loader = PnvLoadWorker(paths, self)
+        self.loader.progress.connect(self.loading_progress)
+        self.loader.loaded.connect(self.on_net_loaded)
+        self.loader.failed.connect(self.on_load_failed)
+        self.loader.finished.connect(self.on_loader_finished)
+        self.loader.finished.connect(self.loader.deleteLater)
+        self.__render_cancelled = False
+        self.load_progress.setRange(0, 0)
+        self.load_progress.show()
+        self.load_cancel_btn.show()
+        self.statusBar().showMessage(f'Открытие {self.loading}...')
+        self.loader.start()
+
+    @QtCore.pyqtSlot(str, int)
+    def loading_progress(self, phase: str, percent: int):
+        if self.loading is None:
+            return
+        self.statusBar().showMessage(f'{self.loading}: {phase}...')
+        if percent < 0:
+            # busy indicator
+            self.load_progress.setRange(0, 0)
+        else:
+            self.load_progress.setRange(0, 100)
+            self.load_progress.setValue(percent)
+
+    @QtCore.pyqtSlot()
+    def cancel_loading(self):
+        if self.loader is not None:
+            self.loader.cancel()
+        self.__render_cancelled = True
+
+    @QtCore.pyqtSlot()
+    def on_loader_finished(self):
+        self.loader = None
+        self.loading_finished()
+
+    def loading_finished(self):
+        # the worker may finish while its last results are drawn
+        if self.loader is not None or self.__rendering:
+            return
+        self.loading = None
+        self.__loaded.clear()
+        self.load_progress.hide()
+        self.load_cancel_btn.hide()
+        self.statusBar().clearMessage()
+
+    @QtCore.pyqtSlot(str, object)
+    def on_load_failed(self, path: str, ex: Exception):
+        PnvMessageBoxes.warning("Возникла ошибка при открытии файла!",
+                                inf_text=f"{os.path.basename(path)}: {ex.__class__.__name__}: {ex}").exec()
+
+    def render_progress(self, done: int, total: int):
+        # the scene is built on the GUI thread, events are let through to keep the window and the cancel button alive
+        self.loading_progress('Построение сцены', done * 100 // total)
+        QApplication.processEvents()
+        if self.__render_cancelled:
+            raise PnvLoadCancelled()
+
+    @QtCore.pyqtSlot(object)
+    def on_net_loaded(self, result: PnvLoadResult):
+        # results coming in while a scene is built, i.e. from render_progress, wait for it
+        self.__loaded.append(result)
+        if self.__rendering:
+            return
+        self.__rendering = True
+        try:
+            while self.__loaded and not self.__render_cancelled:
+                self.show_loaded_net(self.__loaded.pop(0))
+        finally:
+            self.__rendering = False
+            self.loading_finished()
+
+    def show_loaded_net(self, result: PnvLoadResult):
+        from pnv.render import PnvViewer, PnvDrawer
+        path = result.path
+        pn, im, fm = result.petri_net, result.init_marks, result.fin_marks
         try:
-            # load
-            pn, im, fm = MethodsIO.import_net(path)
             # check
             if all(len(t) == 0 for t in [pn.places, pn.transitions]):
                 PnvMessageBoxes.warning("Загружена пустая сеть!").exec()
@@ -303,47 +891,93 @@ class PnvMainWindow(QMainWindow):
                 return
             # some graph render data:
             # https://www.graphviz.org/documentation/TSE93.pdf
-        except Exception as ex:
-            PnvMessageBoxes.warning("Возникла ошибка при открытии файла!",
-                                    inf_text=f"{ex.__class__.__name__}: {ex}").exec()
-            traceback.print_exc()
-        if pn:
+            if result.refine:
+                PnvMessageBoxes.proceed(f"Загруженная сеть не имеет предопределённую разметку!",
+                                        f"Сеть показана с начальной разметкой, которая будет уточняться в фоне. "
+                                        f"Уточнение можно остановить в строке состояния.").exec()
+            elif result.layout_generated and not result.from_cache:
+                PnvMessageBoxes.proceed(f"Загруженная сеть не имеет предопределённую разметку!",
+                                        f"Произведена генерация автоматической разметки.").exec()
+            recovered = self.recover_edits(result)
+            im, fm = result.init_marks, result.fin_marks
             name = os.path.basename(path)
             gr = QGraphicsScene(self)
             drawer = PnvDrawer(gr, pn)
             viewer = PnvViewer(drawer, gr)
-            try:
-                viewer.drawer_push_modes()
-                drawer.draw_petri_net()
-                viewer.init_markings(im, fm)
+            viewer.drawer_push_modes()
+            drawer.draw_petri_net(self.render_progress)
+            viewer.init_markings(im, fm)
+            if result.layout_generated:
+                # generated on loading or earlier, still not in the file
+                drawer.status.layout_generated = True
+            if recovered:
+                drawer.status.layout_changed = True
+                drawer.status.meta_data = True
+            drawer.journal = self.open_journal(path, recovered)
+            if result.refine:
+                drawer.start_refinement()
+                drawer.refiner.finished.connect(self.refinement_changed)
+            if PnvConfig.INSTANCE.precompute_subnet_layouts and drawer.is_hierarchical_net():
+                # inner nets are laid out around the final positions of their transitions
+                if drawer.is_refining():
+                    drawer.refiner.finished.connect(lambda: self.start_subnet_layouts(drawer, name))
+                else:
+                    self.start_subnet_layouts(drawer, name)
+        except PnvLoadCancelled:
+            return
+        except Exception as ex:
+            PnvMessageBoxes.warning("Невозможно отобразить Сеть-Петри!",
+                                    f"Извините, но данная версия PetriNetViewer {CURRENT_VERSION}. "
+                                    f"не может отобразить загруженный граф! "
+                                    f"Сообщение компонента-отрисовки {ex.__class__.__name__}: {ex}").exec()
+            traceback.print_exc()
+            return
+        fmt = MethodsIO.net_format(name)
+        icon = PnvIcons.EPNML_FILE_ICON if fmt in (MethodsIO.EPNML_FORMAT, MethodsIO.PNVB_FORMAT) else (PnvIcons.PNML_FILE_ICON if fmt == MethodsIO.PNML_FORMAT else None)
+        idx = self.tabs.addTab(viewer, icon, name)
+        gr_data = GraphData(path, (pn, im, fm), viewer, idx)
+        self.graphs.append(gr_data)
 
-            except TypeError as te:
-                if len(te.args) == 1 and te.args[0] == PnvMainWindow.RENDER_CANCELLED:
-                    return
-                raise
-            except Exception as ex:
-                PnvMessageBoxes.warning("Невозможно отобразить Сеть-Петри!",
-                                        f"Извините, но данная версия PetriNetViewer {CURRENT_VERSION}. "
-                                        f"не может отобразить загруженный граф! "
-                                        f"Сообщение компонента-отрисовки {ex.__class__.__name__}: {ex}").exec()
-                traceback.print_exc()
-                return
-            icon = PnvIcons.EPNML_FILE_ICON if name.endswith('epnml') else (PnvIcons.PNML_FILE_ICON if name.endswith('pnml') else None)
-            idx = self.tabs.addTab(viewer, icon, name)
-            gr_data = GraphData(path, (pn, im, fm), viewer, idx)
-            self.graphs.append(gr_data)
+        self.tabs.setTabToolTip(idx, path)
+        if self.stacked_widget.currentIndex() == 0:
+            # first graph to show
+            self.stacked_widget.setCurrentIndex(1)
+        self.tabs.setCurrentIndex(idx)
+        self.refinement_changed()
 
-            self.tabs.setTabToolTip(idx, path)
-            if self.stacked_widget.currentIndex() == 0:
-                # first graph to show
-                self.stacked_widget.setCurrentIndex(1)
-            self.tabs.setCurrentIndex(idx)
+    def recover_edits(self, result: PnvLoadResult) -> bool:
+        # edits of a session that ended without saving them, replayed on the net read from the file
+        if PnvJournalStore.INSTANCE is None:
+            return False
+        records = PnvJournalStore.INSTANCE.pending(result.path)
+        if not records:
+            return False
+        if not PnvMessageBoxes.is_accepted(
+                PnvMessageBoxes.question(f"Найдены несохранённые изменения {os.path.basename(result.path)}!",
+                                         f"Изменений: {len(records)}. Восстановить их?").exec()):
+            return False
+        result.init_marks, result.fin_marks, failed = replay(records, result.petri_net, result.init_marks,
+                                                             result.fin_marks)
+        if failed:
+            PnvMessageBoxes.warning("Часть изменений не удалось восстановить!",
+                                    f"Не восстановлено изменений: {failed} из {len(records)}.").exec()
+        return True
+
+    @staticmethod
+    def open_journal(path: str, keep: bool) -> Optional[PnvJournal]:
+        if PnvJournalStore.INSTANCE is None:
+            return None
+        try:
+            return PnvJournalStore.INSTANCE.open(path, keep)
+        except OSError:
+            traceback.print_exc()
+            return None
 
     @QtCore.pyqtSlot()
     def open_file(self):
-        path = self.get_existing_file_path()
-        if path:
-            self.load_petri_net_file(path)
+        paths = self.get_existing_file_paths()
+        if paths:
+            self.load_petri_net_files(paths)
 
     @QtCore.pyqtSlot()
     def save_file(self):
@@ -376,6 +1010,9 @@ class PnvMainWindow(QMainWindow):
         #                                f"Файл будет перезаписан. Продолжить?").exec()):
         #     return
         # create empty
+        StartupProfile.deferred_imports()
+        from pm4py import PetriNet
+        from pnv.render import PnvViewer, PnvDrawer
         pn, im, fm = PetriNet(), None, None
 
         # empty net
@@ -399,6 +1036,7 @@ class PnvMainWindow(QMainWindow):
             # try draw
             viewer.drawer_push_modes()
             drawer.draw_petri_net()
+            drawer.journal = self.open_journal(path, False)
 
             idx = self.tabs.addTab(viewer, name)
             gr_data = GraphData(path, (pn, im, fm), viewer, idx)
@@ -409,10 +1047,6 @@ class PnvMainWindow(QMainWindow):
                 # first graph to show
                 self.stacked_widget.setCurrentIndex(1)
             self.tabs.setCurrentIndex(idx)
-        except TypeError as te:
-            if len(te.args) == 1 and te.args[0] == PnvMainWindow.RENDER_CANCELLED:
-                return
-            raise
         except Exception as ex:
             PnvMessageBoxes.warning("Невозможно отобразить Сеть-Петри!",
                                     f"Извините, но данная версия PetriNetViewer {CURRENT_VERSION}. "
@@ -433,12 +1067,19 @@ class PnvMainWindow(QMainWindow):
 
 
 def application():
-    app = QApplication(sys.argv)
+    StartupProfile.ENABLED = StartupProfile.FLAG in sys.argv
+    argv = [arg for arg in sys.argv if arg != StartupProfile.FLAG]
+    StartupProfile.phase('imports')
+    app = QApplication(argv)
+    StartupProfile.phase('QApplication')
     main_window = PnvMainWindow()
     app.setApplicationName(APP_NAME)
     app.setApplicationVersion(f'{CURRENT_VERSION}')
 
     main_window.show()
+    StartupProfile.phase('show')
+    # first pass of the event loop, the welcome screen is on screen
+    QtCore.QTimer.singleShot(0, lambda: StartupProfile.phase('first frame'))
     sys.exit(app.exec_())
 
 
@@ -0,0 +1,16 @@
+import argparse
+import sys
+
+from pnv import batch
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m pnv', description='Petri net viewer tools without the GUI')
+    subparsers = parser.add_subparsers(required=True, metavar='command')
+    batch.add_parser(subparsers)
+    args = parser.parse_args()
+    return args.command(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
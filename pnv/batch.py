@@ -0,0 +1,221 @@
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+from pnv.importer.compression import open_net_file, write_atomic, COMPRESSED_SUFFIXES, GZIP_SUFFIX, ZSTD_SUFFIX
+
+# headless conversion of many net files, no Qt is imported: python -m pnv batch --help
+
+PNML_FORMAT = '.pnml'
+EPNML_FORMAT = '.epnml'
+PNVB_FORMAT = '.pnvb'
+INPUT_FORMATS = (PNML_FORMAT, EPNML_FORMAT, PNVB_FORMAT)
+OUTPUT_FORMATS = {'pnml': PNML_FORMAT, 'epnml': EPNML_FORMAT, 'pnvb': PNVB_FORMAT}
+COMPRESSIONS = {'gz': GZIP_SUFFIX, 'zst': ZSTD_SUFFIX}
+
+LAYOUT_NONE = 'none'
+LAYOUT_MISSING = 'missing'
+LAYOUT_ALL = 'all'
+# layout algorithms of --mode: the modes of pnv.layout and igraph's own 2D layouts
+GEN_MODES = ('auto', 'components', 'multilevel', 'fr', 'kk', 'drl', 'lgl', 'graphopt', 'mds', 'dh', 'sugiyama',
+             'rt', 'star', 'circle', 'grid', 'random')
+
+STATUS_CONVERTED = 'converted'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+
+
+def split_format(path: str) -> tuple[str, str]:
+    # 'net.epnml.gz' -> ('net', '.epnml'), see MethodsIO.net_format
+    for suffix in COMPRESSED_SUFFIXES:
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+            break
+    return os.path.splitext(path)
+
+
+def read_net(path: str):
+    from pnv.importer import epnml, pnvb
+    fmt = split_format(path)[1]
+    if fmt == PNML_FORMAT:
+        with open_net_file(path) as F:
+            return epnml.import_pnml(F)
+    elif fmt == EPNML_FORMAT:
+        with open_net_file(path) as F:
+            return epnml.import_net_stream(F)
+    elif fmt == PNVB_FORMAT:
+        return pnvb.import_net(path)
+    raise ValueError(f'Unknown file format {path}!')
+
+
+def write_net(net, im, fm, path: str):
+    # an interrupted run leaves no half written outputs
+    from pnv.importer import epnml, pnvb
+    fmt = split_format(path)[1]
+    if fmt == PNML_FORMAT:
+        write_atomic(path, lambda tmp: epnml.export_net(net, im, tmp, fm, hierarchical=False))
+    elif fmt == EPNML_FORMAT:
+        write_atomic(path, lambda tmp: epnml.export_net(net, im, tmp, fm))
+    elif fmt == PNVB_FORMAT:
+        write_atomic(path, lambda tmp: pnvb.export_net(net, im, tmp, fm))
+    else:
+        raise ValueError(f'Unknown file format {path}!')
+
+
+def collect(inputs: list[str]) -> list[tuple[str, str]]:
+    """
+    Net files of directories (searched recursively) and glob patterns.
+
+    Returns
+    -------
+    (path, root) pairs: outputs keep the path of a file relative to its root
+    """
+    found = {}
+    for spec in inputs:
+        if os.path.isdir(spec):
+            root = spec
+            paths = glob.glob(os.path.join(glob.escape(spec), '**', '*'), recursive=True)
+        else:
+            root = None
+            paths = glob.glob(spec, recursive=True)
+        for path in paths:
+            if not os.path.isfile(path) or split_format(path)[1] not in INPUT_FORMATS:
+                continue
+            found.setdefault(os.path.normpath(path), root if root is not None else os.path.dirname(path))
+    return sorted(found.items())
+
+
+def output_of(path: str, root: str, out_dir: Optional[str], fmt: str, compress: Optional[str]) -> str:
+    stem = split_format(path)[0]
+    if out_dir is not None:
+        stem = os.path.join(out_dir, os.path.relpath(stem, root))
+    suffix = OUTPUT_FORMATS[fmt]
+    if compress is not None and suffix != PNVB_FORMAT:
+        suffix += COMPRESSIONS[compress]
+    return stem + suffix
+
+
+def is_up_to_date(path: str, output: str) -> bool:
+    try:
+        return os.path.getmtime(output) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def convert(path: str, output: str, layout_mode: str, gen_mode: str, layout_workers: Optional[int] = None) -> dict:
+    """
+    One file: import, layout, export. Runs in a worker process of run, failures are reported in the result.
+    layout_workers: processes of the components layout mode, see pnv.layout.generate_layout
+    """
+    from pnv import layout
+    report = {'input': path, 'output': output, 'input_bytes': os.path.getsize(path)}
+    start = time.perf_counter()
+    try:
+        net, im, fm = read_net(path)
+        report['import_s'] = time.perf_counter() - start
+        report['places'] = len(net.places)
+        report['transitions'] = len(net.transitions)
+        report['arcs'] = len(net.arcs)
+        mark = time.perf_counter()
+        generate = layout_mode == LAYOUT_ALL or (layout_mode == LAYOUT_MISSING and not layout.has_full_layout(net))
+        if generate and len(net.places) + len(net.transitions) > 0:
+            layout.clear_layout(net)
+            layout.generate_layout(net, gen_mode, layout_workers)
+            report['layout_generated'] = True
+        else:
+            report['layout_generated'] = False
+        report['layout_s'] = time.perf_counter() - mark
+        mark = time.perf_counter()
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        write_net(net, im, fm, output)
+        report['export_s'] = time.perf_counter() - mark
+        report['output_bytes'] = os.path.getsize(output)
+        report['status'] = STATUS_CONVERTED
+    except Exception as ex:
+        traceback.print_exc()
+        report['status'] = STATUS_FAILED
+        report['error'] = f'{ex.__class__.__name__}: {ex}'
+    report['total_s'] = time.perf_counter() - start
+    return report
+
+
+def run(jobs: list[tuple[str, str]], layout_mode: str, gen_mode: str, workers: int, progress=None) -> list[dict]:
+    # jobs: (input, output) pairs, progress(report) is called as every file is done
+    reports = []
+
+    def done(report: dict):
+        reports.append(report)
+        if progress is not None:
+            progress(report)
+
+    if workers <= 1 or len(jobs) <= 1:
+        for path, output in jobs:
+            done(convert(path, output, layout_mode, gen_mode))
+        return reports
+    # spawned like the loading pool of the application, forked children would share the parent's state
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(min(workers, len(jobs)), mp_context=context) as pool:
+        futures = [pool.submit(convert, path, output, layout_mode, gen_mode, 1) for path, output in jobs]
+        for future in as_completed(futures):
+            done(future.result())
+    return reports
+
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser('batch', help='convert and lay out net files without the GUI',
+                                   description='Converts net files, optionally generating their layouts, '
+                                               'in a process pool. Outputs newer than their inputs are skipped.')
+    parser.add_argument('inputs', nargs='+', help='directories (searched recursively) or glob patterns')
+    parser.add_argument('--to', choices=list(OUTPUT_FORMATS), default='epnml', help='output format')
+    parser.add_argument('--compress', choices=list(COMPRESSIONS), default=None,
+                        help='compress .pnml/.epnml outputs')
+    parser.add_argument('--out', default=None, help='output directory, by default next to the inputs')
+    parser.add_argument('--layout', choices=[LAYOUT_NONE, LAYOUT_MISSING, LAYOUT_ALL], default=LAYOUT_MISSING,
+                        help='generate layouts of nets missing one, of all nets or of none')
+    parser.add_argument('--mode', choices=GEN_MODES, default='auto', help='layout algorithm of generated layouts')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--force', action='store_true', help='convert even up to date outputs')
+    parser.add_argument('--report', default=None, help='JSON report of every file')
+    parser.set_defaults(command=main)
+
+
+def main(args) -> int:
+    start = time.perf_counter()
+    reports = []
+    jobs = []
+    for path, root in collect(args.inputs):
+        output = output_of(path, root, args.out, args.to, args.compress)
+        if os.path.abspath(output) == os.path.abspath(path):
+            reports.append({'input': path, 'output': output, 'status': STATUS_SKIPPED,
+                            'error': 'output is the input'})
+        elif not args.force and is_up_to_date(path, output):
+            reports.append({'input': path, 'output': output, 'status': STATUS_SKIPPED})
+        else:
+            jobs.append((path, output))
+    total = len(jobs)
+    print(f'{len(reports) + total} files, {len(reports)} skipped, {total} to convert with {args.workers} workers',
+          file=sys.stderr)
+
+    skipped = len(reports)
+
+    def progress(report: dict):
+        reports.append(report)
+        line = f'[{len(reports) - skipped}/{total}] {report["status"]:<9} {report["total_s"]:8.3f}s {report["input"]}'
+        if 'error' in report:
+            line += f' ({report["error"]})'
+        print(line, file=sys.stderr)
+
+    run(jobs, args.layout, args.mode, args.workers, progress)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in reports if r['status'] == STATUS_FAILED)
+    print(f'Done in {elapsed:.3f}s, {failed} failed', file=sys.stderr)
+    if args.report is not None:
+        with open(args.report, 'w') as F:
+            json.dump({'total_s': elapsed, 'files': reports}, F, indent=1)
+    return 1 if failed else 0
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+import traceback
+from pathlib import Path
+from typing import Union, TYPE_CHECKING
+
+from pnv.utils import PnvConfig
+
+if TYPE_CHECKING:
+    from pm4py import PetriNet, Marking
+
+# pm4py and numpy come with the binary net format, imported on first load or store only
+CachedNet = tuple['PetriNet', 'Marking', Union['Marking', None], bool]
+
+
+class PnvCache:
+    """
+    Parsed nets and generated layouts of opened files, stored in the binary net format and keyed by the
+    content hash of the file. Inner nets not built yet are stored as read and stay deferred when loaded back.
+    Least recently used entries are evicted once the capacity is exceeded.
+    """
+    FOLDER = 'cache'
+    VERSION = 1
+    ENTRY_FORMAT = '.pnvb'
+    META_FORMAT = '.json'
+    HASH_CHUNK = 1 << 20
+
+    INSTANCE: 'PnvCache' = None
+
+    def __init__(self, folder: Path):
+        self.folder = folder / PnvCache.FOLDER
+        if not self.folder.exists():
+            self.folder.mkdir()
+
+    @staticmethod
+    def capacity() -> int:
+        return max(PnvConfig.INSTANCE.cache_capacity_mb, 0) * (1 << 20)
+
+    @staticmethod
+    def enabled() -> bool:
+        return PnvCache.INSTANCE is not None and PnvCache.capacity() > 0
+
+    @staticmethod
+    def key_of(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, 'rb') as F:
+            while chunk := F.read(PnvCache.HASH_CHUNK):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def __entry(self, key: str) -> Path:
+        return self.folder / (key + PnvCache.ENTRY_FORMAT)
+
+    def __meta(self, key: str) -> Path:
+        return self.folder / (key + PnvCache.META_FORMAT)
+
+    def __expected_meta(self, key: str, layout_generated: bool) -> dict:
+        from pnv.importer import pnvb
+        return {
+            'version': PnvCache.VERSION,
+            'pnvb_version': pnvb.VERSION,
+            'key': key,
+            # a generated layout depends on the generation mode
+            'igraph_gen_mode': PnvConfig.INSTANCE.igraph_gen_mode if layout_generated else None,
+            'layout_generated': layout_generated,
+        }
+
+    def load(self, key: str) -> Union[CachedNet, None]:
+        entry, meta = self.__entry(key), self.__meta(key)
+        if not (entry.exists() and meta.exists()):
+            return None
+        try:
+            with open(meta, 'r') as F:
+                j = json.load(F)
+            if j != self.__expected_meta(key, j.get('layout_generated') is True):
+                # stale, written by another version or with other layout settings
+                self.drop(key)
+                return None
+            from pnv.importer import pnvb
+            pn, im, fm = pnvb.import_net(entry)
+        except Exception:
+            traceback.print_exc()
+            self.drop(key)
+            return None
+        # recently used
+        os.utime(meta)
+        return pn, im, fm, j['layout_generated']
+
+    def store(self, key: str, petri_net: 'PetriNet', init_marks: 'Marking', fin_marks: Union['Marking', None],
+              layout_generated: bool):
+        from pnv.importer import pnvb
+        entry, meta = self.__entry(key), self.__meta(key)
+        tmp = entry.with_suffix('.tmp')
+        try:
+            pnvb.export_net(petri_net, init_marks, tmp, fin_marks)
+            os.replace(tmp, entry)
+            with open(meta, 'w') as F:
+                json.dump(self.__expected_meta(key, layout_generated), F)
+        except Exception:
+            # a net that can not be cached is still opened, the entry may also be mapped by an opened net
+            traceback.print_exc()
+            self.drop(key)
+            return
+        self.evict()
+
+    def adopt(self, key: str, binary: Path, layout_generated: bool) -> bool:
+        # a binary net written elsewhere, e.g. by a loading process, is moved in as the entry
+        entry, meta = self.__entry(key), self.__meta(key)
+        try:
+            shutil.move(binary, entry)
+            with open(meta, 'w') as F:
+                json.dump(self.__expected_meta(key, layout_generated), F)
+        except Exception:
+            traceback.print_exc()
+            self.drop(key)
+            return False
+        self.evict()
+        return True
+
+    def drop(self, key: str) -> bool:
+        # the meta goes last, an entry that could not be removed is still found by evict
+        entry = self.__entry(key)
+        try:
+            for path in (entry.with_suffix('.tmp'), entry, self.__meta(key)):
+                path.unlink(missing_ok=True)
+        except OSError:
+            return False
+        return True
+
+    def evict(self):
+        from pnv.importer import pnvb
+        entries = []
+        total = 0
+        for meta in self.folder.glob('*' + PnvCache.META_FORMAT):
+            key = meta.stem
+            try:
+                size = self.__entry(key).stat().st_size + meta.stat().st_size
+                used = meta.stat().st_mtime
+            except OSError:
+                self.drop(key)
+                continue
+            total += size
+            # entries mapped by opened nets stay, they count until they are closed
+            if not pnvb.is_mapped(self.__entry(key)):
+                entries.append((used, size, key))
+        entries.sort()
+        capacity = PnvCache.capacity()
+        for used, size, key in entries:
+            if total <= capacity:
+                break
+            if self.drop(key):
+                total -= size
@@ -15,6 +15,32 @@ from pnv.interactive.hierarchy import Hierarchical, HierNode
 from pnv.utils import PnvMessageBoxes, PnvConfig, PnvConfigConstants, PnvIcons
 
 
+class PnvDetail:
+    # levels of detail, from the closest zoom: each one also leaves out what the ones before it do,
+    # see PnvViewScaler.sync_detail
+    FULL = 0
+    # no labels, tokens or arrowheads
+    PLAIN = 1
+    # nodes are filled rectangles
+    FLAT = 2
+    # arcs are lines a pixel wide
+    LINES = 3
+
+    @staticmethod
+    def of(item: Union['PnvQGPlaceItem', 'PnvQGTransitionItem', None]) -> int:
+        # level of the drawer of the item, items not drawn by one are drawn in full
+        drawer = getattr(item, 'drawer', None)
+        return PnvDetail.FULL if drawer is None else drawer.detail
+
+
+class PnvQGLabelItem(QGraphicsTextItem):
+    def paint(self, painter: Optional[QtGui.QPainter], option: Optional['QStyleOptionGraphicsItem'],
+              widget: Optional['QWidget'] = ...) -> None:
+        if PnvDetail.of(self.parentItem()) >= PnvDetail.PLAIN:
+            return
+        super().paint(painter, option, widget)
+
+
 class Labeling:
     def __init__(self):
         self.__text_obj: Union[QGraphicsTextItem, None] = None
@@ -86,9 +112,11 @@ class Labeling:
             self.enable_bg_overlap()
 
     def __add_label(self, label: str, offset: tuple[float, float]):
-        text = self._instance().scene().addText(label, QtGui.QFont(PnvConfig.INSTANCE.text_font_family,
-                                                                   PnvConfig.INSTANCE.text_font_size,
-                                                                   PnvConfig.INSTANCE.text_font_weight))
+        text = PnvQGLabelItem(label)
+        text.setFont(QtGui.QFont(PnvConfig.INSTANCE.text_font_family,
+                                 PnvConfig.INSTANCE.text_font_size,
+                                 PnvConfig.INSTANCE.text_font_weight))
+        self._instance().scene().addItem(text)
         self.__text = label
 
         w = QtGui.QFontMetrics(text.font()).width(label)
@@ -334,10 +362,15 @@ class PnvQGPlaceItem(QGraphicsEllipseItem, PnvInteractive, PetriNetBind, Hierarc
 
     def paint(self, painter: Optional[QtGui.QPainter], option: Optional['QStyleOptionGraphicsItem'],
               widget: Optional['QWidget'] = ...) -> None:
+        detail = PnvDetail.of(self)
+        if detail >= PnvDetail.FLAT:
+            painter.fillRect(self.rect(), self.brush())
+            return
         painter.setPen(self.pen())
         painter.setBrush(self.brush())
         painter.drawEllipse(self.rect())
-        self.draw_marked(painter)
+        if detail < PnvDetail.PLAIN:
+            self.draw_marked(painter)
 
     def _ctxt_update_tokens(self):
         tokens, done = QtWidgets.QInputDialog.getInt(
@@ -350,12 +383,14 @@ class PnvQGPlaceItem(QGraphicsEllipseItem, PnvInteractive, PetriNetBind, Hierarc
             self.markings = tokens
 
             self.drawer.status.meta_data = True
+            self.drawer.record('tokens', name=self.petri_net_bound().name, count=self.markings)
 
     def _ctxt_update_fin(self, fin: bool):
         self.final = fin
         self.update()
 
         self.drawer.status.meta_data = True
+        self.drawer.record('final', name=self.petri_net_bound().name, final=fin)
 
     def contextMenuEvent(self, event: Optional[QGraphicsSceneContextMenuEvent]) -> None:
         if not self.is_interactive():
@@ -452,6 +487,9 @@ class PnvQGTransitionItem(QGraphicsRectItem, PnvInteractive, PetriNetBind, Hiera
 
     def paint(self, painter: Optional[QtGui.QPainter], option: Optional['QStyleOptionGraphicsItem'],
               widget: Optional['QWidget'] = ...) -> None:
+        if PnvDetail.of(self) >= PnvDetail.FLAT:
+            painter.fillRect(self.rect(), self.brush())
+            return
         painter.setPen(self.pen())
         painter.setBrush(self.brush())
         painter.drawRect(self.rect())
@@ -557,6 +595,9 @@ class PnvQGTransitionItem(QGraphicsRectItem, PnvInteractive, PetriNetBind, Hiera
 
 
 class PnvQGArrowItem(QGraphicsLineItem):
+    # cosmetic, a pixel wide at any zoom
+    LINE_PEN = QtGui.QPen(QtGui.QColor(0x000000), 0)
+
     def __init__(self, from_, to):
         self.from_: Union[PnvQGPlaceItem, PnvQGTransitionItem] = from_
         self.to: Union[PnvQGPlaceItem, PnvQGTransitionItem] = to
@@ -626,6 +667,15 @@ class PnvQGArrowItem(QGraphicsLineItem):
               option: Optional['QStyleOptionGraphicsItem'],
               widget: Optional[QWidget] = ...) -> None:
         ln = self.line()
+        detail = PnvDetail.of(self.from_)
+        if detail >= PnvDetail.LINES:
+            painter.setPen(PnvQGArrowItem.LINE_PEN)
+            painter.drawLine(ln)
+            return
+        if detail >= PnvDetail.PLAIN:
+            painter.setPen(self.pen())
+            painter.drawLine(ln)
+            return
         vec = np.array([ln.x1() - ln.x2(), ln.y1() - ln.y2()])
         vec = vec / np.linalg.norm(vec) * 10 # MIGHT RETURN ZERO ERROR
         rot1 = self.rotated(vec, 30)
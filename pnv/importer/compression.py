@@ -0,0 +1,93 @@
+import gzip
+import os
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_SUFFIX = '.gz'
+ZSTD_SUFFIX = '.zst'
+# compressed variants that can be read and written here
+COMPRESSED_SUFFIXES = (GZIP_SUFFIX, ZSTD_SUFFIX) if zstandard is not None else (GZIP_SUFFIX,)
+
+
+class _ProgressReader:
+    # reports the position in the file after every read, the callback may raise to stop reading
+    def __init__(self, raw, callback):
+        self.raw = raw
+        self.callback = callback
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.callback(self.raw.tell())
+        return data
+
+    def readinto(self, b):
+        n = self.raw.readinto(b)
+        self.callback(self.raw.tell())
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+@contextmanager
+def open_net_file(path, mode='rb', progress=None):
+    """
+    Opens a net file as a binary stream, .gz and .zst files are (de)compressed on the fly.
+
+    Parameters
+    ----------
+    path: path of the file
+    mode: 'rb' or 'wb'
+    progress: called with the number of bytes of the file read so far (optional, reading only)
+
+    Returns
+    -------
+    binary file object, closed on exit
+    """
+    path = os.fspath(path)
+    if path.endswith(ZSTD_SUFFIX) and zstandard is None:
+        raise ImportError(f'Reading and writing {ZSTD_SUFFIX} files requires the zstandard package!')
+    with open(path, mode) as F:
+        if progress is not None and 'r' in mode:
+            # bytes as stored, compressed files report their compressed position
+            F = _ProgressReader(F, progress)
+        if path.endswith(GZIP_SUFFIX):
+            # no file name and time in the header, the same net always gives the same file
+            with gzip.GzipFile(filename='', mode=mode, fileobj=F, mtime=0) as Z:
+                yield Z
+        elif path.endswith(ZSTD_SUFFIX):
+            if 'r' in mode:
+                stream = zstandard.ZstdDecompressor().stream_reader(F, closefd=False)
+            else:
+                stream = zstandard.ZstdCompressor().stream_writer(F, closefd=False)
+            with stream as Z:
+                yield Z
+        else:
+            yield F
+
+
+def write_atomic(path: str, write):
+    """
+    Writes a file through a temporary one renamed over it, a failed or interrupted write leaves the file as it was.
+
+    Parameters
+    ----------
+    path: path of the file
+    write: called with the path to write to, in the same directory for an atomic rename, its name still ends
+        with the format and compression suffixes of path
+    """
+    head, tail = os.path.split(os.fspath(path))
+    tmp = os.path.join(head, '.~' + tail)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
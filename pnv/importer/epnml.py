@@ -1,4 +1,11 @@
+import copy
+import gc
+import os
 import time
+import uuid
+from contextlib import contextmanager
+from typing import Union
+
 from lxml import etree, objectify
 from pm4py.objects.petri_net.saw_net.obj import StochasticArcWeightNet
 
@@ -8,6 +15,8 @@ from pm4py.objects.petri_net.obj import PetriNet, Marking, ResetNet, InhibitorNe
 from pm4py.objects.petri_net.utils.petri_utils import add_arc_from_to
 from pm4py.objects.petri_net.importer.variants.pnml import Parameters
 
+from pnv.importer.compression import open_net_file, COMPRESSED_SUFFIXES, GZIP_SUFFIX, ZSTD_SUFFIX
+
 
 class EPNMLException(Exception):
     def __init__(self, *args):
@@ -64,24 +73,380 @@ class ExtendedTransition(PetriNet.Transition):
         self.__inner_net: PetriNet = None
         self.__init_marks: Marking = None
         self.__final_marks: Marking = None
+        # source of the inner net that is not built yet
+        self.__deferred = None
+
+    def __materialize(self):
+        deferred, self.__deferred = self.__deferred, None
+        self.inject_net(*deferred.build())
 
     def __get_inner_net(self):
+        if self.__deferred is not None:
+            self.__materialize()
         return self.__inner_net
 
     def __get_init_marks(self):
+        if self.__deferred is not None:
+            self.__materialize()
         return self.__init_marks
 
     def __get_final_marks(self):
+        if self.__deferred is not None:
+            self.__materialize()
         return self.__final_marks
 
+    def __get_deferred(self):
+        return self.__deferred
+
     def inject_net(self, inner_net=None, init_marks=None, final_marks=None):
+        self.__deferred = None
         self.__inner_net = inner_net
         self.__init_marks = init_marks
         self.__final_marks = final_marks
 
+    def defer_net(self, source):
+        # source.build() -> (inner net, initial marking, final marking), called on first access,
+        # source.has_content() -> whether the net can be written back as read while not built, without reading it,
+        # source.content() -> XML elements to write back, read anew on every call,
+        # source.serialized() -> the same as bytes (only when has_content())
+        self.inject_net()
+        self.__deferred = source
+
+    def is_materialized(self):
+        return self.__deferred is None
+
     inner_net = property(__get_inner_net)
     init_marking = property(__get_init_marks)
     final_marking = property(__get_final_marks)
+    deferred_net = property(__get_deferred)
+
+
+@contextmanager
+def _gc_paused():
+    # building a big net allocates millions of long-lived objects and no cyclic garbage,
+    # generational collections would only rescan them over and over
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class _LocalTags(dict):
+    # '{namespace}place' -> 'place', resolved once per distinct tag
+    def __missing__(self, tag):
+        # comments and processing instructions have no str tag
+        local = self[tag] = tag.rpartition('}')[2] if isinstance(tag, str) else ''
+        return local
+
+
+_local_tag = _LocalTags().__getitem__
+
+
+def _read_layout(graphics):
+    position = None
+    dimension = None
+    for child in graphics:
+        tag = _local_tag(child.tag)
+        if tag == 'position':
+            position = (float(child.get("x")), float(child.get("y")))
+        elif tag == 'dimension':
+            dimension = (float(child.get("x")), float(child.get("y")))
+    if position is not None and dimension is not None:
+        return position, dimension
+    return None
+
+
+def _read_place(el):
+    place_id = el.get("id")
+    place_name = place_id
+    number = 0
+    layout = None
+    for child in el:
+        tag = _local_tag(child.tag)
+        if tag == 'name':
+            for child2 in child:
+                if child2.text:
+                    place_name = child2.text
+        elif tag == 'initialMarking':
+            for child2 in child:
+                if _local_tag(child2.tag) == 'text':
+                    number = int(child2.text)
+        elif tag == 'graphics':
+            layout = _read_layout(child)
+    return place_id, place_name, number, layout
+
+
+def _read_transition(el):
+    trans_id = el.get("id")
+    trans_name = trans_id
+    trans_visible = True
+    trans_properties = {}
+    layout = None
+    trans_guard = el.get("guard")
+    if trans_guard is not None:
+        trans_properties[petri_properties.TRANS_GUARD] = trans_guard
+    for child in el:
+        tag = _local_tag(child.tag)
+        if tag == 'name':
+            for child2 in child:
+                if child2.text and trans_name == trans_id:
+                    trans_name = child2.text
+        elif tag == 'graphics':
+            layout = _read_layout(child)
+        elif tag == 'toolspecific':
+            if "ProM" in child.get("tool") and "invisible" in child.get("activity"):
+                trans_visible = False
+        elif tag == petri_properties.WRITE_VARIABLE or tag == petri_properties.READ_VARIABLE:
+            # property for data Petri nets
+            trans_properties.setdefault(tag, []).append(child.text)
+    return trans_id, trans_name, trans_visible, trans_properties, layout
+
+
+def _read_arc(el):
+    if len(el) == 0:
+        # weight 1 arcs are usually written without content
+        return el.get("source"), el.get("target"), 1, None
+    arc_weight = 1
+    arc_type = None
+    for child in el:
+        tag = _local_tag(child.tag)
+        if tag == 'inscription':
+            for child2 in child:
+                if _local_tag(child2.tag) == 'text':
+                    arc_weight = int(child2.text)
+        elif tag == petri_properties.ARCTYPE:
+            for child2 in child:
+                if _local_tag(child2.tag) == 'text':
+                    arc_type = child2.text
+    return el.get("source"), el.get("target"), arc_weight, arc_type
+
+
+def _add_arc(fr, to, net: PetriNet, weight: int, arc_type: str):
+    if arc_type is not None:
+        return add_arc_from_to(fr, to, net, weight=weight, type=arc_type)
+    # plain arcs are the bulk of big nets, skip the type dispatch
+    a = PetriNet.Arc(fr, to, weight)
+    net.arcs.add(a)
+    fr.out_arcs.add(a)
+    to.in_arcs.add(a)
+    return a
+
+
+class _SymbolTable:
+    """
+    Place ids of all levels of one import, shared by them: id -> {scope: place}. Levels built later, as inner nets
+    on first access, enter their places into the same table, so nothing is copied between levels.
+    """
+
+    def __init__(self):
+        self.__places: dict[str, dict['_Scope', PetriNet.Place]] = {}
+
+    def define(self, place_id: str, place: PetriNet.Place, scope: '_Scope'):
+        defined = self.__places.get(place_id)
+        if defined is None:
+            self.__places[place_id] = {scope: place}
+        else:
+            defined[scope] = place
+
+    def lookup(self, place_id: str, scope: '_Scope') -> tuple[Union[PetriNet.Place, None], bool]:
+        # the outermost definition among the enclosing scopes wins
+        defined = self.__places.get(place_id)
+        if defined is None:
+            return None, False
+        if len(defined) == 1:
+            # a single dict access for own places, outer ones check the scope is an enclosing one
+            (owner, place), = defined.items()
+            if owner is scope:
+                return place, True
+            return (place, False) if scope.within(owner) else (None, False)
+        found, local = None, False
+        level = scope
+        while level is not None:
+            place = defined.get(level)
+            if place is not None:
+                found, local = place, level is scope
+            level = level.parent
+        return found, local
+
+
+class _Scope:
+    """
+    Places of one hierarchy level as seen by the levels nested in it, see _SymbolTable.
+    """
+
+    def __init__(self, parent: '_Scope' = None):
+        self.parent = parent
+        self.symbols = parent.symbols if parent is not None else _SymbolTable()
+
+    def within(self, scope: '_Scope') -> bool:
+        level = self.parent
+        while level is not None:
+            if level is scope:
+                return True
+            level = level.parent
+        return False
+
+    def define(self, place_id: str, place: PetriNet.Place):
+        self.symbols.define(place_id, place, self)
+
+    def lookup_place(self, place_id: str) -> tuple[Union[PetriNet.Place, None], bool]:
+        return self.symbols.lookup(place_id, self)
+
+
+class _NetLevel(_Scope):
+    """
+    One hierarchy level of a net being imported: the net itself and its own places/transitions.
+    Places of the enclosing levels are visible through the symbol table shared with them.
+    """
+
+    def __init__(self, parent: _Scope = None):
+        super().__init__(parent)
+        self.net = PetriNet('imported_' + str(time.time()))
+        self.marking = Marking()
+        self.fmarking = None
+        self.places: dict[str, PetriNet.Place] = {}
+        self.transitions: dict[str, PetriNet.Transition] = {}
+        # arcs with not yet known endpoints: (source, target, weight, type)
+        self.pending: list[tuple[str, str, int, str]] = []
+
+    def add_place(self, el):
+        place_id, place_name, number, layout = _read_place(el)
+        place = PetriNet.Place(place_id)
+        place.properties[constants.PLACE_NAME_TAG] = place_name
+        if layout is not None:
+            place.properties[constants.LAYOUT_INFORMATION_PETRI] = layout
+        self.places[place_id] = place
+        self.define(place_id, place)
+        self.net.places.add(place)
+        if number > 0:
+            self.marking[place] = number
+
+    def add_transition(self, el, subnet: Union[etree._Element, bytes] = None):
+        # subnet: element of an extended transition with its inner net, as is or serialized
+        trans_id, trans_name, trans_visible, trans_properties, layout = _read_transition(el)
+        if subnet is not None:
+            trans = ExtendedTransition(trans_id, trans_name)
+            trans.defer_net(_DeferredNet(subnet, self))
+        else:
+            trans = PetriNet.Transition(trans_id, trans_name if trans_visible else None)
+        trans.properties[constants.TRANS_NAME_TAG] = trans_name
+        trans.properties.update(trans_properties)
+        if layout is not None:
+            trans.properties[constants.LAYOUT_INFORMATION_PETRI] = layout
+        self.transitions[trans_id] = trans
+        self.net.transitions.add(trans)
+
+    def add_arc(self, el):
+        arc = _read_arc(el)
+        if not self.attach(*arc):
+            self.pending.append(arc)
+
+    def add_final_marking(self, el):
+        self.fmarking = Marking()
+        for marking in el:
+            for place_el in marking:
+                place_id = place_el.get("idref")
+                for child in place_el:
+                    if _local_tag(child.tag) == 'text':
+                        number = int(child.text)
+                        if number > 0:
+                            place, _ = self.lookup_place(place_id)
+                            if place is None:
+                                raise EPNMLException(f'Final marking of unknown place {place_id}!')
+                            self.fmarking[place] = number
+
+    def add_variables(self, el):
+        self.net.properties[petri_properties.VARIABLES] = []
+        for child in el:
+            variable_name = ""
+            for child2 in child:
+                if _local_tag(child2.tag) == 'name':
+                    variable_name = child2.text
+            self.net.properties[petri_properties.VARIABLES].append({"type": child.get("type"), "name": variable_name})
+
+    def __upgrade(self, net_type):
+        net = self.net
+        self.net = net_type(name=net.name, places=net.places, transitions=net.transitions, arcs=net.arcs,
+                            properties=net.properties)
+
+    def attach(self, arc_source: str, arc_target: str, arc_weight: int, arc_type: str) -> bool:
+        if arc_target in self.transitions:
+            place, local = self.lookup_place(arc_source)
+            if place is None:
+                return False
+            if arc_type == petri_properties.INHIBITOR_ARC and not isinstance(self.net, InhibitorNet):
+                self.__upgrade(ResetInhibitorNet if isinstance(self.net, ResetNet) else InhibitorNet)
+            if arc_type == petri_properties.RESET_ARC and not isinstance(self.net, ResetNet):
+                self.__upgrade(ResetInhibitorNet if isinstance(self.net, InhibitorNet) else ResetNet)
+            if local:
+                _add_arc(place, self.transitions[arc_target], self.net, arc_weight, arc_type)
+            else:
+                add_floating_arc_from_to(place, self.transitions[arc_target], self.net, weight=arc_weight,
+                                         type=arc_type, inner_fr=False)
+            return True
+        if arc_source in self.transitions:
+            place, local = self.lookup_place(arc_target)
+            if place is None:
+                return False
+            if local:
+                _add_arc(self.transitions[arc_source], place, self.net, arc_weight, arc_type)
+            else:
+                add_floating_arc_from_to(self.transitions[arc_source], place, self.net, weight=arc_weight,
+                                         type=arc_type, inner_fr=True)
+            return True
+        # transition endpoint not read yet
+        return False
+
+    def finish(self):
+        pending, self.pending = self.pending, []
+        for arc in pending:
+            # what is still unresolved is dangling, ignored
+            self.attach(*arc)
+        return self.net, self.marking, self.fmarking
+
+
+class _DeferredNet:
+    """
+    Inner net of an extended transition kept as XML until the net is first needed.
+    Places of the enclosing levels are resolved at that moment, when all of them are read.
+    """
+
+    def __init__(self, source: Union[etree._Element, bytes], scope: _Scope):
+        self.source = source
+        self.scope = scope
+
+    def element(self):
+        if isinstance(self.source, bytes):
+            # streamed documents are not kept, their subnets are serialized instead
+            parser = etree.XMLParser(remove_comments=True, huge_tree=True)
+            return etree.fromstring(self.source, parser)
+        return self.source
+
+    def build(self):
+        with _gc_paused():
+            level = _NetLevel(self.scope)
+            _walk_level(self.element(), level)
+            return level.finish()
+
+    def has_content(self) -> bool:
+        return True
+
+    def serialized(self) -> bytes:
+        # element of the transition with the inner net, for storing it as read
+        if isinstance(self.source, bytes):
+            return self.source
+        return etree.tostring(self.source)
+
+    def content(self):
+        # inner page, final markings and variables as they were read
+        return [child for child in self.element() if _local_tag(child.tag) in ('page', 'finalmarkings', 'variables')]
+
+    def export_into(self, trans_el):
+        for child in self.content():
+            trans_el.append(copy.deepcopy(child))
 
 
 def import_net(input_file_path, parameters=None):
@@ -90,11 +455,11 @@ def import_net(input_file_path, parameters=None):
 
     encoding = exec_utils.get_param_value(Parameters.ENCODING, parameters, None)
 
-    parser = etree.XMLParser(remove_comments=True, encoding=encoding)
+    # deep hierarchies nest past the default libxml2 depth limit
+    parser = etree.XMLParser(remove_comments=True, encoding=encoding, huge_tree=True)
 
-    F = open(input_file_path, "rb")
-    tree = objectify.parse(F, parser=parser)
-    F.close()
+    with open_net_file(input_file_path) as F:
+        tree = objectify.parse(F, parser=parser)
 
     root = tree.getroot()
 
@@ -107,7 +472,7 @@ def import_net(input_file_path, parameters=None):
     return import_net_from_xml_object(root, parameters=parameters)
 
 
-def import_net_from_xml_object(nett, parameters, top_net_places=None):
+def import_net_from_xml_object(nett, parameters):
     # root expected to be a <net> or <transition>
     if parameters is None:
         parameters = {}
@@ -115,255 +480,486 @@ def import_net_from_xml_object(nett, parameters, top_net_places=None):
     # right now is not crucial
     # return_stochastic_information = exec_utils.get_param_value(Parameters.RETURN_STOCHASTIC_MAP, parameters, False)
 
-    net = PetriNet('imported_' + str(time.time()))
-    marking = Marking()
-    fmarking = None
+    with _gc_paused():
+        level = _NetLevel()
+        _walk_level(nett, level)
+        return level.finish()
+
+
+def _walk_transition(level: _NetLevel, el):
+    for child in el:
+        if _local_tag(child.tag) == 'page':
+            # extended transition, its inner net is built on first access
+            level.add_transition(el, el)
+            return
+    level.add_transition(el)
+
+
+# page children handlers by local tag name
+_PAGE_HANDLERS = {
+    'place': _NetLevel.add_place,
+    'transition': _walk_transition,
+    'arc': _NetLevel.add_arc,
+}
+
+
+def _add_plain_transition(level: _NetLevel, el):
+    # plain PNML has no inner nets, pages of transitions are not looked at
+    level.add_transition(el)
+
+
+def _link_plain_arcs(level: _NetLevel, arcs):
+    # a single level with all nodes read: plain arcs are linked right away, typed ones go through attach
+    places, transitions, net_arcs = level.places, level.transitions, level.net.arcs
+    arc_cls = PetriNet.Arc
+    for el in arcs:
+        source, target, weight, arc_type = _read_arc(el)
+        if arc_type is not None:
+            level.attach(source, target, weight, arc_type)
+            continue
+        fr = places.get(source)
+        if fr is not None:
+            to = transitions.get(target)
+        else:
+            fr = transitions.get(source)
+            to = places.get(target)
+        if fr is None or to is None:
+            # dangling, ignored
+            continue
+        a = arc_cls(fr, to, weight)
+        net_arcs.add(a)
+        fr.out_arcs.add(a)
+        to.in_arcs.add(a)
+
+
+# page children handlers of plain PNML, arcs are collected for _link_plain_arcs
+_PLAIN_PAGE_HANDLERS = {
+    'place': _NetLevel.add_place,
+    'transition': _add_plain_transition,
+    'arc': lambda level, el: level.pending.append(el),
+}
+
 
+def _walk_level(nett, level: _NetLevel, plain=False):
     page = None
     finalmarkings = None
     variables = None
 
-    # stochastic_map = {}
-
-    places_dict = {}
-    trans_dict = {}
-    ext_trans_dict = {}
-
     if nett is not None:
         for child in nett:
-            if "page" in child.tag:
+            tag = _local_tag(child.tag)
+            if tag == 'page':
                 page = child
-            elif "finalmarkings" in child.tag:
+            elif tag == 'finalmarkings':
                 finalmarkings = child
-            elif "variables" in child.tag:
+            elif tag == 'variables':
                 variables = child
 
     if page is None:
         page = nett
 
     if page is not None:
+        # single pass, arcs wait in the level until both endpoints are read
+        handlers = _PLAIN_PAGE_HANDLERS if plain else _PAGE_HANDLERS
         for child in page:
-            if "place" in child.tag:
-                position_X = None
-                position_Y = None
-                dimension_X = None
-                dimension_Y = None
-                place_id = child.get("id")
-                place_name = place_id
-                number = 0
-                for child2 in child:
-                    if child2.tag.endswith('name'):
-                        for child3 in child2:
-                            if child3.text:
-                                place_name = child3.text
-                    if child2.tag.endswith('initialMarking'):
-                        for child3 in child2:
-                            if child3.tag.endswith("text"):
-                                number = int(child3.text)
-                    if child2.tag.endswith('graphics'):
-                        for child3 in child2:
-                            if child3.tag.endswith('position'):
-                                position_X = float(child3.get("x"))
-                                position_Y = float(child3.get("y"))
-                            elif child3.tag.endswith("dimension"):
-                                dimension_X = float(child3.get("x"))
-                                dimension_Y = float(child3.get("y"))
-                places_dict[place_id] = PetriNet.Place(place_id)
-                places_dict[place_id].properties[constants.PLACE_NAME_TAG] = place_name
-                net.places.add(places_dict[place_id])
-                if position_X is not None and position_Y is not None and dimension_X is not None and dimension_Y is not None:
-                    places_dict[place_id].properties[constants.LAYOUT_INFORMATION_PETRI] = (
-                        (position_X, position_Y), (dimension_X, dimension_Y))
-                if number > 0:
-                    marking[places_dict[place_id]] = number
-                del place_name
+            handler = handlers.get(_local_tag(child.tag))
+            if handler is not None:
+                handler(level, child)
+        if plain:
+            arcs, level.pending = level.pending, []
+            _link_plain_arcs(level, arcs)
 
-    if page is not None:
-        for child in page:
-            if child.tag.endswith("transition"):
-                # try to find inner
-                subpage = None
-                for sub_child in child:
-                    if "page" in sub_child.tag:
-                        subpage = sub_child
-                        break
-                # inner end
-                position_X = None
-                position_Y = None
-                dimension_X = None
-                dimension_Y = None
-                trans_id = child.get("id")
-                trans_name = trans_id
-                trans_visible = True
-                trans_properties = {}
-                trans_guard = child.get("guard")
-                if trans_guard is not None:
-                    trans_properties[petri_properties.TRANS_GUARD] = trans_guard
-
-                for child2 in child:
-                    if child2.tag.endswith("name"):
-                        for child3 in child2:
-                            if child3.text:
-                                if trans_name == trans_id:
-                                    trans_name = child3.text
-                    elif child2.tag.endswith("graphics"):
-                        for child3 in child2:
-                            if child3.tag.endswith("position"):
-                                position_X = float(child3.get("x"))
-                                position_Y = float(child3.get("y"))
-                            elif child3.tag.endswith("dimension"):
-                                dimension_X = float(child3.get("x"))
-                                dimension_Y = float(child3.get("y"))
-                    elif child2.tag.endswith("toolspecific"):
-                        tool = child2.get("tool")
-                        if "ProM" in tool:
-                            activity = child2.get("activity")
-                            if "invisible" in activity:
-                                trans_visible = False
-                    elif child2.tag.endswith(petri_properties.WRITE_VARIABLE):
-                        # property for data Petri nets
-                        if petri_properties.WRITE_VARIABLE not in trans_properties:
-                            trans_properties[petri_properties.WRITE_VARIABLE] = []
-                        trans_properties[petri_properties.WRITE_VARIABLE].append(child2.text)
-                    elif child2.tag.endswith(petri_properties.READ_VARIABLE):
-                        # property for data Petri nets
-                        if petri_properties.READ_VARIABLE not in trans_properties:
-                            trans_properties[petri_properties.READ_VARIABLE] = []
-                        trans_properties[petri_properties.READ_VARIABLE].append(child2.text)
-
-                # 15/02/2021: the name associated in the PNML to invisible transitions was lost.
-                # at least save that as property.
-                if trans_visible:
-                    trans_label = trans_name
-                else:
-                    trans_label = None
+    if finalmarkings is not None:
+        level.add_final_marking(finalmarkings)
 
-                if subpage is not None:
-                    trans_dict[trans_id] = ExtendedTransition(trans_id, trans_name)
-                    ext_trans_dict[trans_dict[trans_id]] = child
+    if variables is not None:
+        level.add_variables(variables)
+
+
+# iterparse element roles
+_ROLE_OTHER = 0
+_ROLE_CONTAINER = 1
+_ROLE_PAGE = 2
+_ROLE_NODE = 3
+_ROLE_META = 4
+
+
+_STREAM_TAGS = ['{*}' + tag for tag in ('net', 'group', 'page', 'place', 'transition', 'arc', 'finalmarkings',
+                                         'variables')]
+
+
+def _release(el):
+    # drops the processed element together with its already processed siblings
+    el.clear()
+    parent = el.getparent()
+    if parent is not None:
+        while el.getprevious() is not None:
+            del parent[0]
+
+
+def _stream_levels(context, hierarchical=True):
+    # hierarchical=False reads plain PNML: pages of transitions are skipped, as pm4py does
+    # per open structural element: [role, level or subnet flag, element]
+    frames: list[list] = []
+    top: Union[_NetLevel, None] = None
+    result = None
+    for event, el in context:
+        if event == 'start':
+            tag = _local_tag(el.tag)
+            parent = el.getparent()
+            if not frames:
+                if (tag == 'net' or tag == 'group') and parent is not None and parent.getparent() is None:
+                    # the last net of the document wins, as with import_net
+                    top = _NetLevel()
+                    frames.append([_ROLE_CONTAINER, top, el])
                 else:
-                    trans_dict[trans_id] = PetriNet.Transition(trans_id, trans_label)
-                trans_dict[trans_id].properties[constants.TRANS_NAME_TAG] = trans_name
-                for prop in trans_properties:
-                    trans_dict[trans_id].properties[prop] = trans_properties[prop]
-                net.transitions.add(trans_dict[trans_id])
-
-                if position_X is not None and position_Y is not None and dimension_X is not None and dimension_Y is not None:
-                    trans_dict[trans_id].properties[constants.LAYOUT_INFORMATION_PETRI] = (
-                        (position_X, position_Y), (dimension_X, dimension_Y))
-
-    for et, child in ext_trans_dict.items():
-        try:
-            _top_net_places = places_dict
-            if top_net_places:
-                _top_net_places |= top_net_places
-            group_inner_net, inner_init, inner_fin = import_net_from_xml_object(child, None, _top_net_places)
-            if not group_inner_net:
-                raise EPNMLException(f'Empty extended transition {child}!')
-            et.inject_net(group_inner_net, inner_init, inner_fin)
-        except EPNMLException as ex:
-            raise EPNMLException(f'Extended transition, imported by EPNML must be completed and correct! '
-                                 f'Exact failure caused {ex}')
+                    frames.append([_ROLE_OTHER, None, el])
+                continue
+            role, level, holder = frames[-1]
+            if parent is not holder:
+                # structural tag nested in some unrelated content
+                frames.append([_ROLE_OTHER, None, el])
+            elif hierarchical and role == _ROLE_NODE and tag == 'page' and _local_tag(holder.tag) == 'transition':
+                # extended transition, its content is kept for the deferred inner net
+                frames[-1][1] = True
+                frames.append([_ROLE_OTHER, None, el])
+            elif (role == _ROLE_CONTAINER or role == _ROLE_PAGE) and tag in ('place', 'transition', 'arc'):
+                frames.append([_ROLE_NODE, False, el])
+            elif role == _ROLE_CONTAINER and tag == 'page':
+                frames.append([_ROLE_PAGE, level, el])
+            elif role == _ROLE_CONTAINER and tag in ('finalmarkings', 'variables'):
+                frames.append([_ROLE_META, level, el])
+            else:
+                frames.append([_ROLE_OTHER, None, el])
+            continue
+        role, subnet, _ = frames.pop()
+        if role == _ROLE_NODE:
+            tag = _local_tag(el.tag)
+            level = frames[-1][1]
+            if tag == 'place':
+                level.add_place(el)
+            elif tag == 'transition':
+                level.add_transition(el, etree.tostring(el) if subnet else None)
+            else:
+                level.add_arc(el)
+            _release(el)
+        elif role == _ROLE_META:
+            if _local_tag(el.tag) == 'finalmarkings':
+                top.add_final_marking(el)
+            else:
+                top.add_variables(el)
+            el.clear()
+        elif role == _ROLE_CONTAINER:
+            result = top.finish()
+            _release(el)
+    return result
+
+
+def import_net_stream(input_file, parameters=None):
+    """
+    Imports (E)PNML with lxml iterparse. Places, transitions and arcs are built as soon as their elements are
+    complete, processed elements are released immediately, so the whole document is never kept.
+    Inner nets of extended transitions keep their elements and are built on first access.
 
-    if page is not None:
-        for child in page:
-            if child.tag.endswith("arc"):
-                arc_source = child.get("source")
-                arc_target = child.get("target")
-                arc_weight = 1
-                arc_type = None
-                arc_properties = {}
-
-                for arc_child in child:
-                    if arc_child.tag.endswith("inscription"):
-                        for text_element in arc_child:
-                            if text_element.tag.endswith("text"):
-                                arc_weight = int(text_element.text)
-                    elif arc_child.tag.endswith(petri_properties.ARCTYPE):
-                        for text_element in arc_child:
-                            if text_element.tag.endswith("text"):
-                                arc_type = text_element.text
-
-                inhibic = (arc_source in places_dict) and (arc_target in trans_dict)
-                if top_net_places is not None:
-                    inhibic = inhibic or ((arc_source in top_net_places) and (arc_target in trans_dict))
-                rever = (arc_target in places_dict) and (arc_source in trans_dict)
-                if top_net_places is not None:
-                    rever = rever or ((arc_target in top_net_places) and (arc_source in trans_dict))
-
-                if inhibic:
-                    if arc_type == petri_properties.INHIBITOR_ARC and not isinstance(net, InhibitorNet):
-                        if isinstance(net, ResetNet):
-                            net = ResetInhibitorNet(name=net.name, places=net.places, transitions=net.transitions,
-                                                    arcs=net.arcs, properties=net.properties)
-                        else:
-                            net = InhibitorNet(name=net.name, places=net.places, transitions=net.transitions,
-                                               arcs=net.arcs, properties=net.properties)
-                    if arc_type == petri_properties.RESET_ARC and not isinstance(net, ResetNet):
-                        if isinstance(net, InhibitorNet):
-                            net = ResetInhibitorNet(name=net.name, places=net.places,
-                                                    transitions=net.transitions, arcs=net.arcs,
-                                                    properties=net.properties)
-                        else:
-                            net = ResetNet(name=net.name, places=net.places,
-                                           transitions=net.transitions, arcs=net.arcs,
-                                           properties=net.properties)
-                    # outer redirection
-                    pdict = places_dict
-                    tdict = trans_dict
-                    out = False
-                    if top_net_places and (arc_source in top_net_places):
-                        out = True
-                        pdict = top_net_places
-                    # redirect finish
-                    if out:
-                        a = add_floating_arc_from_to(pdict[arc_source], tdict[arc_target], net, weight=arc_weight,
-                                            type=arc_type, inner_fr=False)
-                    else:
-                        a = add_arc_from_to(pdict[arc_source], tdict[arc_target], net, weight=arc_weight,
-                                            type=arc_type)
-                    for prop in arc_properties:
-                        a.properties[prop] = arc_properties[prop]
-                elif rever:
-                    # outer redirection
-                    pdict = places_dict
-                    tdict = trans_dict
-                    out = False
-                    if top_net_places and (arc_target in top_net_places):
-                        out = True
-                        pdict = top_net_places
-                    # redirect finish
-                    if out:
-                        a = add_floating_arc_from_to(tdict[arc_source], pdict[arc_target], net, weight=arc_weight,
-                                            type=arc_type, inner_fr=True)
-                    else:
-                        a = add_arc_from_to(tdict[arc_source], pdict[arc_target], net, weight=arc_weight,
-                                            type=arc_type)
-                    for prop in arc_properties:
-                        a.properties[prop] = arc_properties[prop]
+    Parameters
+    ----------
+    input_file: path (compressed files are read as streams, see open_net_file) or binary file object
+    parameters: importer parameters (encoding)
 
-    if finalmarkings is not None:
-        fmarking = Marking()
-        for child in finalmarkings:
-            for child2 in child:
-                place_id = child2.get("idref")
-                for child3 in child2:
-                    if child3.tag.endswith("text"):
-                        number = int(child3.text)
-                        if number > 0:
-                            fmarking[places_dict[place_id]] = number
+    Returns
+    -------
+    net, initial marking, final marking
+    """
+    if isinstance(input_file, (str, os.PathLike)):
+        with open_net_file(input_file) as F:
+            return import_net_stream(F, parameters)
 
-    if variables is not None:
-        net.properties[petri_properties.VARIABLES] = []
-        for child in variables:
-            variable_type = child.get("type")
-            variable_name = ""
-            for child2 in child:
-                if child2.tag.endswith("name"):
-                    variable_name = child2.text
-            net.properties[petri_properties.VARIABLES].append({"type": variable_type, "name": variable_name})
+    if parameters is None:
+        parameters = {}
+
+    encoding = exec_utils.get_param_value(Parameters.ENCODING, parameters, None)
+
+    # only structural elements produce events, their content is read from the completed element
+    context = etree.iterparse(input_file, events=('start', 'end'), tag=_STREAM_TAGS, remove_comments=True,
+                              remove_pis=True, encoding=encoding, huge_tree=True)
+    with _gc_paused():
+        result = _stream_levels(context)
+    del context
 
-    return net, marking, fmarking
+    if result is None:
+        return PetriNet('imported_' + str(time.time())), Marking(), None
+    return result
+
+
+def import_pnml(input_file, parameters=None):
+    """
+    Imports plain PNML, a faster replacement of pm4py.read_pnml: the same net, initial marking and final marking
+    (None when the file has none), pages nested in transitions are ignored. Flat documents are read as a whole,
+    which is faster than streaming them, and arcs are linked in one pass once all nodes are known.
+
+    Parameters
+    ----------
+    input_file: path (compressed files are read as streams, see open_net_file) or binary file object
+    parameters: importer parameters (encoding)
+
+    Returns
+    -------
+    net, initial marking, final marking
+    """
+    if isinstance(input_file, (str, os.PathLike)):
+        with open_net_file(input_file) as F:
+            return import_pnml(F, parameters)
+
+    if parameters is None:
+        parameters = {}
+
+    encoding = exec_utils.get_param_value(Parameters.ENCODING, parameters, None)
+
+    parser = etree.XMLParser(remove_comments=True, remove_pis=True, encoding=encoding, huge_tree=True)
+    root = etree.parse(input_file, parser=parser).getroot()
+
+    nett = None
+    for child in root:
+        if _local_tag(child.tag) in ('net', 'group'):
+            nett = child
+    if nett is None:
+        return PetriNet('imported_' + str(time.time())), Marking(), None
+
+    with _gc_paused():
+        level = _NetLevel()
+        _walk_level(nett, level, plain=True)
+        return level.finish()
+
+
+def snapshot_net(petrinet, marking, final_marking=None, keep_deferred=True, copies=None):
+    """
+    Copies the structure of a net with all its inner nets, so that it can be written on another thread while
+    the original one is edited. Nodes and arcs are new objects with copied properties, markings are moved to the
+    copied places and floating arcs stay floating.
+
+    Parameters
+    ----------
+    petrinet: net to copy
+    marking: initial marking, places of any level
+    final_marking: final marking (optional)
+    keep_deferred: inner nets that are not built yet stay so, False builds all of them here. The copies share the
+        sources of the original ones: those read from XML are written back as read, the others are built when
+        the copy is written, on the writing thread, with their arcs to outer places moved to the copied places
+    copies: dict filled with the copy of every node and arc (optional)
+
+    Returns
+    -------
+    net, initial marking, final marking (None when not given)
+    """
+    arc_copies = copies
+    copies = {} if copies is None else copies
+
+    def copy_level(net, im, fm):
+        net_copy = type(net)(net.name, properties=dict(net.properties))
+        for p in net.places:
+            p_copy = type(p)(p.name, properties=dict(p.properties))
+            copies[p] = p_copy
+            net_copy.places.add(p_copy)
+        inner = []
+        for t in net.transitions:
+            t_copy = type(t)(t.name, t.label, properties=dict(t.properties))
+            copies[t] = t_copy
+            net_copy.transitions.add(t_copy)
+            if isinstance(t, ExtendedTransition):
+                inner.append((t, t_copy))
+        # arcs of inner nets may lead to the places of this one
+        for t, t_copy in inner:
+            deferred = t.deferred_net
+            if deferred is not None and keep_deferred:
+                t_copy.defer_net(_SnapshotNet(deferred, copies))
+            else:
+                t_copy.inject_net(*copy_level(t.inner_net, t.init_marking, t.final_marking))
+        for a in net.arcs:
+            fr, to = a.source, a.target
+            a_copy = type(a)(copies[fr], copies[to], a.weight, dict(a.properties))
+            if arc_copies is not None:
+                arc_copies[a] = a_copy
+            net_copy.arcs.add(a_copy)
+            if a in fr.out_arcs:
+                a_copy.source.out_arcs.add(a_copy)
+            if a in to.in_arcs:
+                a_copy.target.in_arcs.add(a_copy)
+        return net_copy, copy_marking(im), copy_marking(fm)
+
+    def copy_marking(m):
+        if m is None:
+            return None
+        m_copy = Marking()
+        for p, n in m.items():
+            if p in copies:
+                m_copy[copies[p]] = n
+        return m_copy
+
+    with _gc_paused():
+        net_copy, _, _ = copy_level(petrinet, None, None)
+        return net_copy, copy_marking(marking), copy_marking(final_marking)
+
+
+class _SnapshotNet:
+    # deferred inner net of a copy made by snapshot_net, built from the source of the original one
+    def __init__(self, source, copies: dict):
+        self.source = source
+        self.copies = copies
+
+    def build(self):
+        # floating arcs lead to the places of the original enclosing levels, the copy's ones take their place
+        net, im, fm = self.source.build()
+        copies = self.copies
+        for a in [a for a in net.arcs if a.source in copies or a.target in copies]:
+            fr, to = copies.get(a.source, a.source), copies.get(a.target, a.target)
+            a_copy = type(a)(fr, to, a.weight, a.properties)
+            net.arcs.remove(a)
+            net.arcs.add(a_copy)
+            if fr is a.source:
+                fr.out_arcs.discard(a)
+                fr.out_arcs.add(a_copy)
+            if to is a.target:
+                to.in_arcs.discard(a)
+                to.in_arcs.add(a_copy)
+        return net, im, fm
+
+    def has_content(self) -> bool:
+        return self.source.has_content()
+
+    def serialized(self) -> bytes:
+        return self.source.serialized()
+
+    def content(self):
+        return self.source.content()
+
+    def export_into(self, trans_el):
+        self.source.export_into(trans_el)
+
+
+def _sub(parent, tag):
+    # a child of parent or a standalone element for the streaming writer, one per line
+    if parent is None:
+        el = etree.Element(tag)
+        el.tail = "\n"
+        return el
+    return etree.SubElement(parent, tag)
+
+
+def _export_layout(el, properties_):
+    layout = properties_[constants.LAYOUT_INFORMATION_PETRI]
+    graphics = etree.SubElement(el, "graphics")
+    position = etree.SubElement(graphics, "position")
+    position.set("x", str(layout[0][0]))
+    position.set("y", str(layout[0][1]))
+    dimension = etree.SubElement(graphics, "dimension")
+    dimension.set("x", str(layout[1][0]))
+    dimension.set("y", str(layout[1][1]))
+
+
+def _export_place(parent, place, marking):
+    pl = _sub(parent, "place")
+    pl.set("id", place.name)
+    pl_name = etree.SubElement(pl, "name")
+    pl_name_text = etree.SubElement(pl_name, "text")
+    pl_name_text.text = place.properties[
+        constants.PLACE_NAME_TAG] if constants.PLACE_NAME_TAG in place.properties else place.name
+    if place in marking:
+        pl_initial_marking = etree.SubElement(pl, "initialMarking")
+        pl_initial_marking_text = etree.SubElement(pl_initial_marking, "text")
+        pl_initial_marking_text.text = str(marking[place])
+    if constants.LAYOUT_INFORMATION_PETRI in place.properties:
+        _export_layout(pl, place.properties)
+    return pl
+
+
+def _export_transition(parent, transition, silent_tool=False):
+    # silent_tool: silent transitions marked as ProM does, only by the streaming writer
+    trans = _sub(parent, "transition")
+    trans.set("id", transition.name)
+    trans_name = etree.SubElement(trans, "name")
+    trans_text = etree.SubElement(trans_name, "text")
+    if constants.LAYOUT_INFORMATION_PETRI in transition.properties:
+        _export_layout(trans, transition.properties)
+    if transition.label is not None:
+        trans_text.text = transition.label
+    else:
+        trans_text.text = transition.name
+        if silent_tool:
+            # read back by the importers as a silent transition
+            tool_specific = etree.SubElement(trans, "toolspecific")
+            tool_specific.set("tool", "ProM")
+            tool_specific.set("version", "6.4")
+            tool_specific.set("activity", "$invisible$")
+            # derived from the id, the same net always gives the same file
+            tool_specific.set("localNodeID", str(uuid.uuid5(uuid.NAMESPACE_OID, transition.name)))
+    # specific for data Petri nets
+    if petri_properties.TRANS_GUARD in transition.properties:
+        trans.set(petri_properties.TRANS_GUARD, transition.properties[petri_properties.TRANS_GUARD])
+    if petri_properties.READ_VARIABLE in transition.properties:
+        read_variables = transition.properties[petri_properties.READ_VARIABLE]
+        for rv in read_variables:
+            rv_el = etree.SubElement(trans, petri_properties.READ_VARIABLE)
+            rv_el.text = rv
+    if petri_properties.WRITE_VARIABLE in transition.properties:
+        write_variables = transition.properties[petri_properties.WRITE_VARIABLE]
+        for wv in write_variables:
+            wv_el = etree.SubElement(trans, petri_properties.WRITE_VARIABLE)
+            wv_el.text = wv
+    return trans
+
+
+def _export_arc(parent, arc, places_map, transitions_map):
+    arc_el = _sub(parent, "arc")
+    arc_el.set("id", str(hash(arc)))
+    if type(arc.source) is PetriNet.Place:
+        arc_el.set("source", str(places_map[arc.source]))
+        arc_el.set("target", str(transitions_map[arc.target]))
+    else:
+        arc_el.set("source", str(transitions_map[arc.source]))
+        arc_el.set("target", str(places_map[arc.target]))
+
+    if arc.weight > 1:
+        inscription = etree.SubElement(arc_el, "inscription")
+        arc_weight = etree.SubElement(inscription, "text")
+        arc_weight.text = str(arc.weight)
+
+    if isinstance(arc, ResetNet.ResetArc):
+        element = etree.SubElement(arc_el, petri_properties.ARCTYPE)
+        element_text = etree.SubElement(element, "text")
+        element_text.text = petri_properties.RESET_ARC
+    elif isinstance(arc, InhibitorNet.InhibitorArc):
+        element = etree.SubElement(arc_el, petri_properties.ARCTYPE)
+        element_text = etree.SubElement(element, "text")
+        element_text.text = petri_properties.INHIBITOR_ARC
+
+    for prop_key in arc.properties:
+        if prop_key != petri_properties.ARCTYPE:
+            element = etree.SubElement(arc_el, prop_key)
+            element_text = etree.SubElement(element, "text")
+            element_text.text = str(arc.properties[prop_key])
+    return arc_el
+
+
+def _export_final_marking(parent, final_marking):
+    finalmarkings = _sub(parent, "finalmarkings")
+    marking = etree.SubElement(finalmarkings, "marking")
+
+    for place in final_marking:
+        placem = etree.SubElement(marking, "place")
+        placem.set("idref", place.name)
+        placem_text = etree.SubElement(placem, "text")
+        placem_text.text = str(final_marking[place])
+    return finalmarkings
+
+
+def _export_variables(parent, petrinet):
+    variables = _sub(parent, "variables")
+    for prop in petrinet.properties[petri_properties.VARIABLES]:
+        variable = etree.SubElement(variables, "variable")
+        variable.set("type", prop["type"])
+        variable_name = etree.SubElement(variable, "name")
+        variable_name.text = prop["name"]
+    return variables
 
 
 def export_petri_tree(petrinet, marking, final_marking=None, parameters=None, top_net_data=None):
@@ -394,112 +990,31 @@ def export_petri_tree(petrinet, marking, final_marking=None, parameters=None, to
     page.set("id", "n0")
     for place in petrinet.places:
         places_map[place] = place.name
-        pl = etree.SubElement(page, "place")
-        pl.set("id", place.name)
-        pl_name = etree.SubElement(pl, "name")
-        pl_name_text = etree.SubElement(pl_name, "text")
-        pl_name_text.text = place.properties[
-            constants.PLACE_NAME_TAG] if constants.PLACE_NAME_TAG in place.properties else place.name
-        if place in marking:
-            pl_initial_marking = etree.SubElement(pl, "initialMarking")
-            pl_initial_marking_text = etree.SubElement(pl_initial_marking, "text")
-            pl_initial_marking_text.text = str(marking[place])
-        if constants.LAYOUT_INFORMATION_PETRI in place.properties:
-            graphics = etree.SubElement(pl, "graphics")
-            position = etree.SubElement(graphics, "position")
-            position.set("x", str(place.properties[constants.LAYOUT_INFORMATION_PETRI][0][0]))
-            position.set("y", str(place.properties[constants.LAYOUT_INFORMATION_PETRI][0][1]))
-            dimension = etree.SubElement(graphics, "dimension")
-            dimension.set("x", str(place.properties[constants.LAYOUT_INFORMATION_PETRI][1][0]))
-            dimension.set("y", str(place.properties[constants.LAYOUT_INFORMATION_PETRI][1][1]))
+        _export_place(page, place, marking)
     extended = []
     for transition in petrinet.transitions:
         transitions_map[transition] = transition.name
-        trans = etree.SubElement(page, "transition")
-        trans.set("id", transition.name)
-        trans_name = etree.SubElement(trans, "name")
-        trans_text = etree.SubElement(trans_name, "text")
-        if constants.LAYOUT_INFORMATION_PETRI in transition.properties:
-            graphics = etree.SubElement(trans, "graphics")
-            position = etree.SubElement(graphics, "position")
-            position.set("x", str(transition.properties[constants.LAYOUT_INFORMATION_PETRI][0][0]))
-            position.set("y", str(transition.properties[constants.LAYOUT_INFORMATION_PETRI][0][1]))
-            dimension = etree.SubElement(graphics, "dimension")
-            dimension.set("x", str(transition.properties[constants.LAYOUT_INFORMATION_PETRI][1][0]))
-            dimension.set("y", str(transition.properties[constants.LAYOUT_INFORMATION_PETRI][1][1]))
-        if transition.label is not None:
-            trans_text.text = transition.label
-        else:
-            trans_text.text = transition.name
-        # specific for data Petri nets
-        if petri_properties.TRANS_GUARD in transition.properties:
-            trans.set(petri_properties.TRANS_GUARD, transition.properties[petri_properties.TRANS_GUARD])
-        if petri_properties.READ_VARIABLE in transition.properties:
-            read_variables = transition.properties[petri_properties.READ_VARIABLE]
-            for rv in read_variables:
-                rv_el = etree.SubElement(trans, petri_properties.READ_VARIABLE)
-                rv_el.text = rv
-        if petri_properties.WRITE_VARIABLE in transition.properties:
-            write_variables = transition.properties[petri_properties.WRITE_VARIABLE]
-            for wv in write_variables:
-                wv_el = etree.SubElement(trans, petri_properties.WRITE_VARIABLE)
-                wv_el.text = wv
-
+        trans = _export_transition(page, transition)
         if isinstance(transition, ExtendedTransition):
             extended.append((trans, transition))
     for arc in petrinet.arcs:
-        arc_el = etree.SubElement(page, "arc")
-        arc_el.set("id", str(hash(arc)))
-        if type(arc.source) is PetriNet.Place:
-            arc_el.set("source", str(places_map[arc.source]))
-            arc_el.set("target", str(transitions_map[arc.target]))
-        else:
-            arc_el.set("source", str(transitions_map[arc.source]))
-            arc_el.set("target", str(places_map[arc.target]))
-
-        if arc.weight > 1:
-            inscription = etree.SubElement(arc_el, "inscription")
-            arc_weight = etree.SubElement(inscription, "text")
-            arc_weight.text = str(arc.weight)
-
-        if isinstance(arc, ResetNet.ResetArc):
-            element = etree.SubElement(arc_el, petri_properties.ARCTYPE)
-            element_text = etree.SubElement(element, "text")
-            element_text.text = petri_properties.RESET_ARC
-        elif isinstance(arc, InhibitorNet.InhibitorArc):
-            element = etree.SubElement(arc_el, petri_properties.ARCTYPE)
-            element_text = etree.SubElement(element, "text")
-            element_text.text = petri_properties.INHIBITOR_ARC
-
-        for prop_key in arc.properties:
-            if prop_key != petri_properties.ARCTYPE:
-                element = etree.SubElement(arc_el, prop_key)
-                element_text = etree.SubElement(element, "text")
-                element_text.text = str(arc.properties[prop_key])
+        _export_arc(page, arc, places_map, transitions_map)
 
     # export inner net
     for xml_obj, extr in extended:
+        if not extr.is_materialized() and extr.deferred_net.has_content():
+            # never built, written back as read
+            extr.deferred_net.export_into(xml_obj)
+            continue
         export_petri_tree(extr.inner_net, extr.init_marking, extr.final_marking, None,
                           (xml_obj, transitions_map, places_map))
 
     if len(final_marking) > 0:
-        finalmarkings = etree.SubElement(net, "finalmarkings")
-        marking = etree.SubElement(finalmarkings, "marking")
-
-        for place in final_marking:
-            placem = etree.SubElement(marking, "place")
-            placem.set("idref", place.name)
-            placem_text = etree.SubElement(placem, "text")
-            placem_text.text = str(final_marking[place])
+        _export_final_marking(net, final_marking)
 
     # specific for data Petri nets
     if petri_properties.VARIABLES in petrinet.properties:
-        variables = etree.SubElement(net, "variables")
-        for prop in petrinet.properties[petri_properties.VARIABLES]:
-            variable = etree.SubElement(variables, "variable")
-            variable.set("type", prop["type"])
-            variable_name = etree.SubElement(variable, "name")
-            variable_name.text = prop["name"]
+        _export_variables(net, petrinet)
 
     if top_net_data is not None:
         tree = net
@@ -509,20 +1024,89 @@ def export_petri_tree(petrinet, marking, final_marking=None, parameters=None, to
     return tree
 
 
-def export_petri_as_string(petrinet, marking, final_marking=None, parameters=None):
+def _stream_page(xf, petrinet, marking, final_marking, places_map, transitions_map, hierarchical):
+    # page of one level followed by its final markings and variables, inner levels are written in place
+    if final_marking is None:
+        final_marking = Marking()
+    if marking is None:
+        marking = Marking()
+    with xf.element("page", id="n0"):
+        xf.write("\n")
+        for place in petrinet.places:
+            places_map[place] = place.name
+            xf.write(_export_place(None, place, marking))
+        # inner levels are written before the rest of this one is visited
+        for transition in petrinet.transitions:
+            transitions_map[transition] = transition.name
+        for transition in petrinet.transitions:
+            trans = _export_transition(None, transition, silent_tool=True)
+            if not hierarchical or not isinstance(transition, ExtendedTransition):
+                xf.write(trans)
+                continue
+            with xf.element(trans.tag, trans.attrib):
+                xf.write("\n")
+                for child in trans:
+                    child.tail = "\n"
+                    xf.write(child)
+                if not transition.is_materialized() and transition.deferred_net.has_content():
+                    # never built, written back as read
+                    for child in transition.deferred_net.content():
+                        xf.write(child)
+                else:
+                    _stream_page(xf, transition.inner_net, transition.init_marking, transition.final_marking,
+                                 places_map, transitions_map, hierarchical)
+            xf.write("\n")
+        for arc in petrinet.arcs:
+            xf.write(_export_arc(None, arc, places_map, transitions_map))
+    xf.write("\n")
+
+    if len(final_marking) > 0:
+        xf.write(_export_final_marking(None, final_marking))
+
+    # specific for data Petri nets
+    if petri_properties.VARIABLES in petrinet.properties:
+        xf.write(_export_variables(None, petrinet))
+
+
+def export_net_stream(petrinet, marking, output, final_marking=None, parameters=None, hierarchical=True):
+    """
+    Writes (E)PNML with lxml xmlfile, every place, transition and arc goes to the output as soon as it is visited,
+    so no tree of the whole net is built. Inner nets of extended transitions are written inside their transitions.
+
+    Parameters
+    ----------
+    petrinet: net to export
+    marking: initial marking
+    output: path or binary file object
+    final_marking: final marking (optional)
+    parameters: exporter parameters (encoding)
+    hierarchical: False writes plain PNML, extended transitions become ordinary ones
+
+    Returns
+    -------
+    None
+    """
     if parameters is None:
         parameters = {}
 
     encoding = exec_utils.get_param_value(Parameters.ENCODING, parameters, constants.DEFAULT_ENCODING)
 
-    # gets the XML tree
-    tree = export_petri_tree(petrinet, marking, final_marking=final_marking)
+    with etree.xmlfile(output, encoding=encoding) as xf:
+        xf.write_declaration()
+        with xf.element("pnml"):
+            xf.write("\n")
+            with xf.element("net", id=petrinet.name, type="http://www.pnml.org/version-2009/grammar/pnmlcoremodel"):
+                xf.write("\n")
+                netname = etree.Element("name")
+                netnametext = etree.SubElement(netname, "text")
+                netnametext.text = petrinet.name
+                netname.tail = "\n"
+                xf.write(netname)
+                _stream_page(xf, petrinet, marking, final_marking, {}, {}, hierarchical)
+            xf.write("\n")
 
-    # removing default decoding (return binary string as in other parts of the application)
-    return etree.tostring(tree, xml_declaration=True, encoding=encoding)
 
-
-def export_net(petrinet, marking, output_filename, final_marking=None, parameters=None):
+def export_petri_as_string(petrinet, marking, final_marking=None, parameters=None):
     if parameters is None:
         parameters = {}
 
@@ -531,7 +1115,10 @@ def export_net(petrinet, marking, output_filename, final_marking=None, parameter
     # gets the XML tree
     tree = export_petri_tree(petrinet, marking, final_marking=final_marking)
 
-    # write the tree to a file
-    F = open(output_filename, "wb")
-    tree.write(F, pretty_print=True, xml_declaration=True, encoding=encoding)
-    F.close()
+    # removing default decoding (return binary string as in other parts of the application)
+    return etree.tostring(tree, xml_declaration=True, encoding=encoding)
+
+
+def export_net(petrinet, marking, output_filename, final_marking=None, parameters=None, hierarchical=True):
+    with open_net_file(output_filename, "wb") as F:
+        export_net_stream(petrinet, marking, F, final_marking, parameters, hierarchical)
@@ -0,0 +1,484 @@
+import json
+import os
+import struct
+import weakref
+from typing import Union
+
+import numpy as np
+from pm4py.objects.petri_net import properties as petri_properties
+from pm4py.objects.petri_net.obj import PetriNet, Marking, ResetNet, InhibitorNet, ResetInhibitorNet
+from pm4py.util import constants
+
+from pnv.importer import epnml
+from pnv.importer.epnml import ExtendedTransition, EPNMLException, _gc_paused
+
+# Binary net cache. One file: header, JSON directory, then 64-byte aligned little-endian arrays.
+# Nodes of all levels share one numbering, every level is a contiguous block of it (places, then transitions),
+# an extended transition points to the block of its inner net. Arcs are stored in CSR rows of their transition,
+# the only endpoint that always belongs to the arc's level, the place may be an outer one.
+# Inner nets read from (E)PNML and never built are kept as they were read: their transition element, serialized,
+# is a blob of the file instead of a level, built on first access as by the XML importers.
+
+MAGIC = b'PNVB'
+VERSION = 2
+ALIGN = 64
+
+KIND_PLACE = 0
+KIND_TRANSITION = 1
+KIND_EXTENDED = 2
+
+ARC_TO_TRANSITION = 0
+ARC_TO_PLACE = 1
+
+ARC_PLAIN = 0
+ARC_INHIBITOR = 1
+ARC_RESET = 2
+
+NET_PLAIN = 0
+NET_INHIBITOR = 1
+NET_RESET = 2
+NET_RESET_INHIBITOR = 3
+
+_NET_TYPES = {NET_PLAIN: PetriNet, NET_INHIBITOR: InhibitorNet, NET_RESET: ResetNet,
+              NET_RESET_INHIBITOR: ResetInhibitorNet}
+
+_ARRAYS = {
+    'strings_offsets': '<i8', 'strings_data': '<u1',
+    'node_kind': '<u1', 'node_id': '<i4', 'node_label': '<i4', 'node_title': '<i4', 'node_props': '<i4',
+    'node_layout': '<f8', 'node_child': '<i4', 'node_blob': '<i4',
+    'blobs_offsets': '<i8', 'blobs_data': '<u1',
+    'arc_indptr': '<i8', 'arc_node': '<i4', 'arc_dir': '<u1', 'arc_weight': '<i4', 'arc_type': '<u1',
+    'arc_props': '<i4',
+    'level_nodes': '<i8', 'level_name': '<i4', 'level_kind': '<u1', 'level_props': '<i4', 'level_has_fm': '<u1',
+    'im_indptr': '<i8', 'im_node': '<i4', 'im_count': '<i8',
+    'fm_indptr': '<i8', 'fm_node': '<i4', 'fm_count': '<i8',
+}
+
+
+def _dump_props(props: dict, skip: tuple) -> Union[str, None]:
+    # only what json keeps, as the XML writers only keep what they know
+    kept = {}
+    for key, value in props.items():
+        if key in skip:
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        kept[key] = value
+    return json.dumps(kept, sort_keys=True) if kept else None
+
+
+class _Strings:
+    def __init__(self):
+        self.index: dict[str, int] = {}
+        self.data: list[bytes] = []
+
+    def intern(self, s: Union[str, None]) -> int:
+        if s is None:
+            return -1
+        idx = self.index.get(s)
+        if idx is None:
+            idx = self.index[s] = len(self.data)
+            self.data.append(s.encode('utf-8'))
+        return idx
+
+    def arrays(self):
+        offsets = np.zeros(len(self.data) + 1, dtype='<i8')
+        np.cumsum([len(b) for b in self.data], out=offsets[1:])
+        return offsets, np.frombuffer(b''.join(self.data), dtype='<u1')
+
+
+def _net_kind(net: PetriNet) -> int:
+    if isinstance(net, ResetInhibitorNet):
+        return NET_RESET_INHIBITOR
+    if isinstance(net, InhibitorNet):
+        return NET_INHIBITOR
+    if isinstance(net, ResetNet):
+        return NET_RESET
+    return NET_PLAIN
+
+
+def _arc_type(arc: PetriNet.Arc) -> int:
+    if isinstance(arc, InhibitorNet.InhibitorArc):
+        return ARC_INHIBITOR
+    if isinstance(arc, ResetNet.ResetArc):
+        return ARC_RESET
+    return ARC_PLAIN
+
+
+def _arrays_of(petrinet: PetriNet, marking: Marking, final_marking: Marking) -> dict[str, np.ndarray]:
+    strings = _Strings()
+    # levels in breadth-first order: (net, initial marking, final marking)
+    levels = [(petrinet, marking, final_marking)]
+    index: dict = {}
+    kind, ids, labels, titles, props, layout, child, blob = [], [], [], [], [], [], [], []
+    blobs: list[bytes] = []
+    level_nodes, level_name, level_kind, level_props, level_has_fm = [0], [], [], [], []
+    im_indptr, im_node, im_count = [0], [], []
+    fm_indptr, fm_node, fm_count = [0], [], []
+    arc_indptr, arc_node, arc_dir, arc_weight, arc_type, arc_props = [0], [], [], [], [], []
+    no_layout = (np.nan, np.nan, np.nan, np.nan)
+
+    k = 0
+    while k < len(levels):
+        net, im, fm = levels[k]
+        places = list(net.places)
+        transitions = list(net.transitions)
+        first = len(kind)
+        for i, node in enumerate(places + transitions, first):
+            index[node] = i
+        for p in places:
+            kind.append(KIND_PLACE)
+            ids.append(strings.intern(p.name))
+            labels.append(-1)
+            titles.append(strings.intern(p.properties.get(constants.PLACE_NAME_TAG)))
+            props.append(strings.intern(_dump_props(p.properties, (constants.PLACE_NAME_TAG,
+                                                                   constants.LAYOUT_INFORMATION_PETRI))))
+            lay = p.properties.get(constants.LAYOUT_INFORMATION_PETRI)
+            layout.append((*lay[0], *lay[1]) if lay else no_layout)
+            child.append(-1)
+            blob.append(-1)
+            arc_indptr.append(len(arc_node))
+        for t in transitions:
+            if isinstance(t, ExtendedTransition) and not t.is_materialized() and t.deferred_net.has_content():
+                # never built, stored as read
+                kind.append(KIND_EXTENDED)
+                child.append(-1)
+                blob.append(len(blobs))
+                blobs.append(t.deferred_net.serialized())
+            elif isinstance(t, ExtendedTransition):
+                kind.append(KIND_EXTENDED)
+                child.append(len(levels))
+                blob.append(-1)
+                levels.append((t.inner_net, t.init_marking, t.final_marking))
+            else:
+                kind.append(KIND_TRANSITION)
+                child.append(-1)
+                blob.append(-1)
+            ids.append(strings.intern(t.name))
+            labels.append(strings.intern(t.label))
+            titles.append(strings.intern(t.properties.get(constants.TRANS_NAME_TAG)))
+            props.append(strings.intern(_dump_props(t.properties, (constants.TRANS_NAME_TAG,
+                                                                   constants.LAYOUT_INFORMATION_PETRI))))
+            lay = t.properties.get(constants.LAYOUT_INFORMATION_PETRI)
+            layout.append((*lay[0], *lay[1]) if lay else no_layout)
+            for direction, arcs in ((ARC_TO_TRANSITION, t.in_arcs), (ARC_TO_PLACE, t.out_arcs)):
+                for a in arcs:
+                    place = a.source if direction == ARC_TO_TRANSITION else a.target
+                    arc_node.append(index[place])
+                    arc_dir.append(direction)
+                    arc_weight.append(a.weight)
+                    arc_type.append(_arc_type(a))
+                    arc_props.append(strings.intern(_dump_props(a.properties, (petri_properties.ARCTYPE,))))
+            arc_indptr.append(len(arc_node))
+        level_nodes.append(len(kind))
+        level_name.append(strings.intern(net.name))
+        level_kind.append(_net_kind(net))
+        variables = net.properties.get(petri_properties.VARIABLES)
+        level_props.append(strings.intern(json.dumps(variables) if variables is not None else None))
+        # markings keep the places of their own level only, as the XML writers do: the markings of a drawn net
+        # also hold the places of its unwrapped inner nets
+        for p, n in (im or {}).items():
+            if first <= index.get(p, -1) < first + len(places):
+                im_node.append(index[p])
+                im_count.append(n)
+        im_indptr.append(len(im_node))
+        level_has_fm.append(fm is not None)
+        for p, n in (fm or {}).items():
+            if first <= index.get(p, -1) < first + len(places):
+                fm_node.append(index[p])
+                fm_count.append(n)
+        fm_indptr.append(len(fm_node))
+        k += 1
+
+    strings_offsets, strings_data = strings.arrays()
+    blobs_offsets = np.zeros(len(blobs) + 1, dtype='<i8')
+    np.cumsum([len(b) for b in blobs], out=blobs_offsets[1:])
+    values = {
+        'strings_offsets': strings_offsets, 'strings_data': strings_data,
+        'node_kind': kind, 'node_id': ids, 'node_label': labels, 'node_title': titles, 'node_props': props,
+        'node_layout': layout, 'node_child': child, 'node_blob': blob,
+        'blobs_offsets': blobs_offsets, 'blobs_data': np.frombuffer(b''.join(blobs), dtype='<u1'),
+        'arc_indptr': arc_indptr, 'arc_node': arc_node, 'arc_dir': arc_dir, 'arc_weight': arc_weight,
+        'arc_type': arc_type, 'arc_props': arc_props,
+        'level_nodes': level_nodes, 'level_name': level_name, 'level_kind': level_kind, 'level_props': level_props,
+        'level_has_fm': level_has_fm,
+        'im_indptr': im_indptr, 'im_node': im_node, 'im_count': im_count,
+        'fm_indptr': fm_indptr, 'fm_node': fm_node, 'fm_count': fm_count,
+    }
+    arrays = {name: np.asarray(values[name], dtype=dtype) for name, dtype in _ARRAYS.items()}
+    arrays['node_layout'] = arrays['node_layout'].reshape(-1, 4)
+    return arrays
+
+
+def export_net(petrinet, marking, output_filename, final_marking=None):
+    """
+    Writes a net with all its inner nets to the binary cache format.
+
+    Parameters
+    ----------
+    petrinet: net to export
+    marking: initial marking
+    output_filename: path of the file
+    final_marking: final marking (optional)
+
+    Returns
+    -------
+    None
+    """
+    # every built inner net and blob is read first, so a source mapping of the same file is not needed while
+    # it is rewritten
+    arrays = _arrays_of(petrinet, marking, final_marking)
+    directory = {}
+    offset = 0
+    for name, arr in arrays.items():
+        directory[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    head = json.dumps({'arrays': directory}).encode('utf-8')
+    start = -(-(len(MAGIC) + 12 + len(head)) // ALIGN) * ALIGN
+    with open(output_filename, 'wb') as F:
+        F.write(MAGIC + struct.pack('<IQ', VERSION, start) + head)
+        F.write(b'\0' * (start - F.tell()))
+        for name, arr in arrays.items():
+            F.write(arr.tobytes())
+            F.write(b'\0' * (-arr.nbytes % ALIGN))
+
+
+# readers whose file a net may still build levels from, see is_mapped
+_open_readers: 'weakref.WeakSet[_Reader]' = weakref.WeakSet()
+
+
+def is_mapped(path) -> bool:
+    # a net read from the file with import_net has inner nets not built yet, the file may not be removed
+    path = os.path.abspath(path)
+    return any(reader.path == path for reader in list(_open_readers))
+
+
+class _Reader:
+    """
+    Memory-mapped arrays of one file, shared by the deferred inner nets. The arrays are only read: levels built
+    from them keep their nodes in their own _Level, so a level may be built on any thread, also once for a net and
+    once more for its snapshot (see epnml.snapshot_net).
+    """
+
+    def __init__(self, path):
+        mm = np.memmap(path, dtype='<u1', mode='r')
+        if mm[:len(MAGIC)].tobytes() != MAGIC:
+            raise EPNMLException(f'Not a binary net file: {path}!')
+        version, start = struct.unpack('<IQ', mm[len(MAGIC):len(MAGIC) + 12].tobytes())
+        if version != VERSION:
+            raise EPNMLException(f'Unsupported binary net version {version}!')
+        directory = json.loads(mm[len(MAGIC) + 12:start].tobytes().rstrip(b'\0'))['arrays']
+        self.arrays = {}
+        for name, entry in directory.items():
+            dtype = np.dtype(entry['dtype'])
+            count = int(np.prod(entry['shape']))
+            begin = start + entry['offset']
+            # plain ndarray views of the mapping, the memmap subclass is slow to index
+            self.arrays[name] = mm[begin:begin + count * dtype.itemsize].view(np.ndarray).view(dtype) \
+                .reshape(entry['shape'])
+        self.data = memoryview(self.arrays['strings_data'])
+        self.path = os.path.abspath(path)
+        _open_readers.add(self)
+
+    def string(self, idx: int) -> Union[str, None]:
+        return self.strings(np.array([idx]))[0]
+
+    def strings(self, idx: np.ndarray) -> list[Union[str, None]]:
+        offsets = self.arrays['strings_offsets']
+        safe = np.maximum(idx, 0)
+        data = self.data
+        return [str(data[begin:end], 'utf-8') if i >= 0 else None
+                for i, begin, end in zip(idx.tolist(), offsets[safe].tolist(), offsets[safe + 1].tolist())]
+
+    def build(self, level: int, parent: Union['_Level', None]) -> tuple[PetriNet, Marking, Union[Marking, None]]:
+        a = self.arrays
+        string = self.string
+        start, end = int(a['level_nodes'][level]), int(a['level_nodes'][level + 1])
+        built = _Level(level, start, end, parent)
+        nodes = built.nodes
+        net = _NET_TYPES[int(a['level_kind'][level])](string(int(a['level_name'][level])))
+        variables = string(int(a['level_props'][level]))
+        if variables is not None:
+            net.properties[petri_properties.VARIABLES] = json.loads(variables)
+
+        kinds = a['node_kind'][start:end].tolist()
+        names = self.strings(a['node_id'][start:end])
+        labels = self.strings(a['node_label'][start:end])
+        titles = self.strings(a['node_title'][start:end])
+        props = self.strings(a['node_props'][start:end])
+        layout = a['node_layout'][start:end].tolist()
+        child = a['node_child'][start:end].tolist()
+        blob = a['node_blob'][start:end].tolist()
+        for i, kind in enumerate(kinds):
+            if kind == KIND_PLACE:
+                node = PetriNet.Place(names[i])
+                if titles[i] is not None:
+                    node.properties[constants.PLACE_NAME_TAG] = titles[i]
+                net.places.add(node)
+            else:
+                if kind == KIND_EXTENDED:
+                    node = ExtendedTransition(names[i], labels[i])
+                    if blob[i] >= 0:
+                        node.defer_net(_BinaryXml(self, built, blob[i]))
+                    else:
+                        node.defer_net(_BinaryBlock(self, child[i], built))
+                else:
+                    node = PetriNet.Transition(names[i], labels[i])
+                if titles[i] is not None:
+                    node.properties[constants.TRANS_NAME_TAG] = titles[i]
+                net.transitions.add(node)
+            x, y, w, h = layout[i]
+            if x == x:
+                node.properties[constants.LAYOUT_INFORMATION_PETRI] = ((x, y), (w, h))
+            if props[i] is not None:
+                node.properties.update(json.loads(props[i]))
+            nodes[i] = node
+
+        indptr = a['arc_indptr']
+        first, last = int(indptr[start]), int(indptr[end])
+        row_ends = (indptr[start + 1:end + 1] - first).tolist()
+        arc_node = a['arc_node'][first:last].tolist()
+        arc_dir = a['arc_dir'][first:last].tolist()
+        arc_weight = a['arc_weight'][first:last].tolist()
+        arc_type = a['arc_type'][first:last].tolist()
+        arc_props = self.strings(a['arc_props'][first:last])
+        j = 0
+        for i, row_end in enumerate(row_ends):
+            if j == row_end:
+                continue
+            t = nodes[i]
+            while j < row_end:
+                g = arc_node[j]
+                local = start <= g < end
+                p = nodes[g - start] if local else parent.node(g)
+                fr, to = (p, t) if arc_dir[j] == ARC_TO_TRANSITION else (t, p)
+                if arc_type[j] == ARC_INHIBITOR:
+                    arc = InhibitorNet.InhibitorArc(fr, to, arc_weight[j])
+                    arc.properties[petri_properties.ARCTYPE] = petri_properties.INHIBITOR_ARC
+                elif arc_type[j] == ARC_RESET:
+                    arc = ResetNet.ResetArc(fr, to, arc_weight[j])
+                    arc.properties[petri_properties.ARCTYPE] = petri_properties.RESET_ARC
+                else:
+                    arc = PetriNet.Arc(fr, to, arc_weight[j])
+                if arc_props[j] is not None:
+                    arc.properties.update(json.loads(arc_props[j]))
+                net.arcs.add(arc)
+                # an outer place does not know about arcs of inner nets
+                if local or fr is t:
+                    fr.out_arcs.add(arc)
+                if local or to is t:
+                    to.in_arcs.add(arc)
+                j += 1
+
+        im = Marking()
+        lo, hi = int(a['im_indptr'][level]), int(a['im_indptr'][level + 1])
+        for g, n in zip(a['im_node'][lo:hi].tolist(), a['im_count'][lo:hi].tolist()):
+            im[built.node(g)] = n
+        fm = None
+        if a['level_has_fm'][level]:
+            fm = Marking()
+            lo, hi = int(a['fm_indptr'][level]), int(a['fm_indptr'][level + 1])
+            for g, n in zip(a['fm_node'][lo:hi].tolist(), a['fm_count'][lo:hi].tolist()):
+                fm[built.node(g)] = n
+        return net, im, fm
+
+    def blob(self, idx: int) -> bytes:
+        offsets = self.arrays['blobs_offsets']
+        return self.arrays['blobs_data'][int(offsets[idx]):int(offsets[idx + 1])].tobytes()
+
+    def scope(self, built: '_Level') -> epnml._Scope:
+        # places of a built level for the blobs in it and below, entered on first need
+        if built.scope is None:
+            scope = epnml._Scope(self.scope(built.parent) if built.parent is not None else None)
+            kinds = self.arrays['node_kind'][built.start:built.end]
+            for i in np.flatnonzero(kinds == KIND_PLACE).tolist():
+                place = built.nodes[i]
+                scope.define(place.name, place)
+            built.scope = scope
+        return built.scope
+
+
+class _Level:
+    # nodes of a built level, by their number less start, and the level it is built in
+    __slots__ = ('level', 'start', 'end', 'nodes', 'parent', 'scope')
+
+    def __init__(self, level: int, start: int, end: int, parent: Union['_Level', None]):
+        self.level = level
+        self.start = start
+        self.end = end
+        self.nodes: list = [None] * (end - start)
+        self.parent = parent
+        # places for blobs in the level, see _Reader.scope
+        self.scope: Union[epnml._Scope, None] = None
+
+    def node(self, g: int):
+        # a node of this level or an enclosing one, places of inner arcs may be outer ones
+        level = self
+        while not level.start <= g < level.end:
+            level = level.parent
+        return level.nodes[g - level.start]
+
+
+class _BinaryBlock:
+    # deferred inner net of an extended transition, see ExtendedTransition.defer_net
+    def __init__(self, reader: _Reader, level: int, parent: _Level):
+        self.reader = reader
+        self.level = level
+        self.parent = parent
+
+    def build(self):
+        with _gc_paused():
+            return self.reader.build(self.level, self.parent)
+
+    def has_content(self) -> bool:
+        # no XML to write back, the net has to be built
+        return False
+
+    def content(self):
+        return None
+
+
+class _BinaryXml(epnml._DeferredNet):
+    # inner net stored as read from (E)PNML, see ExtendedTransition.defer_net
+    def __init__(self, reader: _Reader, level: _Level, blob: int):
+        self.reader = reader
+        self.level = level
+        self.blob = blob
+
+    @property
+    def source(self) -> bytes:
+        return self.reader.blob(self.blob)
+
+    @property
+    def scope(self) -> epnml._Scope:
+        return self.reader.scope(self.level)
+
+
+def import_net(input_file_path):
+    """
+    Opens a net written by export_net. Arrays are memory-mapped, inner nets are built on first access.
+
+    Parameters
+    ----------
+    input_file_path: path of the file
+
+    Returns
+    -------
+    net, initial marking, final marking
+    """
+    reader = _Reader(input_file_path)
+    with _gc_paused():
+        return reader.build(0, None)
+
+
+def epnml_to_binary(input_file_path, output_file_path):
+    # round-trip converters, the binary file keeps everything the (E)PNML writers keep
+    net, im, fm = epnml.import_net_stream(input_file_path)
+    export_net(net, im, output_file_path, fm)
+
+
+def binary_to_epnml(input_file_path, output_file_path):
+    net, im, fm = import_net(input_file_path)
+    epnml.export_net(net, im, output_file_path, fm)
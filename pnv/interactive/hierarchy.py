@@ -1,14 +1,21 @@
-from typing import Union
+from typing import Union, Callable
 
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 
 
 class HierNode:
-    def __init__(self, name: str, parent: 'HierNode', value):
+    # item data of make_tree holding the node
+    ROLE = Qt.UserRole + 1
+
+    def __init__(self, name: str, parent: 'HierNode', value, expand: Callable[['HierNode'], None] = None):
         self.name = name
         self.value = value
         self.__level = 0
         self.__children: list[HierNode] = []
+        # expand(node) adds the children on the first call of children(), so nodes of inner nets not built yet
+        # are made when the node is walked into
+        self.__expand = expand
         self.parent: Union[HierNode, None] = parent
         if self.parent:
             self.parent.add_child(self)
@@ -16,7 +23,13 @@ class HierNode:
     def level(self):
         return self.__level
 
+    def is_expanded(self) -> bool:
+        return self.__expand is None
+
     def children(self):
+        if self.__expand is not None:
+            expand, self.__expand = self.__expand, None
+            expand(self)
         return self.__children
 
     def add_child(self, child: 'HierNode'):
@@ -31,13 +44,26 @@ class HierNode:
         if root is None and hitem is None:
             root = self
             hitem = QStandardItemModel()
-        for c in root.__children:
+        for c in root.children():
             c_item = QStandardItem(c.name)
+            c_item.setData(c, HierNode.ROLE)
             hitem.appendRow(c_item)
-            if len(c.__children) != 0:
+            if not c.is_expanded():
+                # a placeholder row, replaced by the children when the item is expanded, see fetch_tree
+                c_item.appendRow(QStandardItem())
+            elif len(c.__children) != 0:
                 self.make_tree(c, c_item)
         return hitem
 
+    @staticmethod
+    def fetch_tree(item: QStandardItem):
+        # fills an item of make_tree on its expansion
+        node: HierNode = item.data(HierNode.ROLE)
+        if node is None or item.rowCount() != 1 or item.child(0).data(HierNode.ROLE) is not None:
+            return
+        item.removeRow(0)
+        node.make_tree(node, item)
+
 
 class Hierarchical:
     def __init__(self):
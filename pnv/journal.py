@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+from typing import Union, Optional, TYPE_CHECKING
+
+from pnv.utils import PnvConfig
+
+if TYPE_CHECKING:
+    from pm4py import PetriNet, Marking
+
+# one record per line: {"op": ..., args}, the first line is the header
+Record = dict
+
+
+class PnvJournal:
+    """
+    Append-only log of the edits of one tab, written next to the config file. A record only holds the edit, so an
+    append costs the same on any net. Records are flushed on append and synced to disk every journal_sync_ms.
+    On the next start the records are replayed on top of the file, see PnvJournalStore.pending and replay.
+    """
+
+    def __init__(self, file: Path, net_path: str):
+        self.file = file
+        self.net_path = net_path
+        self.closed = False
+        self.__synced = time.monotonic()
+        self.__out = open(file, 'ab')
+        if self.__out.tell() == 0:
+            self.__write(PnvJournalStore.header(net_path))
+
+    def __write(self, record: Record):
+        self.__out.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.__out.flush()
+
+    def append(self, op: str, **args):
+        if self.closed:
+            return
+        try:
+            self.__write({'op': op, **args})
+            now = time.monotonic()
+            if (now - self.__synced) * 1000 >= PnvConfig.INSTANCE.journal_sync_ms:
+                os.fsync(self.__out.fileno())
+                self.__synced = now
+        except OSError:
+            # losing the journal must not stop editing
+            traceback.print_exc()
+
+    def checkpoint(self) -> int:
+        # records up to here are in the snapshot of a save
+        return self.__out.tell()
+
+    def saved(self, net_path: str, offset: int):
+        """
+        Called once a save of the records before offset is written to net_path: the journal starts over from the new
+        file and keeps the records made meanwhile.
+        """
+        if self.__out.closed:
+            return
+        try:
+            self.__out.flush()
+            with open(self.file, 'rb') as F:
+                F.seek(offset)
+                rest = F.read()
+            self.__out.close()
+            file = PnvJournalStore.INSTANCE.file_of(net_path)
+            tmp = file.with_suffix('.tmp')
+            with open(tmp, 'wb') as F:
+                F.write(json.dumps(PnvJournalStore.header(net_path), ensure_ascii=False).encode('utf-8') + b'\n')
+                F.write(rest)
+                F.flush()
+                os.fsync(F.fileno())
+            os.replace(tmp, file)
+            if file != self.file:
+                # saved under another name
+                self.file.unlink(missing_ok=True)
+            self.file = file
+            self.net_path = net_path
+            self.__out = open(file, 'ab')
+        except OSError:
+            traceback.print_exc()
+            return
+        if self.closed and len(rest) == 0:
+            self.discard()
+
+    def close(self, discard: bool):
+        # discard: the edits are saved or given up, otherwise a save of them is still running
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.__out.flush()
+            os.fsync(self.__out.fileno())
+        except OSError:
+            pass
+        if discard:
+            self.discard()
+
+    def discard(self):
+        self.closed = True
+        self.__out.close()
+        try:
+            self.file.unlink(missing_ok=True)
+        except OSError:
+            traceback.print_exc()
+
+
+class PnvJournalStore:
+    """
+    Journals of the opened files, one per file path.
+    """
+    FOLDER = 'journal'
+    VERSION = 1
+    JOURNAL_FORMAT = '.jsonl'
+
+    INSTANCE: 'PnvJournalStore' = None
+
+    def __init__(self, folder: Path):
+        self.folder = folder / PnvJournalStore.FOLDER
+        if not self.folder.exists():
+            self.folder.mkdir()
+
+    @staticmethod
+    def fingerprint(net_path: str) -> Union[list[int], None]:
+        try:
+            st = os.stat(net_path)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    @staticmethod
+    def header(net_path: str) -> Record:
+        # the file the records apply to, a file changed since then makes them stale
+        return {
+            'journal': PnvJournalStore.VERSION,
+            'path': os.path.abspath(net_path),
+            'file': PnvJournalStore.fingerprint(net_path),
+        }
+
+    def file_of(self, net_path: str) -> Path:
+        key = hashlib.sha256(os.path.abspath(net_path).encode('utf-8')).hexdigest()
+        return self.folder / (key + PnvJournalStore.JOURNAL_FORMAT)
+
+    def pending(self, net_path: str) -> list[Record]:
+        # edits left by a session that did not save them, stale or broken journals are dropped
+        file = self.file_of(net_path)
+        if not file.exists():
+            return []
+        records = []
+        try:
+            with open(file, 'rb') as F:
+                head = json.loads(F.readline())
+                if head != PnvJournalStore.header(net_path):
+                    raise ValueError(f'Stale journal {file}!')
+                for line in F:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # the last record may be cut by the crash
+                        break
+        except (OSError, ValueError):
+            traceback.print_exc()
+            file.unlink(missing_ok=True)
+            return []
+        return records
+
+    def open(self, net_path: str, keep: bool) -> PnvJournal:
+        # keep: the pending records were replayed and are still not in the file
+        file = self.file_of(net_path)
+        if not keep:
+            file.unlink(missing_ok=True)
+        return PnvJournal(file, net_path)
+
+
+def _node_index(net: 'PetriNet', nodes: dict):
+    for n in (*net.places, *net.transitions):
+        nodes[n.name] = n
+
+
+def _deep_node_index(net: 'PetriNet', nodes: dict):
+    from pnv.importer.epnml import ExtendedTransition
+    _node_index(net, nodes)
+    for t in net.transitions:
+        if isinstance(t, ExtendedTransition):
+            _deep_node_index(t.inner_net, nodes)
+
+
+def _relayout(node, x, y):
+    lay = node.properties['layout_information_petri']
+    node.properties['layout_information_petri'] = ((x, y), lay[1])
+
+
+def _remove_arc(net: 'PetriNet', arc):
+    arc.source.out_arcs.discard(arc)
+    arc.target.in_arcs.discard(arc)
+    net.arcs.discard(arc)
+
+
+def replay(records: list[Record], net: 'PetriNet', init_marks: Optional['Marking'],
+           fin_marks: Optional['Marking']) -> tuple[Optional['Marking'], Optional['Marking'], int]:
+    """
+    Applies the records to a net read from the file they were written for, the way PnvDrawer applied them.
+
+    Returns
+    -------
+    initial marking, final marking, number of records that could not be applied
+    """
+    from pm4py import PetriNet, Marking
+    from pnv.importer.epnml import ExtendedTransition
+    from pnv.render import PnvDrawer
+
+    if init_marks is None:
+        init_marks = Marking()
+    if fin_marks is None:
+        fin_marks = Marking()
+    nodes = {}
+    _node_index(net, nodes)
+    deep = False
+
+    def node(name):
+        nonlocal deep
+        if name not in nodes and not deep:
+            # inner nets are only opened for records that reach into them
+            deep = True
+            _deep_node_index(net, nodes)
+        return nodes[name]
+
+    size = (PnvDrawer.GRAPHICS_WIDTH, PnvDrawer.GRAPHICS_WIDTH)
+    failed = 0
+    for r in records:
+        try:
+            op = r['op']
+            if op == 'place_create':
+                p = PetriNet.Place(r['name'])
+                p.properties['layout_information_petri'] = ((r['x'], r['y']), size)
+                net.places.add(p)
+                nodes[p.name] = p
+            elif op == 'transition_create':
+                t = PetriNet.Transition(r['name'])
+                t.properties['layout_information_petri'] = ((r['x'], r['y']), size)
+                net.transitions.add(t)
+                nodes[t.name] = t
+            elif op == 'arc_create':
+                arc = PetriNet.Arc(node(r['source']), node(r['target']))
+                net.arcs.add(arc)
+                arc.source.out_arcs.add(arc)
+                arc.target.in_arcs.add(arc)
+            elif op == 'arc_remove':
+                source, target = node(r['source']), node(r['target'])
+                arc, *_ = [a for a in source.out_arcs if a.target is target]
+                _remove_arc(net, arc)
+            elif op == 'node_remove':
+                n = node(r['name'])
+                for arc in [*n.in_arcs, *n.out_arcs]:
+                    _remove_arc(net, arc)
+                net.places.discard(n)
+                net.transitions.discard(n)
+                init_marks.pop(n, None)
+                fin_marks.pop(n, None)
+                del nodes[n.name]
+            elif op == 'move':
+                for name, x, y in r['nodes']:
+                    _relayout(node(name), x, y)
+            elif op == 'tokens':
+                p = node(r['name'])
+                if r['count'] > 0:
+                    init_marks[p] = r['count']
+                else:
+                    init_marks.pop(p, None)
+            elif op == 'final':
+                p = node(r['name'])
+                if r['final']:
+                    fin_marks[p] = 1
+                else:
+                    fin_marks.pop(p, None)
+            elif op == 'unwrap':
+                # see PnvDrawer.subnet_unwrap_mutate, positions of the inner nodes follow as a move
+                extr = node(r['name'])
+                inner = extr.inner_net
+                for arc in [*extr.in_arcs, *extr.out_arcs]:
+                    _remove_arc(net, arc)
+                net.transitions.remove(extr)
+                for p in inner.places:
+                    net.places.add(p)
+                for t in inner.transitions:
+                    net.transitions.add(t)
+                for arc in inner.arcs:
+                    net.arcs.add(arc)
+                    arc.source.out_arcs.add(arc)
+                    arc.target.in_arcs.add(arc)
+                _node_index(inner, nodes)
+            elif op == 'wrap':
+                # see PnvDrawer.subnet_wrap_mutate
+                wrapped = {node(name) for name in r['nodes']}
+                arcs = set()
+                for n in wrapped:
+                    arcs |= n.in_arcs | n.out_arcs
+                inner = PetriNet(r['net'], {n for n in wrapped if isinstance(n, PetriNet.Place)},
+                                 {n for n in wrapped if isinstance(n, PetriNet.Transition)}, set(arcs))
+                outer_to, outer_from = [], []
+                for arc in arcs:
+                    if arc.target not in wrapped:
+                        outer_to.append(arc.target)
+                        arc.target.in_arcs.discard(arc)
+                    elif arc.source not in wrapped:
+                        outer_from.append(arc.source)
+                        arc.source.out_arcs.discard(arc)
+                    net.arcs.discard(arc)
+                for n in wrapped:
+                    net.places.discard(n)
+                    net.transitions.discard(n)
+                extr = ExtendedTransition(r['name'], r['label'])
+                extr.inject_net(inner)
+                extr.properties['layout_information_petri'] = ((r['x'], r['y']), size)
+                for n in set(outer_to):
+                    arc = PetriNet.Arc(extr, n)
+                    n.in_arcs.add(arc)
+                    extr.out_arcs.add(arc)
+                    net.arcs.add(arc)
+                for n in set(outer_from):
+                    arc = PetriNet.Arc(n, extr)
+                    n.out_arcs.add(arc)
+                    extr.in_arcs.add(arc)
+                    net.arcs.add(arc)
+                net.transitions.add(extr)
+                nodes[extr.name] = extr
+            else:
+                raise ValueError(f'Unknown journal record {op}!')
+        except Exception:
+            traceback.print_exc()
+            failed += 1
+    for p in fin_marks:
+        # final places keep no tokens, see PnvViewer.retrieve_markings
+        init_marks.pop(p, None)
+    return init_marks, fin_marks, failed
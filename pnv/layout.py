@@ -0,0 +1,811 @@
+import multiprocessing
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import time
+from typing import Union, Tuple, Optional, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    # not imported at runtime, processes of component_layout start without pm4py
+    from pm4py import PetriNet
+
+# layouts of nets without a scene: loading processes, the batch converter and PnvDrawer share them
+
+Layout = Tuple[Tuple[int, int], Tuple[int, int]]
+
+GRAPHICS_WIDTH = 40
+LAYOUT_KEY = 'layout_information_petri'
+IGRAPH_GEN_MODE_AUTO = 'auto'
+# every connected component laid out on its own and packed, see component_layout
+IGRAPH_GEN_MODE_COMPONENTS = 'components'
+# smaller nets are laid out in the calling process
+COMPONENTS_PARALLEL_MIN = 5000
+COMPONENTS_CHUNK_MIN = 500
+# coarsened graphs laid out level by level from the coarsest one, see multilevel_layout
+IGRAPH_GEN_MODE_MULTILEVEL = 'multilevel'
+# coarsening stops at so many vertices or when a level hardly shrinks the graph
+MULTILEVEL_COARSEST = 50
+MULTILEVEL_MIN_SHRINK = 0.9
+# vertices merged into a cluster at most
+MULTILEVEL_CLUSTER_MAX = 4
+# force steps of a level: about so many vertex steps, within the bounds
+MULTILEVEL_STEP_BUDGET = 4_000_000
+MULTILEVEL_STEPS = (15, 60)
+# opening angle of the repulsion of force_step, steps of whole nets take a coarser one than relaxations
+MULTILEVEL_THETA = 1.2
+# cells of quadtree_repulsion are taken as a whole once seen under this angle (side / distance) at most,
+# 0 makes the repulsion exact; vertices per leaf cell, about
+BARNES_HUT_THETA = 1.0
+BARNES_HUT_LEAF = 8
+# levels of the quadtree at most, vertices closer than a 2^depth-th of the extent share a leaf
+BARNES_HUT_DEPTH = 24
+# free space kept between node rectangles by remove_overlaps, and its rounds at most
+OVERLAP_GAP = GRAPHICS_WIDTH / 4
+OVERLAP_ROUNDS = 50
+# pairs up to so many of their separations apart are kept apart as well, pushes then go on to them
+OVERLAP_REACH = 1.25
+# vectorized push steps before the rest of a chain is swept, see _push
+OVERLAP_PUSH_STEPS = 8
+# seconds a step of LayoutRefinement aims at, the layout can be shown and stopped between steps
+REFINE_STEP_S = 0.1
+# igraph draws from a single generator of the process, multilevel_layout seeds it while holding this
+_IGRAPH_RANDOM = threading.Lock()
+
+
+def has_layout(obj) -> bool:
+    return hasattr(obj, 'properties') and (LAYOUT_KEY in obj.properties) \
+        and isinstance(obj.properties[LAYOUT_KEY], tuple)
+
+
+def has_full_layout(pn: 'PetriNet') -> bool:
+    return all(has_layout(obj) for obj in [*pn.places, *pn.transitions])
+
+
+def inject_layout(obj, layout: Layout):
+    if has_layout(obj):
+        raise ValueError("Layout injection can not be applied to object containing layout!")
+    if not hasattr(obj, 'properties'):
+        setattr(obj, 'properties', dict())
+    if not (LAYOUT_KEY in obj.properties):
+        obj.properties[LAYOUT_KEY] = layout
+
+
+def generate_layout(pn: 'PetriNet', mode: str = IGRAPH_GEN_MODE_AUTO, workers: Optional[int] = None):
+    """
+    Parameters
+    ----------
+    pn: net, its places and transitions get a layout
+    mode: igraph layout algorithm, IGRAPH_GEN_MODE_COMPONENTS or IGRAPH_GEN_MODE_MULTILEVEL
+    workers: processes of the components mode, None for one per core
+    """
+    nodes, edges = net_graph(pn)
+    if len(nodes) == 0:
+        return
+    coords = layout_coords(len(nodes), edges, mode, workers)
+    # injection
+    for node, (x, y) in zip(nodes, coords.tolist()):
+        lay = ((x, y), (GRAPHICS_WIDTH, GRAPHICS_WIDTH))
+        inject_layout(node, lay)
+
+
+def net_graph(pn: 'PetriNet') -> tuple[list[Union['PetriNet.Place', 'PetriNet.Transition']], list[tuple[int, int]]]:
+    # places and transitions in vertex order, arcs between them as vertex pairs
+    nodes = [*pn.places, *pn.transitions]
+    index = {obj: i for i, obj in enumerate(nodes)}
+    edges = [(index[a.source], index[a.target]) for a in pn.arcs if (a.source in index and a.target in index)]
+    return nodes, edges
+
+
+def layout_coords(n_vertices: int, edges, mode: str, workers: Optional[int] = None) -> np.ndarray:
+    # positions in the scene, see generate_layout
+    if mode == IGRAPH_GEN_MODE_COMPONENTS:
+        return component_layout(n_vertices, edges, workers)
+    if mode == IGRAPH_GEN_MODE_MULTILEVEL:
+        return compact_layout(multilevel_layout(n_vertices, edges))
+    return scaled_layout(n_vertices, edges, mode)
+
+
+def anchored_layout(n_vertices: int, edges, center: tuple[float, float], anchors: list[tuple[int, float, float]],
+                    mode: str = IGRAPH_GEN_MODE_AUTO) -> np.ndarray:
+    """
+    Layout of a net put in place of a node of a drawn one: centered on the node and turned, or mirrored, so its
+    vertices connected to drawn nodes face them as much as possible. Only the net itself is laid out, compactly
+    (see compact_layout) as the drawn nodes around it are pushed aside.
+
+    Parameters
+    ----------
+    center: position of the replaced node
+    anchors: (vertex, x, y) for every arc between a vertex and a drawn node at (x, y)
+    """
+    from igraph import Graph
+    if mode == IGRAPH_GEN_MODE_MULTILEVEL:
+        coords = multilevel_layout(n_vertices, edges)
+    else:
+        if mode == IGRAPH_GEN_MODE_COMPONENTS:
+            mode = IGRAPH_GEN_MODE_AUTO
+        coords = np.array(Graph(n_vertices, edges).layout(layout=mode).coords, dtype=float).reshape(n_vertices, -1)
+        coords = coords[:, :2]
+    coords = compact_layout(coords)
+    coords -= coords.mean(axis=0)
+    if anchors:
+        vertices = np.array([a[0] for a in anchors], dtype=np.int64)
+        targets = np.array([a[1:] for a in anchors], dtype=float) - center
+        coords = orient(coords, coords[vertices], targets)
+        # turned squares may overlap again
+        remove_overlaps(coords)
+    return coords + center
+
+
+def compact_layout(coords: np.ndarray) -> np.ndarray:
+    """
+    igraph units to the scene by the typical distance instead of the smallest one, see scale_layout: vertices
+    are two widths from their nearest neighbour on median, the few overlapping are moved apart.
+    """
+    from scipy.spatial import cKDTree
+    unique = np.unique(coords, axis=0)
+    if len(unique) >= 2:
+        distances, _ = cKDTree(unique).query(unique, k=2)
+        coords = coords * (2 * GRAPHICS_WIDTH / max(float(np.median(distances[:, 1])), 1e-12))
+    spread_coincident(coords)
+    remove_overlaps(coords)
+    return coords
+
+
+def remove_overlaps(coords: np.ndarray, sizes=GRAPHICS_WIDTH, fixed: Optional[np.ndarray] = None,
+                    gap: float = OVERLAP_GAP, rounds: int = OVERLAP_ROUNDS) -> int:
+    """
+    Node rectangles overlapping, or closer than gap, are moved apart in place, in rounds of constraints as in
+    scan-line overlap removal: every pair of close rectangles has to stay apart on one axis, the one it overlaps
+    less on, in its current order on it. Per axis the constraints are met by pushing every rectangle past the ones
+    before it, and also back past the ones after it, and taking the middle of both, each in one sweep over the
+    rectangles sorted on the axis. Pairs come from a k-d tree in the maximum norm, a round is O(n log n); layouts
+    without overlaps cost a single query.
+
+    Parameters
+    ----------
+    coords: centers of the rectangles, moved in place
+    sizes: (width, height) of every rectangle, or the width of all of them as squares
+    fixed: mask of the rectangles that stay and only push the others (optional)
+
+    Returns
+    -------
+    pairs still overlapping after the rounds
+    """
+    from scipy.spatial import cKDTree
+    n = len(coords)
+    if n < 2:
+        return 0
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), (n, 2))
+    fixed = np.zeros(n, dtype=bool) if fixed is None else np.asarray(fixed, dtype=bool)
+    reach = (float(sizes.max()) + gap) * OVERLAP_REACH
+    for done in range(rounds + 1):
+        # the first round looks for overlaps only, most layouts have none
+        pairs = cKDTree(coords).query_pairs(reach if done else reach / OVERLAP_REACH, p=np.inf,
+                                            output_type='ndarray')
+        if len(pairs) == 0:
+            return 0
+        pairs = pairs[~(fixed[pairs[:, 0]] & fixed[pairs[:, 1]])]
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = coords[j] - coords[i]
+        need = (sizes[i] + sizes[j]) / 2 + gap
+        overlap = need - np.abs(d)
+        # rounding leaves separated pairs a hair short
+        hits = int((overlap > 1e-6).all(axis=1).sum())
+        if hits == 0 or done == rounds:
+            return hits
+        axis = np.argmin(overlap, axis=1)
+        for a in (0, 1):
+            on = axis == a
+            # pairs at the same position on the axis keep the order of their indices
+            back = d[on, a] < 0
+            lo, hi = np.where(back, j[on], i[on]), np.where(back, i[on], j[on])
+            x = coords[:, a].copy()
+            ahead = _push(x, lo, hi, need[on, a], fixed, True)
+            behind = _push(x, lo, hi, need[on, a], fixed, False)
+            coords[:, a] = (ahead + behind) / 2
+    return 0
+
+
+def _push(x: np.ndarray, lo: np.ndarray, hi: np.ndarray, need: np.ndarray, fixed: np.ndarray, up: bool) \
+        -> np.ndarray:
+    # x[hi] - x[lo] >= need by moving only up, or only down, as little as possible: a longest path. Short chains of
+    # pushes settle in a few vectorized steps, longer ones are finished by a sweep
+    y = x
+    for _ in range(OVERLAP_PUSH_STEPS):
+        z = y.copy()
+        if up:
+            np.maximum.at(z, hi, y[lo] + need)
+        else:
+            np.minimum.at(z, lo, y[hi] - need)
+        z[fixed] = x[fixed]
+        if np.array_equal(z, y):
+            return y
+        y = z
+    return _sweep(x, y, lo, hi, need, fixed, up)
+
+
+def _sweep(x: np.ndarray, y: np.ndarray, lo: np.ndarray, hi: np.ndarray, need: np.ndarray, fixed: np.ndarray,
+           up: bool) -> np.ndarray:
+    # the longest path of _push from y, pushed part of the way already, in one pass over the rectangles in their
+    # order on the axis in x, every constraint leads forward in it: O(n log n + pairs) whatever the chains
+    nodes = np.unique(np.concatenate((lo, hi)))
+    order = nodes[np.lexsort((nodes, x[nodes]))]
+    # the moved end of every constraint and the one it is pushed by
+    moved, by = (hi, lo) if up else (lo, hi)
+    if not up:
+        order = order[::-1]
+    rank = np.empty(len(x), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    grouped = np.argsort(rank[moved], kind='stable')
+    bounds = np.searchsorted(rank[moved][grouped], np.arange(len(order) + 1)).tolist()
+    sources = by[grouped].tolist()
+    shifts = (need[grouped] if up else -need[grouped]).tolist()
+    pos = y.tolist()
+    pinned = fixed.tolist()
+    for k, v in enumerate(order.tolist()):
+        first, last = bounds[k], bounds[k + 1]
+        if first == last or pinned[v]:
+            continue
+        if up:
+            pos[v] = max(pos[v], max(pos[sources[e]] + shifts[e] for e in range(first, last)))
+        else:
+            pos[v] = min(pos[v], min(pos[sources[e]] + shifts[e] for e in range(first, last)))
+    return np.array(pos)
+
+
+def orient(coords: np.ndarray, points: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    # rotation about (0, 0), mirrored or not, taking points closest to targets (least squares)
+    best, best_error = coords, None
+    for mirror in (1.0, -1.0):
+        p = points * (1.0, mirror)
+        angle = np.arctan2((p[:, 0] * targets[:, 1] - p[:, 1] * targets[:, 0]).sum(),
+                           (p * targets).sum())
+        rotation = np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
+        error = ((p @ rotation - targets) ** 2).sum()
+        if best_error is None or error < best_error:
+            best, best_error = (coords * (1.0, mirror)) @ rotation, error
+    return best
+
+
+def push_aside(points: np.ndarray, center: tuple[float, float], box: tuple[float, float, float, float],
+               margin: float) -> np.ndarray:
+    """
+    Points inside box (min x, min y, max x, max y) are moved away from center, along the line through it, to
+    margin outside of the box. Points outside stay.
+    """
+    points = np.array(points, dtype=float).reshape(-1, 2)
+    minx, miny, maxx, maxy = box
+    inside = (points[:, 0] >= minx) & (points[:, 0] <= maxx) & (points[:, 1] >= miny) & (points[:, 1] <= maxy)
+    d = points[inside] - center
+    # points on the center go right
+    d[(d == 0).all(axis=1)] = (1.0, 0.0)
+    # distance to the box edge in units of d, per axis
+    with np.errstate(divide='ignore', invalid='ignore'):
+        edge = np.where(d > 0, (maxx, maxy), (minx, miny)) - np.asarray(center, dtype=float)
+        t = np.where(d != 0, edge / d, np.inf).min(axis=1)[:, None]
+    unit = d / np.linalg.norm(d, axis=1)[:, None]
+    points[inside] = center + d * t + unit * margin
+    return points
+
+
+def scaled_layout(n_vertices: int, edges, mode: str) -> np.ndarray:
+    # igraph is only needed by nets without layout, not imported with the renderer
+    from igraph import Graph
+    layout = Graph(n_vertices, edges).layout(layout=mode)
+    return scale_layout(np.array(layout.coords, dtype=float).reshape(n_vertices, -1)[:, :2])
+
+
+def scale_layout(coords: np.ndarray) -> np.ndarray:
+    # igraph units to the scene: the closest vertices end up two widths apart
+    nearest = min_distance(coords)
+    min_dist = GRAPHICS_WIDTH if nearest is None else min(GRAPHICS_WIDTH, nearest)
+    coords *= GRAPHICS_WIDTH / min_dist * 2
+    spread_coincident(coords)
+    remove_overlaps(coords)
+    return coords
+
+
+def _layout_components(components: list[tuple[int, np.ndarray]], mode: str) -> list[np.ndarray]:
+    # runs in a worker process of component_layout: coordinates of every component, moved to start at (0, 0)
+    out = []
+    for n_vertices, edges in components:
+        coords = scaled_layout(n_vertices, edges, mode) if n_vertices > 1 else np.zeros((1, 2))
+        out.append(coords - coords.min(axis=0))
+    return out
+
+
+def component_layout(n_vertices: int, edges, workers: Optional[int] = None) -> np.ndarray:
+    """
+    Lays out every weakly connected component on its own, in a process pool for big nets, and packs the results
+    into shelves of a roughly square rectangle.
+    """
+    from igraph import Graph
+    membership = np.array(Graph(n_vertices, edges).connected_components(mode='weak').membership, dtype=np.int64)
+    sizes = np.bincount(membership)
+    # vertices of a component are contiguous in order, their local indices are their ranks in it
+    order = np.argsort(membership, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    local = np.empty(n_vertices, dtype=np.int64)
+    local[order] = np.arange(n_vertices) - starts[membership[order]]
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    edge_comp = membership[edges[:, 0]]
+    edge_order = np.argsort(edge_comp, kind='stable')
+    edge_bounds = np.searchsorted(edge_comp[edge_order], np.arange(len(sizes) + 1))
+    local_edges = local[edges[edge_order]]
+    components = [(int(sizes[c]), local_edges[edge_bounds[c]:edge_bounds[c + 1]]) for c in range(len(sizes))]
+
+    # biggest first, in chunks of about the same number of vertices
+    by_size = sorted(range(len(sizes)), key=lambda c: -sizes[c])
+    if workers is None:
+        workers = os.cpu_count() or 1
+    parallel = workers > 1 and n_vertices >= COMPONENTS_PARALLEL_MIN and len(sizes) > 1
+    chunk_size = max(COMPONENTS_CHUNK_MIN, n_vertices // (workers * 4)) if parallel else n_vertices
+    chunks, chunk, filled = [], [], 0
+    for c in by_size:
+        chunk.append(c)
+        filled += sizes[c]
+        if filled >= chunk_size:
+            chunks.append(chunk)
+            chunk, filled = [], 0
+    if chunk:
+        chunks.append(chunk)
+    laid: dict[int, np.ndarray] = {}
+    if parallel and len(chunks) > 1:
+        # spawned like the loading pool, the caller may be a Qt application
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(min(workers, len(chunks)), mp_context=context) as pool:
+            futures = {pool.submit(_layout_components, [components[c] for c in chunk], IGRAPH_GEN_MODE_AUTO):
+                       chunk for chunk in chunks}
+            for future, chunk in futures.items():
+                laid.update(zip(chunk, future.result()))
+    else:
+        for chunk in chunks:
+            laid.update(zip(chunk, _layout_components([components[c] for c in chunk], IGRAPH_GEN_MODE_AUTO)))
+
+    offsets = pack_shelves([laid[c].max(axis=0) for c in range(len(sizes))], 2 * GRAPHICS_WIDTH)
+    coords = np.empty((n_vertices, 2))
+    for c in range(len(sizes)):
+        coords[order[starts[c]:starts[c] + sizes[c]]] = laid[c] + offsets[c]
+    return coords
+
+
+def pack_shelves(boxes: list[np.ndarray], gap: float) -> np.ndarray:
+    """
+    Shelf packing: boxes from the tallest on, left to right on shelves of a rectangle about as wide as it is high.
+
+    Parameters
+    ----------
+    boxes: (width, height) of every box
+    gap: space between boxes
+
+    Returns
+    -------
+    (x, y) of the top left corner of every box
+    """
+    sizes = np.array(boxes, dtype=float).reshape(-1, 2) + gap
+    width = max(float(np.sqrt((sizes[:, 0] * sizes[:, 1]).sum())), float(sizes[:, 0].max()))
+    offsets = np.zeros_like(sizes)
+    x = y = shelf = 0.0
+    for i in np.argsort(-sizes[:, 1], kind='stable'):
+        w, h = sizes[i]
+        if x > 0 and x + w > width:
+            x, y, shelf = 0.0, y + shelf, 0.0
+        offsets[i] = x, y
+        x += w
+        shelf = max(shelf, h)
+    return offsets
+
+
+def multilevel_layout(n_vertices: int, edges, seed: int = 0) -> np.ndarray:
+    """
+    Multilevel force directed layout for nets too big for igraph: the graph is coarsened by matching
+    (see coarsen) down to a few vertices, the coarsest graph is laid out by igraph, then every finer level starts
+    from the positions of its clusters and is refined by force steps (see force_step).
+
+    Returns
+    -------
+    positions in units of the ideal edge length, see compact_layout for the scene
+    """
+    import igraph
+    rng = np.random.default_rng(seed)
+    levels = [undirected_edges(n_vertices, edges)]
+    clusterings = []
+    n = n_vertices
+    while n > MULTILEVEL_COARSEST and len(levels[-1]) > 0:
+        clusters, n_coarse, coarse_edges = coarsen(n, levels[-1], rng)
+        if n_coarse > n * MULTILEVEL_MIN_SHRINK:
+            break
+        clusterings.append(clusters)
+        levels.append(coarse_edges)
+        n = n_coarse
+
+    if n <= MULTILEVEL_COARSEST and len(levels[-1]) > 0:
+        start = rng.random((n, 2)) * np.sqrt(n)
+        graph = igraph.Graph(n, levels[-1].tolist())
+        with _IGRAPH_RANDOM:
+            igraph.set_random_number_generator(random.Random(int(rng.integers(1 << 32))))
+            try:
+                coords = np.array(graph.layout_fruchterman_reingold(seed=start.tolist()).coords, dtype=float)
+            finally:
+                igraph.set_random_number_generator(random)
+        lengths = np.linalg.norm(coords[levels[-1][:, 0]] - coords[levels[-1][:, 1]], axis=1)
+        coords /= max(float(np.median(lengths)), 1e-12)
+    else:
+        # hardly any edges left to coarsen by, e.g. many small components: forces do it all
+        coords = rng.random((n, 2)) * np.sqrt(n)
+    coords = refine_level(coords, levels[-1], rng, start_temp=max(1.0, np.sqrt(n) / 4))
+    for clusters, fine_edges in zip(reversed(clusterings), reversed(levels[:-1])):
+        # members around the position of their cluster, in an area growing with their number
+        scale = np.sqrt(len(clusters) / len(coords))
+        coords = coords[clusters] * scale + (rng.random((len(clusters), 2)) - 0.5)
+        coords = refine_level(coords, fine_edges, rng, start_temp=1.0)
+    return coords
+
+
+def undirected_edges(n_vertices: int, edges) -> np.ndarray:
+    # unique (u, v) pairs with u < v, without loops
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    edges = np.sort(edges[edges[:, 0] != edges[:, 1]], axis=1)
+    keys = np.unique(edges[:, 0] * n_vertices + edges[:, 1])
+    return np.stack((keys // n_vertices, keys % n_vertices), axis=1)
+
+
+def coarsen(n_vertices: int, edges: np.ndarray, rng: np.random.Generator) -> tuple[np.ndarray, int, np.ndarray]:
+    """
+    One level of coarsening. Vertices are matched in pairs by handshakes: every unmatched vertex picks an edge to
+    an unmatched neighbour by random priority, edges picked from both ends match. The vertices left join the
+    cluster of a neighbour, at most MULTILEVEL_CLUSTER_MAX in a cluster, so leaves of a hub do not stay alone.
+
+    Returns
+    -------
+    cluster of every vertex, number of clusters, edges between clusters (see undirected_edges)
+    """
+    cluster = np.full(n_vertices, -1, dtype=np.int64)
+    count = 0
+    for _ in range(3):
+        free = edges[(cluster[edges[:, 0]] < 0) & (cluster[edges[:, 1]] < 0)]
+        if len(free) == 0:
+            break
+        best = _best_edges(n_vertices, free, rng.random(len(free)))
+        mutual = np.flatnonzero((best[free[:, 0]] == np.arange(len(free))) & (best[free[:, 1]] == np.arange(len(free))))
+        cluster[free[mutual, 0]] = cluster[free[mutual, 1]] = count + np.arange(len(mutual))
+        count += len(mutual)
+    # left vertices to clusters of their neighbours, by random priority again
+    left = (cluster[edges[:, 0]] < 0) != (cluster[edges[:, 1]] < 0)
+    joins = edges[left]
+    joins = np.where((cluster[joins[:, 0]] < 0)[:, None], joins, joins[:, ::-1])
+    best = _best_edges(n_vertices, joins, rng.random(len(joins)))
+    vertices = np.flatnonzero((best >= 0) & (cluster < 0))
+    targets = cluster[joins[best[vertices], 1]]
+    # ranks of the joining vertices within their cluster, a matched pair takes two places
+    order = np.argsort(targets, kind='stable')
+    starts = np.searchsorted(targets[order], targets[order], side='left')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts
+    fits = rank < MULTILEVEL_CLUSTER_MAX - 2
+    cluster[vertices[fits]] = targets[fits]
+    # the rest stay alone
+    alone = np.flatnonzero(cluster < 0)
+    cluster[alone] = count + np.arange(len(alone))
+    count += len(alone)
+    return cluster, count, undirected_edges(count, cluster[edges])
+
+
+def _best_edges(n_vertices: int, edges: np.ndarray, priority: np.ndarray) -> np.ndarray:
+    # index of the edge of highest priority at every vertex, -1 for vertices without edges
+    best = np.full(n_vertices, -1, dtype=np.int64)
+    if len(edges) == 0:
+        return best
+    vertex = np.concatenate((edges[:, 0], edges[:, 1]))
+    index = np.tile(np.arange(len(edges)), 2)
+    order = np.lexsort((np.tile(priority, 2), vertex))
+    last = np.flatnonzero(np.r_[vertex[order][1:] != vertex[order][:-1], True])
+    best[vertex[order][last]] = index[order][last]
+    return best
+
+
+def refine_level(coords: np.ndarray, edges: np.ndarray, rng: np.random.Generator, start_temp: float) -> np.ndarray:
+    # force steps with the largest move cooling down linearly, fewer of them for bigger levels
+    steps = int(np.clip(MULTILEVEL_STEP_BUDGET // max(len(coords), 1), *MULTILEVEL_STEPS))
+    for step in range(steps):
+        temp = start_temp * (1 - step / steps) + 0.05
+        force = force_step(coords, edges, rng)
+        length = np.linalg.norm(force, axis=1)
+        coords += force * (np.minimum(length, temp) / np.maximum(length, 1e-12))[:, None]
+    return coords
+
+
+def force_step(coords: np.ndarray, edges: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Fruchterman-Reingold forces for unit edge length, in O(n log n): edges attract by the square of their length,
+    all vertices repulse each other through the quadtree of quadtree_repulsion, cells opened by MULTILEVEL_THETA.
+    """
+    return spring_forces(coords, edges) + quadtree_repulsion(coords, rng, MULTILEVEL_THETA)
+
+
+def spring_forces(coords: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    # edges pull their ends together by the square of their length
+    n = len(coords)
+    d = coords[edges[:, 1]] - coords[edges[:, 0]]
+    f = d * np.linalg.norm(d, axis=1)[:, None]
+    force = np.empty_like(coords)
+    for axis in range(2):
+        force[:, axis] = np.bincount(edges[:, 0], f[:, axis], n) - np.bincount(edges[:, 1], f[:, axis], n)
+    return force
+
+
+def quadtree_repulsion(coords: np.ndarray, rng: np.random.Generator, theta: float = BARNES_HUT_THETA) -> np.ndarray:
+    """
+    Fruchterman-Reingold repulsion d / |d|^2 between all vertices, Barnes-Hut style in O(n log n). A quadtree over
+    the bounding square is walked from the root by all vertices at once, a level at a time: a cell that does not
+    hold the vertex and is seen under an angle below theta repulses it through its centre of mass, others are
+    opened. Open cells of at most BARNES_HUT_LEAF vertices, and those of the last level, repulse vertex by
+    vertex, so every other vertex is counted exactly once, in a cell or on its own. Coincident vertices push
+    each other in a random direction.
+    """
+    n = len(coords)
+    force = np.zeros_like(coords)
+    if n < 2:
+        return force
+    depth = BARNES_HUT_DEPTH
+    low = coords.min(axis=0)
+    side = max(float((coords.max(axis=0) - low).max()), 1e-12)
+    ij = np.minimum(((coords - low) * ((1 << depth) / side)).astype(np.int64), (1 << depth) - 1)
+    code = _interleave(ij[:, 0]) | (_interleave(ij[:, 1]) << 1)
+    order = np.argsort(code, kind='stable')
+    z = coords[:, 0] + 1j * coords[:, 1]
+    code_sorted = code[order]
+    sums = np.r_[0, np.cumsum(z[order])]
+
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    # pairs of a vertex and an open cell of the previous level, cells as runs of order between their bounds
+    v = np.arange(n)
+    cell = np.zeros(n, dtype=np.int64)
+    bounds = np.array([0, n])
+    cell_v, cell_f = [], []
+    exact_v, exact_lo, exact_hi = [], [], []
+    for level in range(1, depth + 1):
+        # the cells of this level are the runs of the same code, within the runs of their parents
+        codes = code_sorted >> 2 * (depth - level)
+        starts = np.r_[True, codes[1:] != codes[:-1]]
+        parents, bounds = bounds, np.r_[np.flatnonzero(starts), n]
+        children = np.searchsorted(bounds, parents)
+        v, cell = _expand(v, children[cell], children[cell + 1])
+        mass = np.diff(bounds)
+        d = ((sums[bounds[1:]] - sums[bounds[:-1]]) / mass)[cell] - z[v]
+        own = cell == (np.cumsum(starts) - 1)[rank[v]]
+        far = ~own & (side / (1 << level) < theta * np.abs(d))
+        cell_v.append(v[far])
+        cell_f.append(mass[cell[far]] / np.conj(d[far]))
+        leaf = ~far & ((mass[cell] <= BARNES_HUT_LEAF) | (level == depth))
+        exact_v.append(v[leaf])
+        exact_lo.append(bounds[cell[leaf]])
+        exact_hi.append(bounds[cell[leaf] + 1])
+        keep = ~far & ~leaf
+        v, cell = v[keep], cell[keep]
+        if len(v) == 0:
+            break
+
+    v, u = _expand(np.concatenate(exact_v), np.concatenate(exact_lo), np.concatenate(exact_hi))
+    u = order[u]
+    v, u = v[u != v], u[u != v]
+    d = z[u] - z[v]
+    coincident = np.flatnonzero(d == 0)
+    d[coincident] = rng.random(len(coincident)) - 0.5 + 1j * (rng.random(len(coincident)) - 0.5)
+    v = np.concatenate([*cell_v, v])
+    f = np.concatenate([*cell_f, 1 / np.conj(d)])
+    force[:, 0] = -np.bincount(v, f.real, n)
+    force[:, 1] = -np.bincount(v, f.imag, n)
+    return force
+
+
+def _interleave(x: np.ndarray) -> np.ndarray:
+    # bits of x (below 2^32) at the even positions, for Morton codes
+    x = (x | (x << 16)) & 0x0000FFFF0000FFFF
+    x = (x | (x << 8)) & 0x00FF00FF00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F0F0F0F0F
+    x = (x | (x << 2)) & 0x3333333333333333
+    return (x | (x << 1)) & 0x5555555555555555
+
+
+def _expand(v: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # (v[i], j) for every j in lo[i]:hi[i]
+    counts = hi - lo
+    total = int(counts.sum())
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(v, counts), np.repeat(lo, counts) + np.arange(total) - first
+
+
+def cutoff_repulsion(coords: np.ndarray, others: np.ndarray, rng: np.random.Generator, radius: float) -> np.ndarray:
+    # repulsion d / |d|^2 of coords from the others closer than radius, found with k-d trees
+    from scipy.spatial import cKDTree
+    force = np.zeros_like(coords)
+    if len(coords) == 0 or len(others) == 0:
+        return force
+    pairs = cKDTree(coords).sparse_distance_matrix(cKDTree(others), radius, output_type='ndarray')
+    i, j = pairs['i'].astype(np.int64), pairs['j'].astype(np.int64)
+    d = others[j] - coords[i]
+    dist2 = (d ** 2).sum(axis=1)
+    coincident = dist2 == 0
+    d[coincident] = rng.random((int(coincident.sum()), 2)) - 0.5
+    dist2[coincident] = (d[coincident] ** 2).sum(axis=1)
+    for axis in range(2):
+        force[:, axis] -= np.bincount(i, d[:, axis] / dist2, len(coords))
+    return force
+
+
+def min_distance(coords: np.ndarray) -> Optional[float]:
+    """
+    Smallest distance between two vertices at different positions, found with a k-d tree in O(n log n).
+    Coincident vertices are not counted, see spread_coincident.
+
+    Returns
+    -------
+    the distance, None if there are less than two different positions
+    """
+    from scipy.spatial import cKDTree
+    unique = np.unique(coords, axis=0)
+    if len(unique) < 2:
+        return None
+    distances, _ = cKDTree(unique).query(unique, k=2)
+    return float(distances[:, 1].min())
+
+
+def spread_coincident(coords: np.ndarray):
+    # vertices at the same position are put around the first of them, at least a width away from it and each other
+    _, inverse, counts = np.unique(coords, axis=0, return_inverse=True, return_counts=True)
+    if len(counts) == 0 or counts.max() == 1:
+        return
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind='stable')
+    groups = inverse[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(len(order)) - starts[groups]
+    moved = rank > 0
+    order, groups, rank = order[moved], groups[moved], rank[moved]
+    extra = counts[groups] - 1
+    angle = 2 * np.pi * (rank - 1) / extra
+    radius = GRAPHICS_WIDTH / (2 * np.sin(np.pi / np.maximum(extra, 2)))
+    radius = np.maximum(radius, GRAPHICS_WIDTH)
+    coords[order, 0] += radius * np.cos(angle)
+    coords[order, 1] += radius * np.sin(angle)
+
+
+def clear_layout(pn: 'PetriNet'):
+    for obj in [*pn.places, *pn.transitions]:
+        obj.properties.pop(LAYOUT_KEY, None)
+
+
+def initial_layout(n_vertices: int, edges) -> np.ndarray:
+    """
+    Fast placement shown while a layout is refined: vertices in breadth-first order on a square grid, so
+    connected ones start near each other. Unit spacing, as igraph layouts.
+    """
+    from igraph import Graph
+    g = Graph(n_vertices, edges)
+    order = np.concatenate([np.array(g.bfs(component[0])[0], dtype=np.int64)
+                            for component in g.connected_components(mode='weak')])
+    cols = max(1, int(np.ceil(np.sqrt(n_vertices))))
+    coords = np.empty((n_vertices, 2))
+    rank = np.arange(n_vertices)
+    coords[order, 0] = rank % cols
+    coords[order, 1] = rank // cols
+    return coords
+
+
+def generate_initial_layout(pn: 'PetriNet'):
+    # the grid of initial_layout in the scene, refined afterwards
+    nodes, edges = net_graph(pn)
+    if len(nodes) == 0:
+        return
+    for node, (x, y) in zip(nodes, scale_layout(initial_layout(len(nodes), edges)).tolist()):
+        inject_layout(node, ((x, y), (GRAPHICS_WIDTH, GRAPHICS_WIDTH)))
+
+
+class LayoutRefinement:
+    """
+    Fruchterman-Reingold layout run in steps of about REFINE_STEP_S, the temperature cools over all of them as
+    over a single run.
+    """
+    ITERATIONS = 500
+
+    def __init__(self, n_vertices: int, edges, coords: np.ndarray, iterations: int = ITERATIONS):
+        from igraph import Graph
+        self.graph = Graph(n_vertices, edges)
+        self.coords = coords
+        self.iterations = iterations
+        self.done = 0
+        # igraph's default
+        self.start_temp = np.sqrt(n_vertices) / 10
+        self.__niter = 1
+
+    def is_finished(self) -> bool:
+        return self.done >= self.iterations
+
+    def step(self):
+        niter = min(self.__niter, self.iterations - self.done)
+        start = time.perf_counter()
+        layout = self.graph.layout_fruchterman_reingold(
+            seed=self.coords.tolist(), niter=niter, grid='auto',
+            start_temp=self.start_temp * (1 - self.done / self.iterations))
+        elapsed = time.perf_counter() - start
+        self.coords = np.array(layout.coords, dtype=float)
+        self.done += niter
+        self.__niter = max(1, min(2 * niter, int(niter * REFINE_STEP_S / max(elapsed, 1e-6))))
+
+    def scaled(self) -> np.ndarray:
+        return scale_layout(self.coords.copy())
+
+
+class SelectionRelaxation:
+    """
+    Force directed layout of some vertices among fixed ones: the first n_movable vertices move, the others only
+    push and pull them. The unit length is the median distance between the fixed vertices and their nearest
+    neighbours, at least two widths, so the moved vertices keep the spacing of the layout around. Selected
+    vertices repulse each other through a quadtree of the selection, see quadtree_repulsion; fixed vertices
+    repulse them from up to RELAX_FIXED_RADIUS only, their far field would push the selection off as a whole.
+    """
+    RELAX_FIXED_RADIUS = 2.0
+    ITERATIONS = 300
+
+    def __init__(self, coords: np.ndarray, n_movable: int, edges, iterations: int = ITERATIONS, seed: int = 0):
+        from scipy.spatial import cKDTree
+        self.edges = undirected_edges(len(coords), edges)
+        self.unit = 2.0 * GRAPHICS_WIDTH
+        fixed = coords[n_movable:]
+        if len(fixed) >= 2:
+            distances, _ = cKDTree(fixed).query(fixed, k=2)
+            self.unit = max(self.unit, float(np.median(distances[:, 1])))
+        self.coords = np.array(coords, dtype=float) / self.unit
+        self.n_movable = n_movable
+        self.iterations = iterations
+        self.done = 0
+        self.rng = np.random.default_rng(seed)
+        # a tangled selection may have to cross itself
+        self.start_temp = max(1.0, np.sqrt(n_movable) / 4)
+
+    def is_finished(self) -> bool:
+        return self.done >= self.iterations
+
+    def step(self):
+        temp = self.start_temp * (1 - self.done / self.iterations) + 0.05
+        n = self.n_movable
+        # the fixed vertices do not give way
+        force = spring_forces(self.coords, self.edges)[:n]
+        force += quadtree_repulsion(self.coords[:n], self.rng)
+        force += cutoff_repulsion(self.coords[:n], self.coords[n:], self.rng, SelectionRelaxation.RELAX_FIXED_RADIUS)
+        length = np.linalg.norm(force, axis=1)
+        self.coords[:self.n_movable] += force * (np.minimum(length, temp) / np.maximum(length, 1e-12))[:, None]
+        self.done += 1
+
+    def scaled(self) -> np.ndarray:
+        # positions of the movable vertices in the scene
+        return self.coords[:self.n_movable] * self.unit
+
+
+def refine_process(conn, n_vertices: int, edges, coords: np.ndarray, interval_s: float):
+    """
+    Runs a LayoutRefinement in a process of its own, so the GUI is not held up by its steps. Scaled coordinates
+    are sent at most every interval_s and only once the previous ones are acknowledged, the receiver gets the
+    latest instead of a backlog. Messages: (finished, coordinates) out, True (acknowledged) or None (stop) in.
+    """
+    refinement = LayoutRefinement(n_vertices, edges, coords)
+    ready, sent = True, time.monotonic()
+    try:
+        while not refinement.is_finished():
+            while conn.poll():
+                if conn.recv() is None:
+                    return
+                ready = True
+            refinement.step()
+            if ready and time.monotonic() - sent >= interval_s:
+                conn.send((False, refinement.scaled()))
+                ready, sent = False, time.monotonic()
+        conn.send((True, refinement.scaled()))
+    except (EOFError, BrokenPipeError):
+        # the receiver is gone
+        pass
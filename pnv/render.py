@@ -1,21 +1,26 @@
+import multiprocessing
+import os
 import time
-from typing import Union, Optional, Tuple
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Optional
 
 from PyQt5 import Qt, QtCore, QtGui
 from PyQt5.QtCore import QPoint
 from PyQt5.QtWidgets import QGraphicsScene, QGraphicsRectItem, QGraphicsView, QApplication, QMenu, \
     QStyle, QPushButton, QTreeView
+import numpy as np
 from pm4py import PetriNet, Marking
-from igraph import Graph
 from math import log, floor, ceil
 
 import pnv.importer.epnml
-from pnv.graphics import PnvQGTransitionItem, PnvQGPlaceItem, PnvQGArrowItem, Labeling
+import pnv.layout
+from pnv.graphics import PnvQGTransitionItem, PnvQGPlaceItem, PnvQGArrowItem, Labeling, PnvDetail
 from pnv.importer.epnml import ExtendedTransition
 from pnv.interactive.hierarchy import HierNode, Hierarchical
 from pnv.utils import PnvMessageBoxes, PnvConfig, PnvConfigConstants, PnvIcons
 
-Layout = Tuple[Tuple[int, int], Tuple[int, int]]
+Layout = pnv.layout.Layout
 
 
 class PnvEditState:
@@ -44,9 +49,18 @@ class PnvEditState:
         self.layout_changed = False
         self.meta_data = False
 
+    def merge(self, other: 'PnvEditState'):
+        # changes of a save that was not written are still to be saved
+        self.layout_generated |= other.layout_generated
+        self.layout_changed |= other.layout_changed
+        self.meta_data |= other.meta_data
+
 
 class PnvDrawer:
-    GRAPHICS_WIDTH = 40
+    GRAPHICS_WIDTH = pnv.layout.GRAPHICS_WIDTH
+    DRAW_PROGRESS_STEP = 2000
+    # times the items around a drop are looked up again, as far as remove_overlaps pushed them
+    OVERLAP_GROWTH_MAX = 5
 
     def __init__(self, scene: QGraphicsScene, net: PetriNet):
         self.scene = scene
@@ -57,12 +71,38 @@ class PnvDrawer:
 
         self.edit_mode = None
         self.label_mode = None
+        # level of detail items paint at, set by the viewer from its zoom
+        self.detail = PnvDetail.FULL
 
         self.__cached_htree: HierNode = None
         if self.is_review_mode():
             self.__cached_htree = self.__make_htree()
 
         self.__net_cover = None
+        # edits are recorded when the tab keeps a journal, see pnv.journal
+        self.journal = None
+        # refinement of a layout drawn from a fast initial one, see start_refinement
+        self.refiner: Optional[PnvLayoutRefiner] = None
+        # inner nets laid out ahead of unwrapping, see start_subnet_layouts
+        self.subnet_layouter: Optional[PnvSubnetLayouter] = None
+        # their transitions and the positions they were laid out around
+        self.precomputed: dict[ExtendedTransition, tuple[float, float]] = dict()
+        # tidying of selected items, see relax
+        self.relaxer: Optional[PnvSelectionRelaxer] = None
+
+    def record(self, op: str, **args):
+        # an edit ends the refinement and the relaxation, they would move the edited items
+        self.stop_refinement()
+        self.stop_relaxation()
+        if self.journal is not None:
+            self.journal.append(op, **args)
+
+    def record_moves(self, objs):
+        self.record('move', nodes=[[o.petri_net_bound().name, *PnvDrawer.final_pos(o)] for o in objs
+                                   if o.petri_net_bound()])
+
+    def record_layouts(self, net: PetriNet):
+        self.record('move', nodes=[[n.name, *PnvDrawer.layout(n)[0]] for n in [*net.places, *net.transitions]])
 
     def is_hierarchical_net(self):
         return any(isinstance(t, ExtendedTransition) for t in self.net.transitions)
@@ -73,17 +113,27 @@ class PnvDrawer:
     def hn_root(self):
         return self.__cached_htree
 
-    def __make_htree(self, root: tuple[HierNode, ExtendedTransition] = None):
-        if root:
-            rhn, rt = root
-            hn = HierNode(rt.label, rhn, (rt, rt.inner_net, None))
-        else:
-            hn = HierNode(self.net.name, None, (None, self.net, None))
-        _net = hn.value[1]
-        for t in _net.transitions:
-            if isinstance(t, ExtendedTransition):
-                self.__make_htree((hn, t))
-        return hn
+    def __make_htree(self):
+        # nodes of inner nets get their children when walked into, so only the nets that are unwrapped, expanded
+        # in the hierarchy panel or walked by subnet_levels are built
+        def expand(hn: HierNode):
+            extr = hn.value[0]
+            _net = self.net if extr is None else extr.inner_net
+            for t in _net.transitions:
+                if isinstance(t, ExtendedTransition):
+                    HierNode(t.label, hn, (t, None, None), expand)
+
+        return HierNode(self.net.name, None, (None, self.net, None), expand)
+
+    def subnet_levels(self) -> list[list[ExtendedTransition]]:
+        # transitions of the inner nets by depth, from the tree of the review mode or one made for the walk
+        root = self.__cached_htree if self.__cached_htree is not None else self.__make_htree()
+        levels = []
+        level = root.children()
+        while level:
+            levels.append([hn.value[0] for hn in level])
+            level = [c for hn in level for c in hn.children()]
+        return levels
 
     def draw_place_directly(self, x: int, y: int, r: int) -> PnvQGPlaceItem:
         # custom ellipse init
@@ -122,28 +172,24 @@ class PnvDrawer:
 
     @staticmethod
     def has_layout(obj):
-        return hasattr(obj, 'properties') and ('layout_information_petri' in obj.properties) \
-            and isinstance(obj.properties['layout_information_petri'], tuple)
+        return pnv.layout.has_layout(obj)
 
     @staticmethod
     def inject_layout(obj, layout: Layout):
-        if PnvDrawer.has_layout(obj):
-            raise ValueError("Layout injection can not be applied to object containing layout!")
-        if not hasattr(obj, 'properties'):
-            setattr(obj, 'properties', dict())
-        if not ('layout_information_petri' in obj.properties):
-            obj.properties['layout_information_petri'] = layout
+        pnv.layout.inject_layout(obj, layout)
 
     @staticmethod
     def layout(obj) -> Layout:
         return obj.properties['layout_information_petri']
 
-    def draw_petri_net(self):
+    def draw_petri_net(self, progress=None):
+        # progress(done, total) is called every DRAW_PROGRESS_STEP items, it may raise to stop drawing
         if not all(self.has_layout(obj) for obj in [*self.net.places, *self.net.transitions]):
-            from main import PnvMainWindow
             PnvMessageBoxes.proceed(f"Загруженная сеть не имеет предопределённую разметку!",
                                     f"Будет произведена генерация автоматической разметки.").exec()
             self.igraph_gen_layout(self.net)
+        total = len(self.net.places) + len(self.net.transitions) + len(self.net.arcs)
+        done = 0
         lst = []
         for p in self.net.places:
             obj = self.draw_place(p)
@@ -151,54 +197,261 @@ class PnvDrawer:
                 obj.hiernode_bind(self.__cached_htree)
                 lst.append(obj)
             self.mapper[p] = obj
+            done += 1
+            if progress is not None and done % PnvDrawer.DRAW_PROGRESS_STEP == 0:
+                progress(done, total)
         for t in self.net.transitions:
             obj = self.draw_transition(t)
             if self.is_review_mode():
                 obj.hiernode_bind(self.__cached_htree)
                 lst.append(obj)
             self.mapper[t] = obj
+            done += 1
+            if progress is not None and done % PnvDrawer.DRAW_PROGRESS_STEP == 0:
+                progress(done, total)
         for a in self.net.arcs:
             obj = self.draw_arc(a.source, a.target)
             self.mapper[a.source].arrows().add(obj)
             self.mapper[a.target].arrows().add(obj)
+            done += 1
+            if progress is not None and done % PnvDrawer.DRAW_PROGRESS_STEP == 0:
+                progress(done, total)
         if self.is_review_mode():
             self.__cached_htree.value = (None, self.net, lst)
         self.__net_cover = self.__make_net_cover()
 
     def igraph_gen_layout(self, pn: PetriNet):
-        n_vertices = len(pn.places) + len(pn.transitions)
-        local_mapper: dict[Union[PetriNet.Place, PetriNet.Transition], int] = dict()
-        local_mapper_re: dict[int, Union[PetriNet.Place, PetriNet.Transition]] = dict()  # just complexity optimization
-        c = 0
-        for obj in pn.places:
-            local_mapper[obj] = c
-            local_mapper_re[c] = obj
-            c += 1
-        for obj in pn.transitions:
-            local_mapper[obj] = c
-            local_mapper_re[c] = obj
-            c += 1
-        edges = [(local_mapper[a.source], local_mapper[a.target]) for a in pn.arcs if
-                 (a.source in local_mapper and a.target in local_mapper)]
-        g = Graph(n_vertices, edges)
-        layout = g.layout(layout=PnvConfig.INSTANCE.igraph_gen_mode)
-        # scaling
-        min_dist = PnvDrawer.GRAPHICS_WIDTH
-        for i, gen in enumerate(layout):
-            for j, gen1 in enumerate(layout):
-                if i == j:
-                    continue
-                x, y = gen[0], gen[1]
-                x1, y1 = gen1[0], gen1[1]
-                min_dist = min(min_dist, ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5)
-        k = PnvDrawer.GRAPHICS_WIDTH / min_dist * 2
-        layout.scale(k)
-        # injection
-        for i, gen in enumerate(layout):
-            lay = ((gen[0], gen[1]), (PnvDrawer.GRAPHICS_WIDTH, PnvDrawer.GRAPHICS_WIDTH))
-            PnvDrawer.inject_layout(local_mapper_re[i], lay)
+        PnvDrawer.generate_layout(pn)
+        self.status.layout_generated = True
+
+    def igraph_gen_anchored_layout(self, pn: PetriNet, center: tuple[float, float], pushable=None) \
+            -> list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]:
+        """
+        Layout of an unwrapped inner net around the position of its transition, facing the drawn nodes it has arcs
+        to, see pnv.layout.anchored_layout. Drawn items under it are pushed aside, found by the scene index so the
+        rest of the scene is not visited.
+
+        Parameters
+        ----------
+        pn: inner net
+        center: position of the unwrapped transition
+        pushable: (item) -> bool, which items may be moved (optional, all by default)
+
+        Returns
+        -------
+        moved items
+        """
+        nodes, edges = pnv.layout.net_graph(pn)
+        if len(nodes) == 0:
+            return []
+        index = {n: i for i, n in enumerate(nodes)}
+        anchors = []
+        for a in pn.arcs:
+            for inner, outer in ((a.source, a.target), (a.target, a.source)):
+                if inner in index and outer not in index and outer in self.mapper:
+                    anchors.append((index[inner], *PnvDrawer.final_pos(self.mapper[outer])))
+        coords = pnv.layout.anchored_layout(len(nodes), edges, center, anchors, PnvConfig.INSTANCE.igraph_gen_mode)
+        size = (PnvDrawer.GRAPHICS_WIDTH, PnvDrawer.GRAPHICS_WIDTH)
+        for node, (x, y) in zip(nodes, coords.tolist()):
+            node.properties['layout_information_petri'] = ((x, y), size)
+        self.status.layout_generated = True
+        return self.push_aside_items(coords, center, pushable)
+
+    def place_precomputed_layout(self, extr: ExtendedTransition, center: tuple[float, float], pushable=None) \
+            -> list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]:
+        """
+        Inner net laid out by PnvSubnetLayouter is moved along with its transition, if that was moved since, and
+        drawn items under it are pushed aside as by igraph_gen_anchored_layout.
+
+        Returns
+        -------
+        moved items
+        """
+        pn = extr.inner_net
+        nodes = [*pn.places, *pn.transitions]
+        laid_around = self.precomputed.pop(extr)
+        if len(nodes) == 0:
+            return []
+        coords = np.array([self.layout(n)[0] for n in nodes], dtype=float) + np.subtract(center, laid_around)
+        for node, (x, y) in zip(nodes, coords.tolist()):
+            node.properties['layout_information_petri'] = ((x, y), self.layout(node)[1])
+        return self.push_aside_items(coords, center, pushable)
+
+    def push_aside_items(self, coords: np.ndarray, center: tuple[float, float], pushable=None) \
+            -> list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]:
+        # items under the new ones, with room for a node around them
+        margin = PnvDrawer.GRAPHICS_WIDTH
+        (minx, miny), (maxx, maxy) = coords.min(axis=0) - margin, coords.max(axis=0) + margin
+        found = [obj for obj in self.scene.items(QtCore.QRectF(minx, miny, maxx - minx, maxy - miny))
+                 if isinstance(obj, (PnvQGTransitionItem, PnvQGPlaceItem)) and obj.petri_net_bound() is not None
+                 and (pushable is None or pushable(obj))]
+        if not found:
+            return []
+        old = np.array([PnvDrawer.final_pos(obj) for obj in found], dtype=float)
+        new = pnv.layout.push_aside(old, center, (minx, miny, maxx, maxy), margin)
+        return PnvDrawer.shift_items(found, old, new)
+
+    @staticmethod
+    def shift_items(objs: list[Union[PnvQGTransitionItem, PnvQGPlaceItem]], old: np.ndarray, new: np.ndarray) \
+            -> list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]:
+        # items from old to new positions, then every arrow touching them is updated once; returns the moved ones
+        moved = []
+        arrows = set()
+        for obj, (x0, y0), (x1, y1) in zip(objs, old.tolist(), new.tolist()):
+            if (x0, y0) == (x1, y1):
+                continue
+            obj.setPos(obj.x() + x1 - x0, obj.y() + y1 - y0)
+            arrows |= obj.arrows()
+            moved.append(obj)
+        for arr in arrows:
+            arr.update(arr.boundingRect())
+        return moved
+
+    @staticmethod
+    def generate_layout(pn: PetriNet, mode: str = None):
+        # touches no scene, so it also runs on the loading thread and in loading processes, which pass the mode
+        if mode is None:
+            mode = PnvConfig.INSTANCE.igraph_gen_mode
+        pnv.layout.generate_layout(pn, mode)
+
+    def start_subnet_layouts(self):
+        self.subnet_layouter = PnvSubnetLayouter(self)
+
+    def stop_subnet_layouts(self):
+        if self.subnet_layouter is not None:
+            self.subnet_layouter.stop()
+
+    def is_laying_out_subnets(self) -> bool:
+        return self.subnet_layouter is not None
+
+    def start_refinement(self):
+        # the net was drawn with pnv.layout.generate_initial_layout, its grid is brought back to unit spacing
+        nodes, edges = pnv.layout.net_graph(self.net)
+        coords = np.array([self.layout(n)[0] for n in nodes], dtype=float) / (2 * PnvDrawer.GRAPHICS_WIDTH)
+        self.refiner = PnvLayoutRefiner(self, nodes, edges, coords)
+
+    def stop_refinement(self):
+        if self.refiner is not None:
+            self.refiner.stop()
+
+    def is_refining(self) -> bool:
+        return self.refiner is not None
 
+    def move_items(self, nodes: list[Union[PetriNet.Place, PetriNet.Transition]], coords: np.ndarray):
+        # one batch of positions: the items are moved first, then every arrow touching them is updated once
+        arrows = set()
+        for node, (x, y) in zip(nodes, coords.tolist()):
+            obj = self.mapper.get(node)
+            if obj is None:
+                continue
+            center = obj.rect().center()
+            obj.setPos(x - center.x(), y - center.y())
+            arrows |= obj.arrows()
+        for arr in arrows:
+            arr.update(arr.boundingRect())
+
+    def refinement_finished(self, nodes: list[Union[PetriNet.Place, PetriNet.Transition]]):
+        # positions reached are the layout of the net
+        for node in nodes:
+            obj = self.mapper.get(node)
+            if obj is not None and obj.scene() is self.scene:
+                node.properties['layout_information_petri'] = (PnvDrawer.final_pos(obj), self.layout(node)[1])
+        self.refiner = None
         self.status.layout_generated = True
+        if self.__net_cover is not None:
+            self.net_cover_sync()
+        self.scene.update()
+
+    def relax(self, objs):
+        self.stop_refinement()
+        self.stop_relaxation()
+        self.relaxer = PnvSelectionRelaxer(self, list(objs))
+
+    def stop_relaxation(self):
+        if self.relaxer is not None:
+            self.relaxer.stop()
+
+    def is_relaxing(self) -> bool:
+        return self.relaxer is not None
+
+    def relaxation_finished(self, objs: list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]):
+        self.relaxer = None
+        self.items_moved(objs)
+
+    def items_moved(self, objs: list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]):
+        # moves made at once are a change of the layout, journaled, and the covers follow them
+        self.status.layout_changed = True
+        self.record_moves(objs)
+        if self.is_review_mode():
+            for hn in {id(o.hiernode_bound()): o.hiernode_bound() for o in objs if o.hiernode_bound()}.values():
+                self.hn_cover_fit(hn)
+        if self.__net_cover is not None:
+            self.net_cover_sync()
+        self.scene.update()
+
+    def drawn_nodes(self, rect: QtCore.QRectF = None) -> list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]:
+        # items of places and transitions, all or those in rect by the scene index
+        found = self.scene.items() if rect is None else self.scene.items(rect)
+        return [obj for obj in found
+                if isinstance(obj, (PnvQGTransitionItem, PnvQGPlaceItem)) and obj.petri_net_bound() is not None]
+
+    def remove_overlaps(self, objs=None, stay=()) -> np.ndarray:
+        """
+        Overlapping items are moved apart, see pnv.layout.remove_overlaps: all drawn ones, or the ones around objs
+        only, found by the scene index, and those met on the way as far as the pushes go. Items of stay do not move,
+        the ones under them are pushed aside first, as by igraph_gen_anchored_layout.
+
+        Returns
+        -------
+        how far every moved item went
+        """
+        self.stop_refinement()
+        self.stop_relaxation()
+        reach = 2 * PnvDrawer.GRAPHICS_WIDTH
+        if objs is None:
+            found = self.drawn_nodes()
+        else:
+            minx, miny, maxx, maxy = PnvDrawer.bounds(objs)
+            found = self.drawn_nodes(QtCore.QRectF(minx - reach, miny - reach,
+                                                   maxx - minx + 2 * reach, maxy - miny + 2 * reach))
+        stay = set(stay)
+        found = [*[obj for obj in found if obj in stay], *[obj for obj in found if obj not in stay]]
+        if len(found) < 2:
+            return np.zeros(0)
+        old = np.array([PnvDrawer.final_pos(obj) for obj in found], dtype=float)
+        new = old.copy()
+        staying = sum(1 for obj in found if obj in stay)
+        if staying:
+            minx, miny, maxx, maxy = PnvDrawer.bounds(found[:staying])
+            margin = PnvDrawer.GRAPHICS_WIDTH
+            new[staying:] = pnv.layout.push_aside(new[staying:], tuple(new[:staying].mean(axis=0)),
+                                                  (minx - margin, miny - margin, maxx + margin, maxy + margin),
+                                                  margin)
+        index = set(found)
+        for _ in range(PnvDrawer.OVERLAP_GROWTH_MAX):
+            sizes = np.array([(obj.rect().width(), obj.rect().height()) for obj in found], dtype=float)
+            fixed = np.arange(len(found)) < staying
+            pnv.layout.remove_overlaps(new, sizes, fixed)
+            if objs is None:
+                break
+            # items the moved ones went onto take part too
+            moved = (new != old).any(axis=1)
+            if not moved.any():
+                break
+            (minx, miny), (maxx, maxy) = new[moved].min(axis=0) - reach, new[moved].max(axis=0) + reach
+            met = [obj for obj in self.drawn_nodes(QtCore.QRectF(minx, miny, maxx - minx, maxy - miny))
+                   if obj not in index]
+            if not met:
+                break
+            index.update(met)
+            found += met
+            more = np.array([PnvDrawer.final_pos(obj) for obj in met], dtype=float)
+            old, new = np.vstack([old, more]), np.vstack([new, more])
+        displacement = np.linalg.norm(new - old, axis=1)
+        moved = PnvDrawer.shift_items(found, old, new)
+        if moved:
+            self.items_moved(moved)
+        return displacement[displacement > 0]
 
     def connect_arc(self, from_: Union[PnvQGTransitionItem, PnvQGPlaceItem],
                     to: Union[PnvQGTransitionItem, PnvQGPlaceItem]):
@@ -213,6 +466,7 @@ class PnvDrawer:
         to.arrows().add(arrow)
 
         self.status.layout_changed = True
+        self.record('arc_create', source=arc.source.name, target=arc.target.name)
 
     def disconnect_arc(self, one: Union[PnvQGTransitionItem, PnvQGPlaceItem],
                        two: Union[PnvQGTransitionItem, PnvQGPlaceItem]):
@@ -247,6 +501,7 @@ class PnvDrawer:
         self.scene.removeItem(arrow)
 
         self.status.layout_changed = True
+        self.record('arc_remove', source=target_arc.source.name, target=target_arc.target.name)
 
     def place_create(self, pos: QtCore.QPointF):
         p = PetriNet.Place(f'p{str(time.time())}')
@@ -256,6 +511,7 @@ class PnvDrawer:
         self.net.places.add(p)
 
         self.status.layout_changed = True
+        self.record('place_create', name=p.name, x=pos.x(), y=pos.y())
 
     def transition_create(self, pos: QtCore.QPointF):
         t = PetriNet.Transition(f'p{str(time.time())}')
@@ -265,6 +521,7 @@ class PnvDrawer:
         self.net.transitions.add(t)
 
         self.status.layout_changed = True
+        self.record('transition_create', name=t.name, x=pos.x(), y=pos.y())
 
     def place_remove(self, item: PnvQGPlaceItem):
         # net remove
@@ -289,6 +546,7 @@ class PnvDrawer:
         self.scene.update()
 
         self.status.layout_changed = True
+        self.record('node_remove', name=bound.name)
 
     def transition_remove(self, item: PnvQGTransitionItem):
         # net remove
@@ -313,6 +571,7 @@ class PnvDrawer:
         self.scene.update()
 
         self.status.layout_changed = True
+        self.record('node_remove', name=bound.name)
 
     @staticmethod
     def bounds(lst: list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]):
@@ -376,6 +635,61 @@ class PnvDrawer:
 
         return _net_cover
 
+    def hn_cover_fit(self, hn: HierNode):
+        # the cover of an unwrapped subnet is fit to its items and inner covers, the covers above grow to hold it
+        if len(hn.value) < 4:
+            return
+        _, _, lst, cover = hn.value
+
+        cover: QGraphicsRectItem
+        minx, miny, maxx, maxy = PnvDrawer.bounds(lst)
+        for c in hn.children():
+            c: HierNode
+            if len(c.value) < 4 or c.value[3] is None:
+                continue
+            _, _, _, c_cover = c.value
+            c_cover: QGraphicsRectItem
+            minx = min(minx, c_cover.rect().x())
+            miny = min(miny, c_cover.rect().y())
+            c_maxx = c_cover.rect().x() + c_cover.rect().width()
+            c_maxy = c_cover.rect().y() + c_cover.rect().height()
+            maxx = max(maxx, c_maxx)
+            maxy = max(maxy, c_maxy)
+        padding = PnvDrawer.GRAPHICS_WIDTH
+        txt, *_ = cover.childItems()
+        padding_top = QtGui.QFontMetrics(txt.font()).height() + padding
+        cover.setRect(Qt.QRectF(minx - padding, miny - padding_top, maxx - minx + 2 * padding, maxy - miny + 3 * padding))
+        txt.setPos(minx - padding, miny - padding_top)
+
+        par = hn.parent
+        while par:
+            par: HierNode
+            if len(par.value) < 4 or par.value[3] is None:
+                break
+            _, _, _, par_cover = par.value
+            par_cover: QGraphicsRectItem
+            minx = cover.rect().x() - padding
+            miny = cover.rect().y() - padding_top
+            maxx = cover.rect().x() + cover.rect().width() + padding
+            maxy = cover.rect().y() + cover.rect().height() + padding
+
+            if minx < par_cover.rect().x() or \
+                    miny < par_cover.rect().y() or \
+                    maxx > par_cover.rect().x() + par_cover.rect().width() or \
+                    maxy > par_cover.rect().y() + par_cover.rect().height():
+                minx = min(minx, par_cover.rect().x())
+                miny = min(miny, par_cover.rect().y())
+                maxx = max(maxx, par_cover.rect().x() + par_cover.rect().width())
+                maxy = max(maxy, par_cover.rect().y() + par_cover.rect().height())
+                par_cover.setRect(Qt.QRectF(minx, miny, maxx-minx, maxy-miny))
+
+                txt, *_ = par_cover.childItems()
+                txt.setPos(minx, miny)
+                par = par.parent
+                cover = par_cover
+            else:
+                break
+
     def hv_cover_sync(self, root: HierNode = None):
         if root is None:
             root = self.__cached_htree
@@ -444,6 +758,7 @@ class PnvDrawer:
         return _hv_cover
 
     def subnet_unwrap(self, trans_obj: PnvQGTransitionItem):
+        self.stop_refinement()
         extr: PetriNet.Transition = trans_obj.petri_net_bound()
 
         # unwrappability verification
@@ -480,9 +795,9 @@ class PnvDrawer:
             if c.value[0] is extr:
                 hn = c
 
-        extr, wrapped_net, _ = hn.value
-        extr: ExtendedTransition
-        wrapped_net: PetriNet
+        extr: ExtendedTransition = hn.value[0]
+        wrapped_net: PetriNet = extr.inner_net
+        center = PnvDrawer.final_pos(trans_obj)
 
         # cutting old components
         # # gui arcs remove
@@ -502,7 +817,14 @@ class PnvDrawer:
         # injecting wrapped net
         # # layout gen
         if not all(self.has_layout(obj) for obj in [*wrapped_net.places, *wrapped_net.transitions]):
-            self.igraph_gen_layout(wrapped_net)
+            # items of other subnets stay within their covers
+            moved = self.igraph_gen_anchored_layout(wrapped_net, center, lambda o: o.hiernode_bound() is top)
+            self.record_layouts(wrapped_net)
+            self.record_moves(moved)
+        elif extr in self.precomputed:
+            moved = self.place_precomputed_layout(extr, center, lambda o: o.hiernode_bound() is top)
+            self.record_layouts(wrapped_net)
+            self.record_moves(moved)
 
         lst = []
         # # places inject
@@ -534,6 +856,7 @@ class PnvDrawer:
     def subnet_unwrap_mutate(self, trans_obj: PnvQGTransitionItem):
         extr: ExtendedTransition = trans_obj.petri_net_bound()
         wrapped_net = extr.inner_net
+        center = PnvDrawer.final_pos(trans_obj)
 
         # cutting old components
         # # gui arcs remove
@@ -561,11 +884,18 @@ class PnvDrawer:
         self.scene.removeItem(trans_obj)
         # # petri net transition remove
         self.net.transitions.remove(extr)
+        self.record('unwrap', name=extr.name)
 
         # injecting wrapped net
         # # layout gen
         if not all(self.has_layout(obj) for obj in [*wrapped_net.places, *wrapped_net.transitions]):
-            self.igraph_gen_layout(wrapped_net)
+            moved = self.igraph_gen_anchored_layout(wrapped_net, center)
+            self.record_layouts(wrapped_net)
+            self.record_moves(moved)
+        elif extr in self.precomputed:
+            moved = self.place_precomputed_layout(extr, center)
+            self.record_layouts(wrapped_net)
+            self.record_moves(moved)
         # # places inject
         for p in wrapped_net.places:
             # gui
@@ -593,6 +923,7 @@ class PnvDrawer:
         self.scene.update()
 
     def subnet_wrap(self, objs: set[Union[PnvQGTransitionItem, PnvQGPlaceItem]]):
+        self.stop_refinement()
         # wrappability verification
         if len(objs) <= 1:
             if not self.is_review_mode():
@@ -628,6 +959,7 @@ class PnvDrawer:
                 outer_from_objs.add(arrow.from_)
 
         # creating wrapped net
+        self.record_moves(objs)
         for obj in objs:
             bound = obj.petri_net_bound()
             # updating layout
@@ -708,6 +1040,7 @@ class PnvDrawer:
         places: set[PetriNet.Place] = set()
         transitions: set[PetriNet.Transition] = set()
         arcs: set[PetriNet.Arc] = set()
+        self.record_moves(objs)
         for obj in objs:
             bound = obj.petri_net_bound()
             # updating layout
@@ -785,6 +1118,8 @@ class PnvDrawer:
 
             self.net.arcs.add(arc)
         self.net.transitions.add(extr)
+        self.record('wrap', nodes=[o.petri_net_bound().name for o in objs], name=extr.name, label=extr.label,
+                    net=wrapped_net.name, x=objs_center[0], y=objs_center[1])
         # # gui
         self.mapper[extr] = self.draw_transition(extr)
         for arc in new_arcs:
@@ -801,6 +1136,235 @@ class PnvDrawer:
         return int(obj.rect().x() + lay[1][0] / 2) + obj.x(), int(obj.rect().y() + lay[1][1] / 2) + obj.y()
 
 
+class PnvLayoutRefiner(QtCore.QObject):
+    """
+    Refines the layout of a drawn net in a process of its own, see pnv.layout.refine_process. The positions it
+    sends are put on the items once per UPDATE_MS, one batch with the latest of them; the scene is not indexed
+    meanwhile, every move would update the index.
+    """
+    UPDATE_MS = 300
+    JOIN_S = 1
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, drawer: PnvDrawer, nodes: list[Union[PetriNet.Place, PetriNet.Transition]],
+                 edges: list[tuple[int, int]], coords: np.ndarray):
+        super(PnvLayoutRefiner, self).__init__()
+        self.drawer = drawer
+        self.nodes = nodes
+        # spawned, a forked Qt application is not safe
+        context = multiprocessing.get_context('spawn')
+        self.__conn, child = context.Pipe()
+        self.__process = context.Process(target=pnv.layout.refine_process,
+                                         args=(child, len(nodes), edges, coords, PnvLayoutRefiner.UPDATE_MS / 1000),
+                                         daemon=True)
+        self.__process.start()
+        child.close()
+        self.running = True
+        drawer.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.timeout.connect(self.__poll)
+        self.__timer.start(PnvLayoutRefiner.UPDATE_MS)
+
+    def __poll(self):
+        # checked first: a process that is gone has sent all it would
+        alive = self.__process.is_alive()
+        latest, done = None, False
+        try:
+            while self.__conn.poll():
+                done, latest = self.__conn.recv()
+        except (EOFError, OSError):
+            done = True
+        if latest is not None:
+            self.drawer.move_items(self.nodes, latest)
+            if not done:
+                try:
+                    self.__conn.send(True)
+                except OSError:
+                    done = True
+        if done or not alive:
+            self.__finish()
+
+    def stop(self):
+        if not self.running:
+            return
+        try:
+            self.__conn.send(None)
+        except OSError:
+            pass
+        self.__finish()
+
+    def __finish(self):
+        if not self.running:
+            return
+        self.running = False
+        self.__timer.stop()
+        self.__conn.close()
+        self.__process.join(PnvLayoutRefiner.JOIN_S)
+        if self.__process.is_alive():
+            self.__process.terminate()
+        self.drawer.scene.setItemIndexMethod(QGraphicsScene.BspTreeIndex)
+        self.drawer.refinement_finished(self.nodes)
+        self.finished.emit()
+
+
+class PnvSubnetLayouter(QtCore.QObject):
+    """
+    Lays out the inner nets without layout of a drawn net before they are unwrapped, in a process pool. The
+    hierarchy is walked level by level: the nets of a level are laid out around their transitions and facing the
+    nodes they have arcs to (see pnv.layout.anchored_layout), whose positions come with the level above. Layouts
+    go to the nets, so they are saved with them; unwrapping such a net only draws it, see place_precomputed_layout.
+    """
+    POLL_MS = 200
+    # level (from 1), levels, done, total of the level
+    progress = QtCore.pyqtSignal(int, int, int, int)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, drawer: PnvDrawer, workers: Optional[int] = None):
+        super(PnvSubnetLayouter, self).__init__()
+        self.drawer = drawer
+        self.levels = drawer.subnet_levels()
+        self.level = -1
+        self.done = 0
+        self.__pending = dict()
+        # spawned, a forked Qt application is not safe
+        self.__pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                          mp_context=multiprocessing.get_context('spawn'))
+        self.running = True
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.timeout.connect(self.__poll)
+        self.__timer.start(PnvSubnetLayouter.POLL_MS)
+
+    def __submit(self, extr: ExtendedTransition) -> bool:
+        # nets that got a layout meanwhile, by unwrapping, and nets of transitions without position are skipped
+        pn = extr.inner_net
+        if pnv.layout.has_full_layout(pn) or not pnv.layout.has_layout(extr):
+            return False
+        nodes, edges = pnv.layout.net_graph(pn)
+        if len(nodes) == 0:
+            return False
+        index = {n: i for i, n in enumerate(nodes)}
+        anchors = []
+        for a in pn.arcs:
+            for inner, outer in ((a.source, a.target), (a.target, a.source)):
+                if inner in index and outer not in index and pnv.layout.has_layout(outer):
+                    anchors.append((index[inner], *PnvDrawer.layout(outer)[0]))
+        center = PnvDrawer.layout(extr)[0]
+        future = self.__pool.submit(pnv.layout.anchored_layout, len(nodes), edges, center, anchors,
+                                    PnvConfig.INSTANCE.igraph_gen_mode)
+        self.__pending[future] = (extr, nodes, center)
+        return True
+
+    def __next_level(self):
+        # levels without work are passed at once
+        while not self.__pending:
+            self.level += 1
+            if self.level >= len(self.levels):
+                self.__finish()
+                return
+            self.done = 0
+            for extr in self.levels[self.level]:
+                if not self.__submit(extr):
+                    self.done += 1
+        self.progress.emit(self.level + 1, len(self.levels), self.done, len(self.levels[self.level]))
+
+    def __poll(self):
+        finished = [future for future in self.__pending if future.done()]
+        for future in finished:
+            extr, nodes, center = self.__pending.pop(future)
+            self.done += 1
+            try:
+                coords = future.result()
+            except Exception:
+                traceback.print_exc()
+                continue
+            if pnv.layout.has_full_layout(extr.inner_net):
+                continue
+            size = (PnvDrawer.GRAPHICS_WIDTH, PnvDrawer.GRAPHICS_WIDTH)
+            for node, (x, y) in zip(nodes, coords.tolist()):
+                node.properties['layout_information_petri'] = ((x, y), size)
+            self.drawer.precomputed[extr] = center
+            self.drawer.status.layout_generated = True
+        if finished:
+            self.progress.emit(self.level + 1, len(self.levels), self.done, len(self.levels[self.level]))
+        if not self.__pending:
+            self.__next_level()
+
+    def stop(self):
+        self.__finish()
+
+    def __finish(self):
+        if not self.running:
+            return
+        self.running = False
+        self.__timer.stop()
+        # nets being laid out are let finish in their processes, the rest is dropped
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+        self.__pending.clear()
+        self.drawer.subnet_layouter = None
+        self.finished.emit()
+
+
+class PnvSelectionRelaxer(QtCore.QObject):
+    """
+    Tidies selected items by pnv.layout.SelectionRelaxation on the GUI thread, at frame rate: every frame runs
+    steps for at most STEP_BUDGET_S, then the items are moved in one batch and their arrows updated once. The
+    unselected items around them, as far as the selection may spread, stay and hold them in place; arcs to items
+    farther away are left out, they would drag the selection across the net.
+    """
+    FRAME_MS = 16
+    STEP_BUDGET_S = 0.008
+    # so the relaxation of a small selection is seen
+    MAX_STEPS_PER_FRAME = 10
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, drawer: PnvDrawer, objs: list[Union[PnvQGTransitionItem, PnvQGPlaceItem]]):
+        super(PnvSelectionRelaxer, self).__init__()
+        self.drawer = drawer
+        self.objs = objs
+        index = {obj: i for i, obj in enumerate(objs)}
+        fixed = []
+        # room for the selection on a grid of two widths
+        margin = 2 * PnvDrawer.GRAPHICS_WIDTH * (np.sqrt(len(objs)) + 1)
+        minx, miny, maxx, maxy = PnvDrawer.bounds(objs)
+        for obj in drawer.scene.items(QtCore.QRectF(minx - margin, miny - margin,
+                                                    maxx - minx + 2 * margin, maxy - miny + 2 * margin)):
+            if isinstance(obj, (PnvQGTransitionItem, PnvQGPlaceItem)) and obj.petri_net_bound() is not None \
+                    and obj not in index:
+                index[obj] = len(objs) + len(fixed)
+                fixed.append(obj)
+        edges = [(index[arr.from_], index[arr.to]) for arr in {arr for obj in objs for arr in obj.arrows()}
+                 if arr.from_ in index and arr.to in index]
+        coords = np.array([PnvDrawer.final_pos(obj) for obj in [*objs, *fixed]], dtype=float)
+        self.relaxation = pnv.layout.SelectionRelaxation(coords, len(objs), edges)
+        self.nodes = [obj.petri_net_bound() for obj in objs]
+        self.running = True
+        # the scene stays indexed, unlike for PnvLayoutRefiner: a few moved items cost less than a new index
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.timeout.connect(self.__frame)
+        self.__timer.start(PnvSelectionRelaxer.FRAME_MS)
+
+    def __frame(self):
+        start = time.perf_counter()
+        for _ in range(PnvSelectionRelaxer.MAX_STEPS_PER_FRAME):
+            if self.relaxation.is_finished() or time.perf_counter() - start >= PnvSelectionRelaxer.STEP_BUDGET_S:
+                break
+            self.relaxation.step()
+        self.drawer.move_items(self.nodes, self.relaxation.scaled())
+        if self.relaxation.is_finished():
+            self.__finish()
+
+    def stop(self):
+        self.__finish()
+
+    def __finish(self):
+        if not self.running:
+            return
+        self.running = False
+        self.__timer.stop()
+        self.drawer.relaxation_finished(self.objs)
+        self.finished.emit()
+
+
 def mod(num: int, other: int):
     return -abs(num % other)
 
@@ -857,10 +1421,28 @@ class PnvViewScaler:
         else:
             self.__viewer.grid_distance = 200
             self.__viewer.bg_grid_pen.setWidthF(3)
+        self.sync_detail()
 
     def scale_factor(self):
         return self.inwards ** self.scaler
 
+    @staticmethod
+    def detail_at(sf: float) -> int:
+        # details a few pixels across at this zoom are not painted, see PnvDetail
+        detail = PnvDetail.FULL
+        for level, scale in ((PnvDetail.PLAIN, PnvConfig.INSTANCE.detail_plain_scale),
+                             (PnvDetail.FLAT, PnvConfig.INSTANCE.detail_flat_scale),
+                             (PnvDetail.LINES, PnvConfig.INSTANCE.detail_lines_scale)):
+            if sf < scale:
+                detail = level
+        return detail
+
+    def sync_detail(self):
+        detail = PnvViewScaler.detail_at(self.scale_factor())
+        if detail != self.__viewer.drawer.detail:
+            self.__viewer.drawer.detail = detail
+            self.__viewer.viewport().update()
+
 
 class PnvViewTransformer:
     def __init__(self, view: 'PnvViewer'):
@@ -928,65 +1510,14 @@ class PnvItemsTransformer(PnvToggleableComponent):
         self.__viewer = view
         self.moving = False
         self.__start_pos = None  # transform started mark
+        self.__moved = False
 
     def __update_hn_cover(self):
         if not self.__viewer.drawer.is_review_mode():
             return
         obj, *_ = self.__viewer.view_selector.selected_items
         obj: Hierarchical
-        if len(obj.hiernode_bound().value) < 4:
-            return
-        hn = obj.hiernode_bound()
-        _, _, lst, cover = hn.value
-
-        cover: QGraphicsRectItem
-        minx, miny, maxx, maxy = PnvDrawer.bounds(lst)
-        for c in hn.children():
-            c: HierNode
-            if len(c.value) < 4 or c.value[3] is None:
-                continue
-            _, _, _, c_cover = c.value
-            c_cover: QGraphicsRectItem
-            minx = min(minx, c_cover.rect().x())
-            miny = min(miny, c_cover.rect().y())
-            c_maxx = c_cover.rect().x() + c_cover.rect().width()
-            c_maxy = c_cover.rect().y() + c_cover.rect().height()
-            maxx = max(maxx, c_maxx)
-            maxy = max(maxy, c_maxy)
-        padding = PnvDrawer.GRAPHICS_WIDTH
-        txt, *_ = cover.childItems()
-        padding_top = QtGui.QFontMetrics(txt.font()).height() + padding
-        cover.setRect(Qt.QRectF(minx - padding, miny - padding_top, maxx - minx + 2 * padding, maxy - miny + 3 * padding))
-        txt.setPos(minx - padding, miny - padding_top)
-
-        par = hn.parent
-        while par:
-            par: HierNode
-            if len(par.value) < 4 or par.value[3] is None:
-                break
-            _, _, _, par_cover = par.value
-            par_cover: QGraphicsRectItem
-            minx = cover.rect().x() - padding
-            miny = cover.rect().y() - padding_top
-            maxx = cover.rect().x() + cover.rect().width() + padding
-            maxy = cover.rect().y() + cover.rect().height() + padding
-
-            if minx < par_cover.rect().x() or \
-                    miny < par_cover.rect().y() or \
-                    maxx > par_cover.rect().x() + par_cover.rect().width() or \
-                    maxy > par_cover.rect().y() + par_cover.rect().height():
-                minx = min(minx, par_cover.rect().x())
-                miny = min(miny, par_cover.rect().y())
-                maxx = max(maxx, par_cover.rect().x() + par_cover.rect().width())
-                maxy = max(maxy, par_cover.rect().y() + par_cover.rect().height())
-                par_cover.setRect(Qt.QRectF(minx, miny, maxx-minx, maxy-miny))
-
-                txt, *_ = par_cover.childItems()
-                txt.setPos(minx, miny)
-                par = par.parent
-                cover = par_cover
-            else:
-                break
+        self.__viewer.drawer.hn_cover_fit(obj.hiernode_bound())
 
     def __transform(self, to: QPoint):
         arrows = set()
@@ -999,17 +1530,28 @@ class PnvItemsTransformer(PnvToggleableComponent):
 
         self.__update_hn_cover()
         self.__viewer.drawer.status.layout_changed = True
+        self.__moved = True
 
     def __is_started(self):
         return self.__start_pos
 
     def __start_transform(self):
+        self.__viewer.drawer.stop_refinement()
+        self.__viewer.drawer.stop_relaxation()
         self.__start_pos = self.__viewer.mouse_ctrl.last_pos()
         QtGui.QGuiApplication.setOverrideCursor(Qt.Qt.SizeAllCursor)
         self.__viewer.edited_status = True
 
     def __stop_transform(self):
         self.__start_pos = None
+        if self.__moved:
+            # one record per drag, with the final positions
+            self.__moved = False
+            self.__viewer.drawer.record_moves(self.__viewer.view_selector.selected_items)
+            if PnvConfig.INSTANCE.remove_overlaps_on_drop:
+                # the dropped items stay where they were put, the ones under and around them give way
+                selected = list(self.__viewer.view_selector.selected_items)
+                self.__viewer.drawer.remove_overlaps(selected, selected)
         QtGui.QGuiApplication.setOverrideCursor(Qt.Qt.ArrowCursor)
 
     def __pass_loyal_offset(self):
@@ -1302,7 +1844,8 @@ class GraphHierTree(QTreeView):
         qmodel.setHeaderData(0, Qt.Qt.Orientation.Horizontal, root.name)
         self.setModel(qmodel)
         self.resize(self.sizeHint().width(), self.sizeHint().height())
-        self.expandAll()
+        # inner nets are built as their items are expanded
+        self.expanded.connect(lambda index: HierNode.fetch_tree(qmodel.itemFromIndex(index)))
 
     def update_pos(self):
         x = self.__padding_x
@@ -1416,6 +1959,8 @@ class PnvViewer(QGraphicsView):
                                 '&Соединить', self.arc_connect)
         else:
             cmenu.addAction(PnvIcons.WRAP_ICON, '&Свернуть в подсеть', self.enclose_selected)
+            cmenu.addAction(self.scene().style().standardIcon(QStyle.StandardPixmap.SP_BrowserReload),
+                            '&Упорядочить', self.relax_selected)
         self.__context_blocked = True
         cmenu.exec(pos)
 
@@ -1492,6 +2037,9 @@ class PnvViewer(QGraphicsView):
             PnvMessageBoxes.warning(f"Невозможно сделать вложенную сеть!",
                                     f"{ex}").exec()
 
+    def relax_selected(self):
+        self.drawer.relax(self.view_selector.selected_items)
+
     def drawBackground(self, painter: Optional[QtGui.QPainter], rect: QtCore.QRectF) -> None:
         painter.fillRect(rect, self.scene().backgroundBrush())
         if self.edit_mode_btn.mode() == PnvConfigConstants.ENTER_MODE_VIEW:
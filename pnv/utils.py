@@ -104,6 +104,8 @@ class PnvMessageBoxes:
 
 class PnvConfigConstants:
     IGRAPH_GEN_MODE_AUTO = 'auto'
+    IGRAPH_GEN_MODE_COMPONENTS = 'components'
+    IGRAPH_GEN_MODE_MULTILEVEL = 'multilevel'
 
     ENTER_MODE_VIEW = 'view'
     ENTER_MODE_EXPLORE = 'explore'
@@ -155,6 +157,20 @@ class PnvConfig:
             "#FF9696"
         ]
         self.global_mode: str = PnvConfigConstants.GLOBAL_MODE_REVIEW
+        self.cache_capacity_mb: int = 512
+        self.journal_sync_ms: int = 1000
+        # nets without layout of at least so many places and transitions are shown at once and laid out meanwhile,
+        # 0 turns it off
+        self.progressive_layout_nodes: int = 5000
+        # inner nets without layout are laid out in the background once a net is shown, unwrapping them only draws
+        self.precompute_subnet_layouts: bool = False
+        # items a drag leaves under the dropped ones are moved aside
+        self.remove_overlaps_on_drop: bool = True
+        # zoom below which labels, tokens and arrowheads are not drawn, then nodes are plain rectangles,
+        # then arcs are thin lines
+        self.detail_plain_scale: float = 0.6
+        self.detail_flat_scale: float = 0.3
+        self.detail_lines_scale: float = 0.15
         # folder name
         folder_name = folder_name.replace(' ', '')
         if len(folder_name) == 0:
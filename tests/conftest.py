@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from pm4py.objects.petri_net.obj import PetriNet, Marking
+from pm4py.objects.petri_net.utils.petri_utils import add_arc_from_to
+
+from pnv.importer.epnml import ExtendedTransition, add_floating_arc_from_to
+
+
+def net_level(prefix: str, size: int, outer: list[PetriNet.Place] = None) -> tuple[PetriNet, Marking, Marking]:
+    # a ring of places and transitions with a weighted chord, a silent transition and a layout
+    net = PetriNet(f'{prefix}net')
+    places = [PetriNet.Place(f'{prefix}p{i}') for i in range(size)]
+    transitions = [PetriNet.Transition(f'{prefix}t{i}', f'{prefix}t{i}' if i else None) for i in range(size)]
+    for i, node in enumerate(places + transitions):
+        node.properties['layout_information_petri'] = ((float(i * 100), float(i % 3 * 50)), (40.0, 40.0))
+    net.places.update(places)
+    net.transitions.update(transitions)
+    for i in range(size):
+        add_arc_from_to(places[i], transitions[i], net)
+        add_arc_from_to(transitions[i], places[(i + 1) % size], net)
+    add_arc_from_to(transitions[0], places[-1], net, weight=3)
+    if outer:
+        # boundary arcs of an inner net lead to the places of the enclosing one
+        add_floating_arc_from_to(outer[0], transitions[0], net, inner_fr=False)
+        add_floating_arc_from_to(transitions[-1], outer[-1], net, inner_fr=True)
+    im, fm = Marking(), Marking()
+    im[places[0]] = 2
+    fm[places[-1]] = 1
+    return net, im, fm
+
+
+def hierarchical_net(depth: int = 2, size: int = 4, prefix: str = '', outer=None):
+    net, im, fm = net_level(prefix, size, outer)
+    if depth > 0:
+        extr = ExtendedTransition(f'{prefix}g', f'{prefix}g')
+        extr.properties['layout_information_petri'] = ((-100.0, -100.0), (40.0, 40.0))
+        net.transitions.add(extr)
+        places = sorted(net.places, key=lambda p: p.name)
+        add_arc_from_to(places[1], extr, net)
+        extr.inject_net(*hierarchical_net(depth - 1, size, f'{prefix}g_', places))
+    return net, im, fm
+
+
+def signature(net, im, fm):
+    # everything the writers keep, with inner nets, comparable between imports
+    def names(marking):
+        return None if marking is None else sorted((p.name, n) for p, n in marking.items())
+
+    return (
+        sorted((p.name, p.properties.get('layout_information_petri')) for p in net.places),
+        sorted((t.name, t.label, t.properties.get('layout_information_petri')) for t in net.transitions),
+        sorted((a.source.name, a.target.name, a.weight) for a in net.arcs),
+        names(im), names(fm),
+        sorted((t.name, signature(t.inner_net, t.init_marking, t.final_marking)) for t in net.transitions
+               if isinstance(t, ExtendedTransition)),
+    )
+
+
+@pytest.fixture
+def net():
+    return hierarchical_net()
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def config(qapp, tmp_path, monkeypatch):
+    # the default configuration in a temporary folder and empty icons, set up by main.py in the application
+    from PyQt5.QtGui import QIcon
+    from pnv.utils import PnvConfig, PnvIcons
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path))
+    for name in [n for n in vars(PnvIcons) if n.endswith('_ICON')]:
+        monkeypatch.setattr(PnvIcons, name, QIcon())
+    monkeypatch.setattr(PnvConfig, 'INSTANCE', PnvConfig('pnvtest'))
+    return PnvConfig.INSTANCE
@@ -0,0 +1,69 @@
+import argparse
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from pnv import batch, layout
+from pnv.importer import epnml, pnvb
+
+GRAPHS = Path(__file__).parent.parent / 'test_graphs'
+
+
+def parse(*argv):
+    parser = argparse.ArgumentParser()
+    batch.add_parser(parser.add_subparsers())
+    return parser.parse_args(['batch', *map(str, argv)])
+
+
+def test_directory_converted(tmp_path):
+    inputs = tmp_path / 'in'
+    (inputs / 'sub').mkdir(parents=True)
+    shutil.copy(GRAPHS / 'Layoutless.pnml', inputs / 'sub')
+    shutil.copy(GRAPHS / 'epnml' / 'BrandNewWrapped.epnml', inputs)
+    report = tmp_path / 'report.json'
+    args = parse(inputs, '--to', 'pnvb', '--out', tmp_path / 'out', '--workers', 1, '--report', report)
+    assert args.command(args) == 0
+    files = json.loads(report.read_text())['files']
+    assert sorted(f['status'] for f in files) == [batch.STATUS_CONVERTED] * 2
+    net = pnvb.import_net(tmp_path / 'out' / 'sub' / 'Layoutless.pnvb')[0]
+    assert layout.has_full_layout(net)
+    assert sorted(f.name for f in (tmp_path / 'out').rglob('*')) == ['BrandNewWrapped.pnvb', 'Layoutless.pnvb', 'sub']
+    # outputs newer than their inputs are left alone
+    assert args.command(args) == 0
+    files = json.loads(report.read_text())['files']
+    assert [f['status'] for f in files] == [batch.STATUS_SKIPPED] * 2
+
+
+def test_failed_file_reported(tmp_path):
+    broken = tmp_path / 'broken.epnml'
+    broken.write_text('<pnml><net')
+    shutil.copy(GRAPHS / 'Hairdresser.pnml', tmp_path)
+    args = parse(tmp_path / '*.*pnml', '--to', 'epnml', '--compress', 'gz', '--workers', 1, '--layout', 'none')
+    assert args.command(args) == 1
+    assert not (tmp_path / 'broken.epnml.gz').exists()
+    net = epnml.import_net(str(tmp_path / 'Hairdresser.epnml.gz'))[0]
+    assert {p.name for p in net.places} == {p.name for p in epnml.import_pnml(str(GRAPHS / 'Hairdresser.pnml'))[0].places}
+
+
+def test_failed_write_keeps_the_old_output(tmp_path, monkeypatch):
+    output = tmp_path / 'net.epnml'
+    output.write_bytes(b'old')
+    net, im, fm = epnml.import_pnml(str(GRAPHS / 'Hairdresser.pnml'))
+
+    def export_net(net, im, path, fm):
+        Path(path).write_bytes(b'partial')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(epnml, 'export_net', export_net)
+    with pytest.raises(KeyboardInterrupt):
+        batch.write_net(net, im, fm, str(output))
+    assert output.read_bytes() == b'old'
+    assert [p.name for p in tmp_path.iterdir()] == ['net.epnml']
+
+
+def test_unknown_mode_rejected(capsys):
+    with pytest.raises(SystemExit):
+        parse('in', '--mode', 'fastest')
+    assert 'invalid choice' in capsys.readouterr().err
@@ -0,0 +1,103 @@
+import gc
+import os
+from pathlib import Path
+
+import pytest
+
+from pnv.cache import PnvCache
+from pnv.importer import epnml
+from pnv.importer.epnml import ExtendedTransition
+
+WRAPPED = Path(__file__).parent.parent / 'test_graphs' / 'epnml' / 'BrandNewWrapped.epnml'
+HAIRDRESSER = Path(__file__).parent.parent / 'test_graphs' / 'Hairdresser.pnml'
+
+
+@pytest.fixture
+def cache(config, tmp_path):
+    return PnvCache(tmp_path)
+
+
+def entries(cache) -> set[str]:
+    return {p.stem for p in cache.folder.glob('*' + PnvCache.META_FORMAT)}
+
+
+def test_hit_keeps_inner_nets_unbuilt(cache):
+    key = PnvCache.key_of(str(WRAPPED))
+    assert cache.load(key) is None
+    pn, im, fm = epnml.import_net_stream(str(WRAPPED))
+    cache.store(key, pn, im, fm, False)
+    cached = cache.load(key)
+    assert cached is not None
+    top, = [t for t in cached[0].transitions if isinstance(t, ExtendedTransition)]
+    assert not top.is_materialized()
+    assert {p.name for p in top.inner_net.places} == {'p2', 'p4'}
+    assert cached[3] is False
+
+
+def test_key_follows_content(tmp_path):
+    path = tmp_path / 'net.pnml'
+    path.write_bytes(HAIRDRESSER.read_bytes())
+    key = PnvCache.key_of(str(path))
+    assert PnvCache.key_of(str(HAIRDRESSER)) == key
+    path.write_bytes(HAIRDRESSER.read_bytes() + b' ')
+    assert PnvCache.key_of(str(path)) != key
+
+
+def test_layout_settings_invalidate_generated_layouts(cache, config):
+    pn, im, fm = epnml.import_pnml(str(HAIRDRESSER))
+    cache.store('generated', pn, im, fm, True)
+    cache.store('read', pn, im, fm, False)
+    config.igraph_gen_mode = 'multilevel' if config.igraph_gen_mode != 'multilevel' else 'components'
+    assert cache.load('generated') is None
+    assert 'generated' not in entries(cache)
+    assert cache.load('read') is not None
+
+
+def fill(cache, keys) -> int:
+    # entries used in the order of keys, returns the size of one
+    pn, im, fm = epnml.import_pnml(str(HAIRDRESSER))
+    for i, key in enumerate(keys):
+        cache.store(key, pn, im, fm, False)
+        meta = cache.folder / (key + PnvCache.META_FORMAT)
+        os.utime(meta, (1000 + i, 1000 + i))
+    return sum(p.stat().st_size for p in cache.folder.glob(keys[0] + '.*'))
+
+
+def test_least_recently_used_evicted(cache, monkeypatch):
+    size = fill(cache, ['a', 'b', 'c'])
+    monkeypatch.setattr(PnvCache, 'capacity', staticmethod(lambda: 2 * size))
+    cache.evict()
+    assert entries(cache) == {'b', 'c'}
+
+
+def test_mapped_entries_kept(cache, monkeypatch):
+    pn, im, fm = epnml.import_net_stream(str(WRAPPED))
+    cache.store('opened', pn, im, fm, False)
+    size = fill(cache, ['a', 'b'])
+    opened = cache.load('opened')
+    os.utime(cache.folder / ('opened' + PnvCache.META_FORMAT), (0, 0))
+    monkeypatch.setattr(PnvCache, 'capacity', staticmethod(lambda: size))
+    cache.evict()
+    # the oldest entry is open with its inner net unbuilt, it counts but is not removed
+    assert entries(cache) == {'opened'}
+    del opened
+    gc.collect()
+    monkeypatch.setattr(PnvCache, 'capacity', staticmethod(lambda: 0))
+    cache.evict()
+    assert entries(cache) == set()
+
+
+def test_failed_removal_not_counted(cache, monkeypatch):
+    size = fill(cache, ['a', 'b', 'c'])
+    monkeypatch.setattr(PnvCache, 'capacity', staticmethod(lambda: 2 * size))
+    unlink = Path.unlink
+
+    def locked(path, missing_ok=False):
+        if path.name.startswith('a.'):
+            raise PermissionError(path)
+        unlink(path, missing_ok)
+
+    monkeypatch.setattr(Path, 'unlink', locked)
+    cache.evict()
+    # 'a' still takes its space, so 'b' goes as well
+    assert entries(cache) == {'a', 'c'}
@@ -0,0 +1,39 @@
+import gzip
+
+import pytest
+
+from conftest import signature
+from pnv.importer import epnml
+from pnv.importer.compression import COMPRESSED_SUFFIXES, GZIP_SUFFIX, ZSTD_SUFFIX
+
+
+def decompress(path) -> bytes:
+    if path.suffix == GZIP_SUFFIX:
+        return gzip.decompress(path.read_bytes())
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(path.read_bytes()).read()
+
+
+@pytest.mark.parametrize('suffix', COMPRESSED_SUFFIXES)
+def test_same_net_same_bytes(net, tmp_path, suffix):
+    first, second = tmp_path / ('first.epnml' + suffix), tmp_path / ('second.epnml' + suffix)
+    epnml.export_net(*net[:2], first, net[2])
+    epnml.export_net(*net[:2], second, net[2])
+    assert first.read_bytes() == second.read_bytes()
+
+
+@pytest.mark.parametrize('suffix', COMPRESSED_SUFFIXES)
+def test_content_as_uncompressed(net, tmp_path, suffix):
+    plain, packed = tmp_path / 'net.epnml', tmp_path / ('net.epnml' + suffix)
+    epnml.export_net(*net[:2], plain, net[2])
+    epnml.export_net(*net[:2], packed, net[2])
+    assert decompress(packed) == plain.read_bytes()
+    for importer in (epnml.import_net, epnml.import_net_stream):
+        assert signature(*importer(str(packed))) == signature(*net)
+
+
+def test_zstd_requires_zstandard(net, tmp_path):
+    if ZSTD_SUFFIX in COMPRESSED_SUFFIXES:
+        pytest.skip('zstandard is installed')
+    with pytest.raises(ImportError):
+        epnml.export_net(*net[:2], tmp_path / ('net.epnml' + ZSTD_SUFFIX), net[2])
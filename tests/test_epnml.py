@@ -0,0 +1,258 @@
+import gzip
+import io
+import uuid
+import warnings
+from pathlib import Path
+
+import pytest
+from lxml import etree
+from pm4py.objects.petri_net.obj import PetriNet, Marking
+
+from conftest import hierarchical_net, signature
+from pnv.importer import epnml
+from pnv.importer.epnml import ExtendedTransition
+
+
+GRAPHS = Path(__file__).parent.parent / 'test_graphs'
+PNML_FILES = sorted(GRAPHS.glob('**/*.pnml'))
+EPNML_FILES = sorted(GRAPHS.glob('**/*.epnml'))
+
+
+def extended(net):
+    return [t for t in net.transitions if isinstance(t, ExtendedTransition)]
+
+
+class Chunks(io.RawIOBase):
+    # a stream that cannot seek and hands out a few bytes a read
+    def __init__(self, data: bytes, size: int = 64):
+        self.data = data
+        self.size = size
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.size, len(self.data))
+        b[:n], self.data = self.data[:n], self.data[n:]
+        self.reads += 1
+        return n
+
+
+@pytest.mark.parametrize('path', PNML_FILES + EPNML_FILES, ids=lambda p: p.name)
+def test_stream_import_matches_document_import(path):
+    expected = signature(*epnml.import_net(str(path)))
+    assert signature(*epnml.import_net_stream(str(path))) == expected
+    stream = Chunks(path.read_bytes())
+    assert signature(*epnml.import_net_stream(stream)) == expected
+    assert stream.reads > len(path.read_bytes()) // 64
+
+
+def test_stream_import_of_compressed_file(tmp_path):
+    path = GRAPHS / 'epnml' / 'BrandNewWrapped.epnml'
+    packed = tmp_path / 'net.epnml.gz'
+    packed.write_bytes(gzip.compress(path.read_bytes()))
+    net = epnml.import_net_stream(str(packed))[0]
+    top, = extended(net)
+    assert not top.is_materialized()
+    assert signature(net, None, None) == signature(epnml.import_net(str(path))[0], None, None)
+
+
+def test_round_trip(net, tmp_path):
+    path = tmp_path / 'net.epnml'
+    epnml.export_net(*net[:2], path, net[2])
+    for importer in (epnml.import_net, epnml.import_net_stream):
+        assert signature(*importer(str(path))) == signature(*net)
+
+
+def test_same_net_same_bytes(net, tmp_path):
+    # silent transitions included
+    first, second = tmp_path / 'first.epnml', tmp_path / 'second.epnml'
+    epnml.export_net(*net[:2], first, net[2])
+    epnml.export_net(*net[:2], second, net[2])
+    assert first.read_bytes() == second.read_bytes()
+
+
+def test_inner_nets_written_back_unbuilt(net, tmp_path):
+    path, again = tmp_path / 'net.epnml', tmp_path / 'again.epnml'
+    epnml.export_net(*net[:2], path, net[2])
+    read = epnml.import_net_stream(str(path))
+    snapshot = epnml.snapshot_net(*read)
+    epnml.export_net(*snapshot[:2], again, snapshot[2])
+    assert not any(t.is_materialized() for t in extended(read[0]))
+    assert signature(*epnml.import_net(str(again))) == signature(*net)
+
+
+def test_inner_arcs_reach_outer_places(tmp_path):
+    net = hierarchical_net(depth=3)
+    path = tmp_path / 'net.epnml'
+    epnml.export_net(*net[:2], path, net[2])
+    level = epnml.import_net_stream(str(path))[0]
+    while extended(level):
+        outer = {p.name: p for p in level.places}
+        inner = extended(level)[0].inner_net
+        floating = [a for a in inner.arcs if a.source.name in outer or a.target.name in outer]
+        assert len(floating) == 2
+        for arc in floating:
+            place = arc.source if arc.source.name in outer else arc.target
+            assert place is outer[place.name]
+            assert arc not in place.in_arcs | place.out_arcs
+        level = inner
+
+
+def test_outer_places_shadow_inner_ones(tmp_path):
+    # the inner net defines a place with the id of an outer one, its arcs lead to the outer place
+    path = tmp_path / 'shadow.epnml'
+    path.write_text(
+        '<pnml><net id="n"><page id="a">'
+        '<place id="p"><name><text>p</text></name></place>'
+        '<transition id="g"><name><text>g</text></name><page id="b">'
+        '<place id="p"><name><text>p</text></name></place>'
+        '<transition id="t"><name><text>t</text></name></transition>'
+        '<arc id="a1" source="p" target="t"/>'
+        '</page></transition>'
+        '</page></net></pnml>')
+    for importer in (epnml.import_net, epnml.import_net_stream):
+        net = importer(str(path))[0]
+        outer, = net.places
+        arc, = extended(net)[0].inner_net.arcs
+        assert arc.source is outer
+
+
+def test_silent_transitions_marked_by_the_streaming_writer_only(tmp_path):
+    net = PetriNet('n')
+    net.transitions.add(PetriNet.Transition('tau', None))
+    path = tmp_path / 'net.epnml'
+    epnml.export_net(net, Marking(), path)
+    tool, = etree.parse(str(path)).iter('toolspecific')
+    assert tool.get('activity') == '$invisible$'
+    assert tool.get('localNodeID') == str(uuid.uuid5(uuid.NAMESPACE_OID, 'tau'))
+    silent, = epnml.import_net(str(path))[0].transitions
+    assert silent.label is None
+    # the tree exporter writes what it always did
+    assert b'toolspecific' not in epnml.export_petri_as_string(net, Marking())
+
+
+def pm4py_import(path):
+    from pm4py.objects.petri_net.importer.variants import pnml as pm4py_pnml
+    with warnings.catch_warnings():
+        # about the final marking missing, read as None
+        warnings.simplefilter('ignore')
+        return pm4py_pnml.import_net(str(path), parameters={'auto_guess_final_marking': False})
+
+
+def typed_arcs(net):
+    return sorted((a.source.name, a.target.name, a.weight, a.properties.get('arctype')) for a in net.arcs)
+
+
+def test_walker_reads_as_pm4py(tmp_path):
+    # namespaced tags, arcs ahead of their nodes, weights, arc types, silent and data transitions
+    path = tmp_path / 'net.pnml'
+    path.write_text(
+        '<pnml xmlns="http://www.pnml.org/version-2009/grammar/pnml"><net id="n"><page id="a">'
+        '<arc id="a1" source="p1" target="t1"><inscription><text>3</text></inscription></arc>'
+        '<arc id="a2" source="t1" target="p2"/>'
+        '<arc id="a3" source="p2" target="t2"><arctype><text>inhibitor</text></arctype></arc>'
+        '<arc id="a4" source="p1" target="t2"><arctype><text>reset</text></arctype></arc>'
+        '<place id="p1"><name><text>first</text></name><initialMarking><text>2</text></initialMarking>'
+        '<graphics><position x="1" y="2"/><dimension x="40" y="40"/></graphics></place>'
+        '<transition id="t1" guard="x &gt; 1"><name><text>work</text></name><writeVariable>x</writeVariable>'
+        '</transition>'
+        '<transition id="t2"><name><text>t2</text></name>'
+        '<toolspecific tool="ProM" version="6.4" activity="$invisible$" localNodeID="1"/></transition>'
+        '<place id="p2"><name><text>p2</text></name></place>'
+        '</page></net></pnml>')
+    expected = pm4py_import(path)
+    assert {a[3] for a in typed_arcs(expected[0])} == {None, 'inhibitor', 'reset'}
+    for importer in (epnml.import_net, epnml.import_net_stream, epnml.import_pnml):
+        net, im, fm = importer(str(path))
+        assert signature(net, im, fm) == signature(*expected)
+        assert typed_arcs(net) == typed_arcs(expected[0])
+        assert sorted((t.name, sorted(t.properties.items())) for t in net.transitions) == \
+               sorted((t.name, sorted(t.properties.items())) for t in expected[0].transitions)
+
+
+@pytest.mark.parametrize('path', PNML_FILES, ids=lambda p: p.name)
+def test_walker_reads_files_as_pm4py(path):
+    expected = pm4py_import(path)
+    assert signature(*epnml.import_net(str(path))) == signature(*expected)
+
+
+def arcs_of(net, name):
+    return {(a.source, a.target) for a in net.arcs if name in (a.source.name, a.target.name)}
+
+
+def test_sibling_groups_keep_their_places(tmp_path):
+    # copies of the group of BrandNewWrapped side by side, each defines its own p2 and p4
+    tree = etree.parse(str(GRAPHS / 'epnml' / 'BrandNewWrapped.epnml'))
+    page = tree.find('net/page')
+    group = page.find('transition')
+    for i in range(200):
+        copy = etree.fromstring(etree.tostring(group))
+        copy.set('id', f'copy{i}')
+        page.append(copy)
+    path = tmp_path / 'wide.epnml'
+    tree.write(str(path))
+    for importer in (epnml.import_net, epnml.import_net_stream):
+        net = importer(str(path))[0]
+        p1, = [p for p in net.places if p.name == 'p1']
+        groups = extended(net)
+        assert len(groups) == 201
+        inner_places = set()
+        for g in groups:
+            inner = g.inner_net
+            own = {p.name: p for p in inner.places}
+            inner_places.update(own.values())
+            t3, = [t for t in inner.transitions if t.name == 't3']
+            assert arcs_of(inner, 't3') == {(p1, t3), (t3, own['p4'])}
+        assert len(inner_places) == 2 * 201
+
+
+def test_deep_levels_reach_the_top(tmp_path):
+    # every level below the top defines a place p, its transition has arcs from p and from p0 of the top level:
+    # the outermost definition of p is the one of level 1
+    depth = 300
+    content = ''
+    for level in reversed(range(depth)):
+        arcs = f'<arc id="a{level}" source="p0" target="t{level}"/><arc id="b{level}" source="p" target="t{level}"/>'
+        group = f'<transition id="g{level}"><name><text>g</text></name><page id="n">{content}</page></transition>'
+        content = (f'<place id="p{level if level == 0 else ""}"/><transition id="t{level}"/>'
+                   f'{arcs if level else ""}{group if level < depth - 1 else ""}')
+    path = tmp_path / 'deep.epnml'
+    path.write_text(f'<pnml><net id="n"><page id="n">{content}</page></net></pnml>')
+    for importer in (epnml.import_net, epnml.import_net_stream):
+        net = importer(str(path))[0]
+        p0, = net.places
+        net = extended(net)[0].inner_net
+        p, = net.places
+        for level in range(1, depth):
+            t, = [t for t in net.transitions if t.name == f't{level}']
+            assert {a.source for a in net.arcs if a.target is t} == {p0, p}
+            if level < depth - 1:
+                net = extended(net)[0].inner_net
+
+
+def pm4py_read(path):
+    import pm4py
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pm4py.read_pnml(str(path))
+
+
+@pytest.mark.parametrize('path', PNML_FILES + EPNML_FILES, ids=lambda p: p.name)
+def test_pnml_reader_reads_as_pm4py(path):
+    # final markings included, None where there is none; inner pages of .epnml files are skipped by both
+    expected = pm4py_read(path)
+    net, im, fm = epnml.import_pnml(str(path))
+    assert signature(net, im, fm) == signature(*expected)
+    assert (fm is None) == (expected[2] is None)
+    assert not extended(net)
+
+
+def test_pnml_reader_reads_compressed_streams(tmp_path):
+    path = GRAPHS / 'Hairdresser.pnml'
+    packed = tmp_path / 'net.pnml.gz'
+    packed.write_bytes(gzip.compress(path.read_bytes()))
+    assert signature(*epnml.import_pnml(str(packed))) == signature(*pm4py_read(path))
+    with open(path, 'rb') as F:
+        assert signature(*epnml.import_pnml(F)) == signature(*pm4py_read(path))
@@ -0,0 +1,93 @@
+import types
+
+import pytest
+
+from pnv.importer.epnml import ExtendedTransition
+from pnv.journal import PnvJournalStore, replay
+from pnv.utils import PnvConfig
+
+
+def node(net, name):
+    return next(n for n in (*net.places, *net.transitions) if n.name == name)
+
+
+def test_replay_edits(net):
+    pn, im, fm = net
+    records = [
+        {'op': 'place_create', 'name': 'new_p', 'x': 10.0, 'y': 20.0},
+        {'op': 'transition_create', 'name': 'new_t', 'x': 30.0, 'y': 40.0},
+        {'op': 'arc_create', 'source': 'new_p', 'target': 'new_t'},
+        {'op': 'arc_remove', 'source': 'p1', 'target': 't1'},
+        {'op': 'node_remove', 'name': 't2'},
+        {'op': 'move', 'nodes': [['p1', 5.0, 6.0]]},
+        {'op': 'tokens', 'name': 'new_p', 'count': 3},
+        {'op': 'tokens', 'name': 'p0', 'count': 0},
+        {'op': 'final', 'name': 'p1', 'final': True},
+    ]
+    im, fm, failed = replay(records, pn, im, fm)
+    assert failed == 0
+    new_p, new_t, p1 = node(pn, 'new_p'), node(pn, 'new_t'), node(pn, 'p1')
+    assert new_p.properties['layout_information_petri'][0] == (10.0, 20.0)
+    assert [a.target for a in new_p.out_arcs] == [new_t]
+    assert not any(a.target.name == 't1' for a in p1.out_arcs)
+    assert 't2' not in {t.name for t in pn.transitions}
+    assert not any('t2' in (a.source.name, a.target.name) for a in pn.arcs)
+    assert p1.properties['layout_information_petri'][0] == (5.0, 6.0)
+    assert {p.name: n for p, n in im.items()} == {'new_p': 3}
+    assert {p.name for p in fm} == {'p1', 'p3'}
+
+
+def test_replay_unwrap_and_wrap(net):
+    pn = net[0]
+    _, _, failed = replay([{'op': 'unwrap', 'name': 'g'}], pn, None, None)
+    assert failed == 0
+    assert 'g_p0' in {p.name for p in pn.places}
+    assert not any(isinstance(t, ExtendedTransition) and t.name == 'g' for t in pn.transitions)
+    _, _, failed = replay([{'op': 'wrap', 'nodes': ['g_p0', 'g_t0'], 'name': 'w', 'label': 'w', 'net': 'wn',
+                            'x': 0.0, 'y': 0.0}], pn, None, None)
+    assert failed == 0
+    w = node(pn, 'w')
+    assert {n.name for n in (*w.inner_net.places, *w.inner_net.transitions)} == {'g_p0', 'g_t0'}
+    assert 'g_p0' not in {p.name for p in pn.places}
+
+
+def test_replay_reaches_into_inner_nets(net):
+    pn = net[0]
+    _, _, failed = replay([{'op': 'move', 'nodes': [['g_g_p2', 1.0, 2.0]]}, {'op': 'node_remove', 'name': 'nope'}],
+                          pn, None, None)
+    assert failed == 1
+    inner = node(node(pn, 'g').inner_net, 'g_g').inner_net
+    assert node(inner, 'g_g_p2').properties['layout_information_petri'][0] == (1.0, 2.0)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(PnvConfig, 'INSTANCE', types.SimpleNamespace(journal_sync_ms=0))
+    monkeypatch.setattr(PnvJournalStore, 'INSTANCE', PnvJournalStore(tmp_path))
+    return PnvJournalStore.INSTANCE
+
+
+def test_pending_records(store, tmp_path):
+    net_path = tmp_path / 'net.epnml'
+    net_path.write_bytes(b'<pnml/>')
+    journal = store.open(str(net_path), keep=False)
+    journal.append('tokens', name='p0', count=1)
+    journal.append('move', nodes=[['p0', 1.0, 2.0]])
+    journal.close(discard=False)
+    # a record cut by a crash is dropped
+    with open(journal.file, 'ab') as F:
+        F.write(b'{"op": "tok')
+    assert store.pending(str(net_path)) == [{'op': 'tokens', 'name': 'p0', 'count': 1},
+                                            {'op': 'move', 'nodes': [['p0', 1.0, 2.0]]}]
+
+
+def test_stale_journal_dropped(store, tmp_path):
+    net_path = tmp_path / 'net.epnml'
+    net_path.write_bytes(b'<pnml/>')
+    journal = store.open(str(net_path), keep=False)
+    journal.append('tokens', name='p0', count=1)
+    journal.close(discard=False)
+    # the file changed since the records were written
+    net_path.write_bytes(b'<pnml></pnml>')
+    assert store.pending(str(net_path)) == []
+    assert not journal.file.exists()
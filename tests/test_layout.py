@@ -0,0 +1,282 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pnv import layout
+
+GRAPHS = Path(__file__).parent.parent / 'test_graphs'
+
+
+def overlaps(coords, sizes, gap=0.0) -> int:
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), coords.shape)
+    d = np.abs(coords[:, None] - coords[None, :])
+    need = (sizes[:, None] + sizes[None, :]) / 2 + gap
+    hit = (d < need - 1e-6).all(axis=2)
+    np.fill_diagonal(hit, False)
+    return int(hit.sum()) // 2
+
+
+@pytest.mark.parametrize('density', [0.1, 0.5, 2.0])
+def test_no_overlaps_left(density):
+    rng = np.random.default_rng(0)
+    n = 500
+    side = np.sqrt(n / density) * layout.GRAPHICS_WIDTH
+    coords = rng.uniform(0, side, (n, 2))
+    coords[:10] = coords[0]
+    assert overlaps(coords, layout.GRAPHICS_WIDTH) > 0
+    assert layout.remove_overlaps(coords) == 0
+    assert overlaps(coords, layout.GRAPHICS_WIDTH, layout.OVERLAP_GAP) == 0
+
+
+def test_rectangles_and_fixed_ones():
+    rng = np.random.default_rng(1)
+    n = 300
+    coords = rng.uniform(0, 400, (n, 2))
+    sizes = rng.uniform(10, 60, (n, 2))
+    fixed = rng.random(n) < 0.1
+    # fixed rectangles may overlap each other, they stay where they are
+    before = coords.copy()
+    layout.remove_overlaps(coords, sizes, fixed)
+    assert np.array_equal(coords[fixed], before[fixed])
+    movable = ~fixed
+    sizes_all = np.broadcast_to(sizes, coords.shape)
+    d = np.abs(coords[:, None] - coords[None, :])
+    hit = (d < (sizes_all[:, None] + sizes_all[None, :]) / 2 - 1e-6).all(axis=2)
+    np.fill_diagonal(hit, False)
+    assert not hit[movable][:, movable].any()
+
+
+def test_long_chain():
+    # every square overlaps the next one, pushes chain through all of them
+    coords = np.stack([np.arange(2000) * 10.0, np.zeros(2000)], axis=1)
+    assert layout.remove_overlaps(coords) == 0
+    assert overlaps(coords, layout.GRAPHICS_WIDTH, layout.OVERLAP_GAP) == 0
+
+
+def test_separated_layout_untouched():
+    coords = np.stack(np.meshgrid(np.arange(20), np.arange(20)), axis=-1).reshape(-1, 2) * 2.0 * layout.GRAPHICS_WIDTH
+    before = coords.copy()
+    assert layout.remove_overlaps(coords) == 0
+    assert np.array_equal(coords, before)
+
+
+def exact_repulsion(coords):
+    d = coords[None, :] - coords[:, None]
+    r2 = (d ** 2).sum(axis=2)
+    np.fill_diagonal(r2, np.inf)
+    return -(d / r2[..., None]).sum(axis=1)
+
+
+def test_quadtree_repulsion():
+    rng = np.random.default_rng(2)
+    coords = np.concatenate([rng.uniform(0, 40, (1500, 2)), rng.uniform(10, 10.01, (500, 2))])
+    exact = exact_repulsion(coords)
+    assert np.allclose(layout.quadtree_repulsion(coords, rng, theta=0.0), exact)
+    error = np.linalg.norm(layout.quadtree_repulsion(coords, rng) - exact, axis=1) / np.linalg.norm(exact, axis=1)
+    assert np.median(error) < 0.02
+
+
+def test_relaxation_spreads_selection():
+    # a path squeezed into a point between fixed vertices on a grid
+    fixed = np.stack(np.meshgrid(np.arange(10), np.arange(10)), axis=-1).reshape(-1, 2) * 100.0
+    selected = np.full((20, 2), 450.0)
+    edges = [(i, i + 1) for i in range(19)] + [(0, 20), (19, 119)]
+    relaxation = layout.SelectionRelaxation(np.concatenate([selected, fixed]), 20, edges, iterations=100)
+    while not relaxation.is_finished():
+        relaxation.step()
+    moved = relaxation.scaled()
+    assert np.allclose(relaxation.coords[20:] * relaxation.unit, fixed)
+    d = np.linalg.norm(moved[:, None] - moved[None, :], axis=2)
+    np.fill_diagonal(d, np.inf)
+    assert d.min() > layout.GRAPHICS_WIDTH / 2
+
+
+def test_force_step_counts_every_pair_once(monkeypatch):
+    rng = np.random.default_rng(3)
+    coords = rng.uniform(0, 30, (800, 2))
+    edges = layout.undirected_edges(800, rng.integers(0, 800, (1200, 2)))
+    monkeypatch.setattr(layout, 'MULTILEVEL_THETA', 0.0)
+    assert np.allclose(layout.force_step(coords, edges, rng),
+                       layout.spring_forces(coords, edges) + exact_repulsion(coords))
+
+
+def ring_of_rings(rings: int, size: int) -> list[tuple[int, int]]:
+    # rings of vertices, each one tied to the next ring by an edge
+    edges = []
+    for r in range(rings):
+        edges += [(r * size + i, r * size + (i + 1) % size) for i in range(size)]
+        edges.append((r * size, (r + 1) % rings * size))
+    return edges
+
+
+def test_multilevel_layout():
+    edges = ring_of_rings(40, 50)
+    coords = layout.multilevel_layout(2000, edges, seed=5)
+    assert np.array_equal(coords, layout.multilevel_layout(2000, edges, seed=5))
+    assert not np.array_equal(coords, layout.multilevel_layout(2000, edges, seed=6))
+    e = np.array(edges)
+    lengths = np.linalg.norm(coords[e[:, 0]] - coords[e[:, 1]], axis=1)
+    # edges of about the same length, vertices not lumped together
+    assert lengths.std() < 0.6 * lengths.mean()
+    from scipy.spatial import cKDTree
+    distances, _ = cKDTree(coords).query(coords, k=2)
+    assert np.median(distances[:, 1]) > 0.5 * np.median(lengths)
+
+
+def test_min_distance_skips_coincident():
+    rng = np.random.default_rng(4)
+    coords = rng.uniform(0, 100, (400, 2))
+    coords[1] = coords[0]
+    coords[2] = coords[0]
+    d = np.linalg.norm(coords[:, None] - coords[None, :], axis=2)
+    assert layout.min_distance(coords) == pytest.approx(d[d > 0].min())
+    assert layout.min_distance(np.zeros((5, 2))) is None
+    assert layout.min_distance(np.zeros((1, 2))) is None
+
+
+def test_coincident_vertices_spread():
+    coords = np.zeros((12, 2))
+    coords[8:] = (500.0, 0.0)
+    layout.spread_coincident(coords)
+    assert len(np.unique(coords, axis=0)) == 12
+    d = np.linalg.norm(coords[:, None] - coords[None, :], axis=2)
+    np.fill_diagonal(d, np.inf)
+    assert d.min() >= layout.GRAPHICS_WIDTH - 1e-9
+    # the first of every group stays
+    assert np.array_equal(coords[[0, 8]], [[0.0, 0.0], [500.0, 0.0]])
+
+
+def test_scaled_layout_of_coincident_vertices():
+    # every vertex at the same place: no distance to scale by
+    coords = layout.scale_layout(np.ones((6, 2)))
+    assert np.isfinite(coords).all()
+    assert overlaps(coords, layout.GRAPHICS_WIDTH) == 0
+
+
+def test_generated_layout_without_overlaps():
+    from pnv.importer import epnml
+    net = epnml.import_pnml(str(GRAPHS / 'big' / 'petri_net.pnml'))[0]
+    layout.clear_layout(net)
+    layout.generate_layout(net)
+    assert layout.has_full_layout(net)
+    coords = np.array([n.properties[layout.LAYOUT_KEY][0] for n in (*net.places, *net.transitions)])
+    assert overlaps(coords, layout.GRAPHICS_WIDTH) == 0
+
+
+def boxes_overlap(boxes) -> bool:
+    # boxes as (min x, min y, max x, max y)
+    b = np.array(boxes)
+    apart = (b[:, None, 2] <= b[None, :, 0]) | (b[None, :, 2] <= b[:, None, 0]) | \
+            (b[:, None, 3] <= b[None, :, 1]) | (b[None, :, 3] <= b[:, None, 1])
+    np.fill_diagonal(apart, True)
+    return not apart.all()
+
+
+def test_shelves_packed_apart():
+    rng = np.random.default_rng(5)
+    sizes = rng.uniform(10, 200, (60, 2))
+    offsets = layout.pack_shelves(list(sizes), 5.0)
+    assert not boxes_overlap(np.concatenate([offsets, offsets + sizes + 5.0 - 1e-9], axis=1))
+    extent = (offsets + sizes).max(axis=0)
+    assert 0.5 < extent[0] / extent[1] < 2.0
+
+
+def fragments(sizes) -> tuple[int, list[tuple[int, int]], np.ndarray]:
+    # cycles of the given sizes with vertices interleaved, and the component of every vertex
+    membership = np.repeat(np.arange(len(sizes)), sizes)
+    np.random.default_rng(6).shuffle(membership)
+    edges = []
+    for c in range(len(sizes)):
+        vertices = np.flatnonzero(membership == c).tolist()
+        edges += list(zip(vertices, vertices[1:] + vertices[:1])) if len(vertices) > 1 else []
+    return len(membership), edges, membership
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_components_packed_apart(workers, monkeypatch):
+    # with two workers the components are laid out in processes
+    monkeypatch.setattr(layout, 'COMPONENTS_PARALLEL_MIN', 100)
+    monkeypatch.setattr(layout, 'COMPONENTS_CHUNK_MIN', 50)
+    n, edges, membership = fragments([120, 60, 40, 30, 5, 1, 1, 2, 20, 50])
+    coords = layout.component_layout(n, edges, workers)
+    assert overlaps(coords, layout.GRAPHICS_WIDTH) == 0
+    half = layout.GRAPHICS_WIDTH / 2
+    boxes = [np.r_[coords[membership == c].min(axis=0) - half, coords[membership == c].max(axis=0) + half]
+             for c in range(membership.max() + 1)]
+    assert not boxes_overlap(boxes)
+
+
+def test_initial_layout_on_a_grid():
+    # two paths: every vertex on its own grid point, neighbours along a path mostly next to each other
+    edges = [(i, i + 1) for i in range(99)] + [(i, i + 1) for i in range(100, 149)]
+    coords = layout.initial_layout(150, edges)
+    assert len(np.unique(coords, axis=0)) == 150
+    assert np.array_equal(coords, np.round(coords)) and coords.max() < np.ceil(np.sqrt(150))
+    e = np.array(edges)
+    assert np.median(np.abs(coords[e[:, 0]] - coords[e[:, 1]]).sum(axis=1)) == 1
+
+
+def test_refinement_runs_all_iterations():
+    edges = [(i, (i + 1) % 60) for i in range(60)]
+    coords = layout.initial_layout(60, edges)
+    refinement = layout.LayoutRefinement(60, edges, coords.copy(), iterations=50)
+    steps = 0
+    while not refinement.is_finished():
+        refinement.step()
+        steps += 1
+    assert refinement.done == 50 and steps <= 50
+    assert not np.array_equal(refinement.coords, coords)
+    assert overlaps(refinement.scaled(), layout.GRAPHICS_WIDTH) == 0
+
+
+def refine_in_thread(conn, interval_s):
+    import threading
+    edges = [(i, (i + 1) % 200) for i in range(200)]
+    thread = threading.Thread(target=layout.refine_process,
+                              args=(conn, 200, edges, layout.initial_layout(200, edges), interval_s))
+    thread.start()
+    return thread
+
+
+def test_refinement_sends_latest_once_acknowledged():
+    import multiprocessing
+    conn, child = multiprocessing.Pipe()
+    thread = refine_in_thread(child, 0.0)
+    # nothing acknowledged: one batch, then only the final one
+    thread.join(60)
+    messages = []
+    while conn.poll():
+        messages.append(conn.recv())
+    assert [finished for finished, _ in messages] == [False, True]
+    assert messages[-1][1].shape == (200, 2)
+
+
+def test_refinement_stopped():
+    import multiprocessing
+    conn, child = multiprocessing.Pipe()
+    conn.send(None)
+    thread = refine_in_thread(child, 0.0)
+    thread.join(60)
+    assert not thread.is_alive()
+    assert not conn.poll()
+
+
+def test_anchored_layout_faces_its_anchors():
+    # a path whose ends have arcs to nodes left and right of the center, in any start orientation
+    edges = [(i, i + 1) for i in range(11)]
+    center = (1000.0, -500.0)
+    for left, right in ((0, 11), (11, 0)):
+        coords = layout.anchored_layout(12, edges, center, [(left, 0.0, -500.0), (right, 2000.0, -500.0)])
+        assert np.allclose(coords.mean(axis=0), center)
+        assert coords[left, 0] < center[0] < coords[right, 0]
+        assert overlaps(coords, layout.GRAPHICS_WIDTH) == 0
+
+
+def test_push_aside():
+    center, box = (0.0, 0.0), (-100.0, -50.0, 100.0, 50.0)
+    points = np.array([[10.0, 0.0], [0.0, -20.0], [0.0, 0.0], [80.0, 40.0], [300.0, 0.0], [0.0, -51.0]])
+    moved = layout.push_aside(points, center, box, 10.0)
+    assert np.allclose(moved[:4], [[110.0, 0.0], [0.0, -60.0], [110.0, 0.0], [100.0 + 10 * 0.8944, 50.0 + 10 * 0.4472]],
+                       atol=1e-3)
+    assert np.array_equal(moved[4:], points[4:])
@@ -0,0 +1,223 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from PyQt5.QtWidgets import QGraphicsScene
+
+from main import PnvLoadWorker, PnvSaveJob, PnvSaveWorker, MethodsIO, GraphData, PnvMainWindow
+from pnv import layout
+from pnv.cache import PnvCache
+from pnv.journal import PnvJournalStore
+from pnv.importer import epnml, pnvb
+from pnv.importer.epnml import ExtendedTransition
+from pnv.render import PnvDrawer, PnvViewer, PnvEditState
+from pnv.utils import PnvConfig
+
+WRAPPED = Path(__file__).parent.parent / 'test_graphs' / 'epnml' / 'BrandNewWrapped.epnml'
+
+
+def groups(net) -> list[ExtendedTransition]:
+    return [t for t in net.transitions if isinstance(t, ExtendedTransition)]
+
+
+@pytest.fixture
+def cache(config, tmp_path, monkeypatch):
+    monkeypatch.setattr(PnvCache, 'INSTANCE', PnvCache(tmp_path))
+    return PnvCache.INSTANCE
+
+
+def load(paths, failures=None):
+    # failures: paths expected to fail
+    worker = PnvLoadWorker([str(p) for p in paths])
+    loaded, failed = [], []
+    worker.loaded.connect(loaded.append)
+    worker.failed.connect(lambda path, ex: failed.append(path))
+    worker.run()
+    assert failed == [str(p) for p in failures or []]
+    return loaded
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_loaded_and_shown_without_building_inner_nets(cache, cached):
+    if cached:
+        load([WRAPPED])
+    result, = load([WRAPPED])
+    assert result.from_cache == cached
+    pn = result.petri_net
+    scene = QGraphicsScene()
+    drawer = PnvDrawer(scene, pn)
+    viewer = PnvViewer(drawer, scene)
+    viewer.drawer_push_modes()
+    drawer.draw_petri_net()
+    viewer.init_markings(result.init_marks, result.fin_marks)
+    assert drawer.is_review_mode()
+    top, = groups(pn)
+    assert top.label == 'super task'
+    assert not top.is_materialized()
+    # the nested group is found once the outer one is opened
+    inner, = groups(top.inner_net)
+    assert inner.label == 'multi task' and not inner.is_materialized()
+
+
+def levels(net) -> list:
+    # names of the nodes and arcs of every level, inner nets built
+    found = [(sorted(p.name for p in net.places), sorted(t.name for t in net.transitions),
+              sorted((a.source.name, a.target.name) for a in net.arcs))]
+    for t in groups(net):
+        found.extend(levels(t.inner_net))
+    return found
+
+
+def show(pn, im, fm, path) -> GraphData:
+    scene = QGraphicsScene()
+    drawer = PnvDrawer(scene, pn)
+    viewer = PnvViewer(drawer, scene)
+    viewer.drawer_push_modes()
+    drawer.draw_petri_net()
+    viewer.init_markings(im, fm)
+    return GraphData(str(path), (pn, im, fm), viewer, 0)
+
+
+def test_pnvb_save_builds_inner_nets_on_the_saving_thread(config, tmp_path, monkeypatch):
+    # every level stored as a level, read back as unbuilt binary blocks
+    source, target = tmp_path / 'source.pnvb', tmp_path / 'target.pnvb'
+    expected = epnml.import_net(str(WRAPPED))
+    levels(expected[0])
+    pnvb.export_net(expected[0], expected[1], source, expected[2])
+    g = show(*pnvb.import_net(source), source)
+    top, = groups(g.petri_net)
+
+    built_on = []
+    build = pnvb._BinaryBlock.build
+
+    def recorded(block):
+        built_on.append(threading.current_thread())
+        return build(block)
+
+    monkeypatch.setattr(pnvb._BinaryBlock, 'build', recorded)
+    job = MethodsIO.save_as_pnvb(g, str(target), force=True)
+    assert built_on == [] and not top.is_materialized()
+    worker = PnvSaveWorker(job)
+    worker.start()
+    assert worker.wait(10000) and worker.error is None
+    assert len(built_on) == 2 and threading.main_thread() not in built_on
+    assert not top.is_materialized()
+    assert levels(pnvb.import_net(target)[0]) == levels(expected[0])
+    # the net itself builds its levels apart from the snapshot
+    assert levels(g.petri_net) == levels(expected[0])
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = tmp_path / 'net.epnml'
+    path.write_bytes(b'old')
+
+    def write(out):
+        with open(out, 'wb') as F:
+            F.write(b'partial')
+        raise OSError('disk full')
+
+    job = PnvSaveJob(str(path), write, PnvEditState(), PnvEditState())
+    with pytest.raises(OSError):
+        job.write_out()
+    assert path.read_bytes() == b'old'
+    assert [p.name for p in tmp_path.iterdir()] == ['net.epnml']
+
+
+@pytest.fixture
+def window(config, qapp, monkeypatch):
+    # the window sets up the configuration, the cache and the journals, put back after the test
+    for cls in (PnvCache, PnvJournalStore):
+        monkeypatch.setattr(cls, 'INSTANCE', cls.INSTANCE)
+    monkeypatch.setattr(PnvConfig, 'INSTANCE', config)
+    window = PnvMainWindow()
+    yield window
+    window.finish_saves()
+    window.deleteLater()
+
+
+def test_saves_of_a_file_coalesced(window, qapp, tmp_path):
+    path = str(tmp_path / 'net.epnml')
+    release = threading.Event()
+    written = []
+
+    def job(name, blocking=False):
+        def write(out):
+            if blocking:
+                release.wait(10)
+            with open(out, 'w') as F:
+                F.write(name)
+            written.append(name)
+        state = PnvEditState()
+        setattr(state, name, True)
+        return PnvSaveJob(path, write, PnvEditState(), state)
+
+    first = job('layout_changed', blocking=True)
+    window.start_save(first)
+    second, third = job('layout_generated'), job('meta_data')
+    window.start_save(second)
+    window.start_save(third)
+    # the second snapshot is never written, the third one carries its changes
+    assert third.state.layout_generated and third.state.meta_data
+    release.set()
+    deadline = time.monotonic() + 10
+    while window.saving and time.monotonic() < deadline:
+        qapp.processEvents()
+    assert written == ['layout_changed', 'meta_data']
+    assert open(path).read() == 'meta_data'
+
+
+def test_files_opened_in_processes(cache, tmp_path):
+    graphs = Path(__file__).parent.parent / 'test_graphs'
+    broken = tmp_path / 'broken.epnml'
+    broken.write_text('<pnml><net')
+    paths = [WRAPPED, graphs / 'Layoutless.pnml', graphs / 'Hairdresser.pnml', broken]
+    results = {Path(r.path): r for r in load(paths, failures=[broken])}
+    assert set(results) == set(paths[:3])
+    for path, result in results.items():
+        assert not result.from_cache
+        expected = MethodsIO.import_net(str(path))
+        assert {p.name for p in result.petri_net.places} == {p.name for p in expected[0].places}
+        assert {(a.source.name, a.target.name) for a in result.petri_net.arcs} == \
+               {(a.source.name, a.target.name) for a in expected[0].arcs}
+    assert [p for p, r in results.items() if r.layout_generated] == [graphs / 'Layoutless.pnml']
+    assert layout.has_full_layout(results[graphs / 'Layoutless.pnml'].petri_net)
+    top, = groups(results[WRAPPED].petri_net)
+    assert not top.is_materialized()
+    assert [t.label for t in groups(top.inner_net)] == ['multi task']
+    # the outputs of the processes are taken over by the cache
+    assert all(r.from_cache for r in load(paths[:3]))
+
+
+def test_epnml_opened_by_streaming(monkeypatch):
+    def whole_document(*args):
+        raise AssertionError('document importer used')
+
+    monkeypatch.setattr(epnml, 'import_net', whole_document)
+    read = []
+    pn, im, fm = MethodsIO.import_net(str(WRAPPED), progress=read.append)
+    assert [t.label for t in groups(pn)] == ['super task']
+    assert read == sorted(read) and read[-1] == WRAPPED.stat().st_size
+
+
+def test_pnml_opened_without_pm4py_reader(monkeypatch):
+    import pm4py
+
+    def read_pnml(*args, **kwargs):
+        raise AssertionError('pm4py reader used')
+
+    monkeypatch.setattr(pm4py, 'read_pnml', read_pnml)
+    path = Path(__file__).parent.parent / 'test_graphs' / 'Hairdresser.pnml'
+    pn, im, fm = MethodsIO.import_net(str(path))
+    assert len(pn.places) > 0 and fm is None
+
+
+def test_big_nets_shown_with_initial_layout(cache, config):
+    # the net counts as big, its grid layout is drawn and refined, not cached
+    config.progressive_layout_nodes = 1
+    path = Path(__file__).parent.parent / 'test_graphs' / 'Layoutless.pnml'
+    result, = load([path])
+    assert result.refine and result.layout_generated
+    coords = [n.properties[layout.LAYOUT_KEY][0] for n in (*result.petri_net.places, *result.petri_net.transitions)]
+    assert len(set(coords)) == len(coords)
+    assert not any(r.from_cache for r in load([path]))
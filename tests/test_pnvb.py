@@ -0,0 +1,47 @@
+from conftest import signature
+from pnv.importer import epnml, pnvb
+from pnv.importer.epnml import ExtendedTransition
+
+
+def extended(net):
+    return [t for t in net.transitions if isinstance(t, ExtendedTransition)]
+
+
+def test_round_trip(net, tmp_path):
+    path = tmp_path / 'net.pnvb'
+    pnvb.export_net(*net[:2], path, net[2])
+    read = pnvb.import_net(path)
+    assert not any(t.is_materialized() for t in extended(read[0]))
+    assert signature(*read) == signature(*net)
+
+
+def test_unbuilt_inner_nets_stored_as_read(net, tmp_path):
+    xml, binary = tmp_path / 'net.epnml', tmp_path / 'net.pnvb'
+    epnml.export_net(*net[:2], xml, net[2])
+    read = epnml.import_net_stream(str(xml))
+    pnvb.export_net(*read[:2], binary, read[2])
+    assert not any(t.is_materialized() for t in extended(read[0]))
+    assert signature(*pnvb.import_net(binary)) == signature(*net)
+
+
+def test_partly_built_net(net, tmp_path):
+    # built levels are stored as levels, the rest as read, and written back to (E)PNML
+    xml, binary, again = tmp_path / 'net.epnml', tmp_path / 'net.pnvb', tmp_path / 'again.pnvb'
+    epnml.export_net(*net[:2], xml, net[2])
+    pnvb.epnml_to_binary(str(xml), binary)
+    read = pnvb.import_net(binary)
+    extended(read[0])[0].inner_net
+    pnvb.export_net(*read[:2], again, read[2])
+    assert signature(*pnvb.import_net(again)) == signature(*net)
+    pnvb.binary_to_epnml(again, xml)
+    assert signature(*epnml.import_net(str(xml))) == signature(*net)
+
+
+def test_markings_of_other_levels_skipped(net, tmp_path):
+    # as with the XML writers, a marking keeps the places of its own level
+    path = tmp_path / 'net.pnvb'
+    inner = extended(net[0])[0].inner_net
+    im = net[1].copy()
+    im[next(iter(inner.places))] = 5
+    pnvb.export_net(net[0], im, path, net[2])
+    assert signature(*pnvb.import_net(path)) == signature(*net)
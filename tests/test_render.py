@@ -0,0 +1,278 @@
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+from PyQt5.QtWidgets import QGraphicsScene
+
+from pnv import layout
+from pnv.graphics import PnvDetail, PnvQGArrowItem, PnvQGPlaceItem, PnvQGTransitionItem
+from pnv.importer import epnml
+from pnv.importer.epnml import ExtendedTransition
+from pnv.interactive.hierarchy import HierNode
+from pnv.render import PnvDrawer, PnvViewer, PnvViewScaler
+
+GRAPHS = Path(__file__).parent.parent / 'test_graphs'
+
+
+def nested_page(level: int, depth: int) -> str:
+    # a place and a transition with an arc from it, and a group holding the next level
+    graphics = f'<graphics><position x="{level * 100}.0" y="0.0"/><dimension x="40.0" y="40.0"/></graphics>'
+    inner = '' if level == depth else (
+        f'<transition id="g{level}"><name><text>g{level}</text></name>{graphics}'
+        f'{nested_page(level + 1, depth)}</transition>'
+        f'<arc id="ag{level}" source="p{level}" target="g{level}"/>')
+    return (f'<page id="page{level}">'
+            f'<place id="p{level}"><name><text>p{level}</text></name>{graphics}</place>'
+            f'<transition id="t{level}"><name><text>t{level}</text></name>{graphics}</transition>'
+            f'<arc id="a{level}" source="p{level}" target="t{level}"/>{inner}</page>')
+
+
+def groups(net) -> list[ExtendedTransition]:
+    return [t for t in net.transitions if isinstance(t, ExtendedTransition)]
+
+
+def drawn(pn, im=None, fm=None):
+    scene = QGraphicsScene()
+    drawer = PnvDrawer(scene, pn)
+    viewer = PnvViewer(drawer, scene)
+    viewer.drawer_push_modes()
+    drawer.draw_petri_net()
+    viewer.init_markings(im, fm)
+    return drawer
+
+
+def open_deep(tmp_path, depth=5):
+    path = tmp_path / 'deep.epnml'
+    path.write_text(f'<pnml><net id="deep">{nested_page(0, depth)}</net></pnml>')
+    pn, im, fm = epnml.import_net_stream(str(path))
+    return pn, drawn(pn, im, fm)
+
+
+def chain(net) -> list[ExtendedTransition]:
+    # groups from the outermost one inwards, as far as they are built
+    found = []
+    while groups(net):
+        found.append(groups(net)[0])
+        if not found[-1].is_materialized():
+            break
+        net = found[-1].inner_net
+    return found
+
+
+def test_review_mode_builds_no_inner_net(config, tmp_path):
+    pn, drawer = open_deep(tmp_path)
+    assert drawer.is_review_mode()
+    top, = chain(pn)
+    assert not top.is_materialized()
+    assert [hn.value[0] for hn in drawer.hn_root().children()] == [top]
+
+
+def test_expanding_the_hierarchy_builds_one_level(config, tmp_path):
+    pn, drawer = open_deep(tmp_path)
+    model = drawer.hn_root().make_tree()
+    item = model.item(0)
+    assert not chain(pn)[0].is_materialized()
+    HierNode.fetch_tree(item)
+    assert [g.is_materialized() for g in chain(pn)] == [True, False]
+    assert item.child(0).text() == 'g1'
+    HierNode.fetch_tree(item.child(0))
+    assert [g.is_materialized() for g in chain(pn)] == [True, True, False]
+
+
+def test_unwrapping_builds_one_level(config, tmp_path):
+    pn, drawer = open_deep(tmp_path)
+    top = chain(pn)[0]
+    drawer.subnet_unwrap(drawer.mapper[top])
+    assert [g.is_materialized() for g in chain(pn)] == [True, False]
+    assert {'p1', 't1', 'g1'} <= {n.name for n in drawer.mapper}
+
+
+def hairdresser_on_a_grid():
+    pn, im, fm = epnml.import_pnml(str(GRAPHS / 'Hairdresser.pnml'))
+    layout.clear_layout(pn)
+    layout.generate_initial_layout(pn)
+    return pn, drawn(pn, im, fm)
+
+
+def test_moved_items_update_each_arrow_once(config, monkeypatch):
+    pn, drawer = hairdresser_on_a_grid()
+    updated = []
+    monkeypatch.setattr(PnvQGArrowItem, 'update', lambda arrow, *args: updated.append(arrow))
+    nodes = [*pn.places, *pn.transitions]
+    coords = np.array([PnvDrawer.final_pos(drawer.mapper[n]) for n in nodes]) * 2
+    drawer.move_items(nodes, coords)
+    assert len(updated) == len(set(updated)) == len(pn.arcs)
+    assert [PnvDrawer.final_pos(drawer.mapper[n]) for n in nodes] == [tuple(c) for c in coords.tolist()]
+
+
+def wait_for(qapp, condition, timeout_s=60):
+    deadline = time.monotonic() + timeout_s
+    while not condition() and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_refinement_moves_items_and_keeps_the_layout(config, qapp):
+    pn, drawer = hairdresser_on_a_grid()
+    nodes = [*pn.places, *pn.transitions]
+    before = [drawer.layout(n)[0] for n in nodes]
+    drawer.start_refinement()
+    assert drawer.is_refining()
+    assert wait_for(qapp, lambda: not drawer.is_refining())
+    after = [PnvDrawer.final_pos(drawer.mapper[n]) for n in nodes]
+    assert after != before
+    assert [drawer.layout(n)[0] for n in nodes] == after
+    assert drawer.status.layout_generated
+
+
+def test_refinement_stopped_where_it_is(config, qapp):
+    pn, drawer = hairdresser_on_a_grid()
+    drawer.start_refinement()
+    drawer.stop_refinement()
+    assert not drawer.is_refining()
+    nodes = [*pn.places, *pn.transitions]
+    assert [drawer.layout(n)[0] for n in nodes] == [PnvDrawer.final_pos(drawer.mapper[n]) for n in nodes]
+
+
+def element(kind, name, at=None, content='') -> str:
+    # a node, without graphics if not at a position
+    graphics = '' if at is None else \
+        f'<graphics><position x="{at[0]}" y="{at[1]}"/><dimension x="40.0" y="40.0"/></graphics>'
+    return f'<{kind} id="{name}"><name><text>{name}</text></name>{graphics}{content}</{kind}>'
+
+
+def chain_page(prefix, left, right, content='') -> str:
+    # a page of 8 nodes without layout in a chain, from the node left to the node right
+    nodes = ''.join(element('place' if i % 2 else 'transition', f'{prefix}{i}') for i in range(8))
+    arcs = ''.join(f'<arc id="a{prefix}{i}" source="{prefix}{i}" target="{prefix}{i + 1}"/>' for i in range(7))
+    return (f'<page id="{prefix}">{nodes}{arcs}{content}<arc id="a{prefix}l" source="{left}" target="{prefix}0"/>'
+            f'<arc id="a{prefix}r" source="{prefix}7" target="{right}"/></page>')
+
+
+def test_unwrapped_net_without_layout_laid_out_around_its_transition(config, tmp_path):
+    path = tmp_path / 'unwrap.epnml'
+    path.write_text('<pnml><net id="unwrap"><page id="top">'
+                    f'{element("place", "left", (-400.0, 0.0))}{element("place", "right", (400.0, 0.0))}'
+                    f'{element("place", "near", (20.0, 20.0))}{element("place", "far", (3000.0, 3000.0))}'
+                    f'{element("transition", "g", (0.0, 0.0), chain_page("i", "left", "right"))}'
+                    '</page></net></pnml>')
+    pn, im, fm = epnml.import_net_stream(str(path))
+    drawer = drawn(pn, im, fm)
+    g, = groups(pn)
+    drawer.subnet_unwrap(drawer.mapper[g])
+    by_name = {n.name: PnvDrawer.final_pos(obj) for n, obj in drawer.mapper.items()}
+    coords = np.array([by_name[f'i{i}'] for i in range(8)])
+    assert np.allclose(coords.mean(axis=0), (0.0, 0.0), atol=1.0)
+    # the node with an arc from the left place is left of the one with an arc to the right place
+    assert by_name['i0'][0] < by_name['i7'][0]
+    assert drawer.status.layout_generated
+    # only the place under the new nodes is moved, out of their box
+    (minx, miny), (maxx, maxy) = coords.min(axis=0), coords.max(axis=0)
+    x, y = by_name['near']
+    assert not (minx <= x <= maxx and miny <= y <= maxy)
+    assert (by_name['left'], by_name['right'], by_name['far']) == ((-400.0, 0.0), (400.0, 0.0), (3000.0, 3000.0))
+
+
+def test_detail_follows_the_configured_scales(config):
+    config.detail_plain_scale, config.detail_flat_scale, config.detail_lines_scale = 0.6, 0.3, 0.15
+    assert [PnvViewScaler.detail_at(sf) for sf in (1.0, 0.6, 0.5, 0.3, 0.2, 0.15, 0.1)] == \
+           [PnvDetail.FULL, PnvDetail.FULL, PnvDetail.PLAIN, PnvDetail.PLAIN, PnvDetail.FLAT, PnvDetail.FLAT,
+            PnvDetail.LINES]
+    config.detail_plain_scale = 0.4
+    assert PnvViewScaler.detail_at(0.5) == PnvDetail.FULL
+
+
+def test_zooming_out_lowers_the_detail(config):
+    config.limit_zoom = False
+    pn, im, fm = epnml.import_pnml(str(GRAPHS / 'Hairdresser.pnml'))
+    scene = QGraphicsScene()
+    drawer = PnvDrawer(scene, pn)
+    viewer = PnvViewer(drawer, scene)
+    viewer.drawer_push_modes()
+    drawer.draw_petri_net()
+    outwards = types.SimpleNamespace(angleDelta=lambda: types.SimpleNamespace(y=lambda: -120))
+    seen = [drawer.detail]
+    while viewer.view_scaler.scale_factor() > 0.1:
+        viewer.view_scaler.wheel_event(outwards)
+        assert drawer.detail == PnvViewScaler.detail_at(viewer.view_scaler.scale_factor())
+        if drawer.detail != seen[-1]:
+            seen.append(drawer.detail)
+    assert seen == [PnvDetail.FULL, PnvDetail.PLAIN, PnvDetail.FLAT, PnvDetail.LINES]
+
+
+class Painter:
+    # records the names of the painting calls
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append(name)
+
+
+def painted(item) -> list[str]:
+    painter = Painter()
+    item.paint(painter, None)
+    return painter.calls
+
+
+def test_items_leave_out_details(config):
+    pn, im, fm = epnml.import_pnml(str(GRAPHS / 'Hairdresser.pnml'))
+    drawer = drawn(pn, im, fm)
+    place = next(obj for obj in drawer.mapper.values() if isinstance(obj, PnvQGPlaceItem) and obj.markings == 1)
+    transition = next(obj for obj in drawer.mapper.values() if isinstance(obj, PnvQGTransitionItem))
+    arrow = next(iter(transition.arrows()))
+    found = {}
+    for detail in (PnvDetail.FULL, PnvDetail.PLAIN, PnvDetail.FLAT, PnvDetail.LINES):
+        drawer.detail = detail
+        found[detail] = [painted(item) for item in (place, transition, arrow)]
+    # a token and an arrowhead
+    assert found[PnvDetail.FULL] == [['setPen', 'setBrush', 'drawEllipse', 'setBrush', 'drawEllipse'],
+                                     ['setPen', 'setBrush', 'drawRect'], ['setPen'] + ['drawLine'] * 3]
+    assert found[PnvDetail.PLAIN] == [['setPen', 'setBrush', 'drawEllipse'],
+                                      ['setPen', 'setBrush', 'drawRect'], ['setPen', 'drawLine']]
+    assert found[PnvDetail.FLAT] == [['fillRect'], ['fillRect'], ['setPen', 'drawLine']]
+    assert found[PnvDetail.LINES] == found[PnvDetail.FLAT]
+    # the line pen instead of the arc's own
+    drawer.detail = PnvDetail.LINES
+    painter = Painter()
+    pens = []
+    painter.setPen = pens.append
+    arrow.paint(painter, None)
+    assert pens == [PnvQGArrowItem.LINE_PEN]
+    # labels are not painted from the plain level on
+    label = next(obj for obj in drawer.scene.items() if obj.parentItem() in drawer.mapper.values())
+    drawer.detail = PnvDetail.PLAIN
+    assert painted(label) == []
+
+
+def test_inner_nets_laid_out_ahead_level_by_level(config, qapp, tmp_path):
+    # g holds a net without layout, with a group h in it holding another one
+    path = tmp_path / 'ahead.epnml'
+    inner = chain_page('i', 'left', 'right', element('transition', 'h', content=chain_page('j', 'i1', 'i5')))
+    path.write_text('<pnml><net id="ahead"><page id="top">'
+                    f'{element("place", "left", (-400.0, 0.0))}{element("place", "right", (400.0, 0.0))}'
+                    f'{element("transition", "g", (0.0, 0.0), inner)}'
+                    '</page></net></pnml>')
+    pn, im, fm = epnml.import_net(str(path))
+    drawer = drawn(pn, im, fm)
+    g, = groups(pn)
+    h, = groups(g.inner_net)
+    drawer.start_subnet_layouts()
+    assert drawer.subnet_layouter.levels == [[g], [h]]
+    assert wait_for(qapp, lambda: not drawer.is_laying_out_subnets())
+    assert set(drawer.precomputed) == {g, h}
+    assert layout.has_full_layout(g.inner_net) and layout.has_full_layout(h.inner_net)
+    # each net is laid out around its transition, which is laid out with the level above
+    for extr in (g, h):
+        coords = np.array([drawer.layout(n)[0] for n in (*extr.inner_net.places, *extr.inner_net.transitions)])
+        assert np.allclose(coords.mean(axis=0), drawer.layout(extr)[0])
+    assert drawer.status.layout_generated
+    # unwrapping draws the net as laid out, moved along with its transition
+    before = {n: drawer.layout(n)[0] for n in g.inner_net.places}
+    drawer.move_items([g], np.array([[0.0, 100.0]]))
+    drawer.subnet_unwrap(drawer.mapper[g])
+    assert g not in drawer.precomputed
+    assert np.allclose([PnvDrawer.final_pos(drawer.mapper[n]) for n in before],
+                       [(x, y + 100.0) for x, y in before.values()], atol=1.0)
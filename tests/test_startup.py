@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+SCRIPT = '''
+import sys
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QApplication
+import main
+
+show = main.PnvMainWindow.show
+
+
+def show_and_quit(window):
+    show(window)
+    QtCore.QTimer.singleShot(100, QApplication.instance().quit)
+
+
+main.PnvMainWindow.show = show_and_quit
+try:
+    main.application()
+except SystemExit:
+    pass
+print('loaded:', *[m for m in ('pm4py', 'igraph', 'numpy', 'pnv.render') if m in sys.modules])
+'''
+
+
+def start(tmp_path, *args) -> list[str]:
+    # the application up to its first frame in a fresh interpreter, with a configuration of its own
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', HOME=str(tmp_path), XDG_DATA_HOME=str(tmp_path),
+               XDG_CONFIG_HOME=str(tmp_path))
+    done = subprocess.run([sys.executable, '-c', SCRIPT, *args], cwd=ROOT, env=env, capture_output=True, text=True,
+                          timeout=60)
+    assert done.returncode == 0, done.stderr
+    return done.stdout.splitlines()
+
+
+def test_welcome_screen_without_heavy_imports(tmp_path):
+    lines = start(tmp_path)
+    assert lines[-1] == 'loaded:'
+    assert not any(line.startswith('[startup]') for line in lines)
+
+
+def test_startup_profile(tmp_path):
+    lines = start(tmp_path, '--startup-profile')
+    phases = [line.split()[1] for line in lines if line.startswith('[startup]')]
+    assert phases == ['imports', 'QApplication', 'icons', 'config', 'cache', 'widgets', 'show', 'first']
@@ -0,0 +1,118 @@
+import sys
+
+import pytest
+from pm4py.objects.petri_net.obj import PetriNet, Marking
+from pm4py.objects.petri_net.utils.petri_utils import add_arc_from_to
+
+import wrapper
+from pnv.importer import epnml
+from pnv.importer.epnml import ExtendedTransition
+
+
+def write_chain(path, names: list[str]):
+    # start place -> transitions in a row -> end place, tokens in the start place and the end place final
+    net = PetriNet(path.stem)
+    places = [PetriNet.Place(f'p{i}') for i in range(len(names) + 1)]
+    net.places.update(places)
+    for i, name in enumerate(names):
+        t = PetriNet.Transition(name, name)
+        net.transitions.add(t)
+        add_arc_from_to(places[i], t, net)
+        add_arc_from_to(t, places[i + 1], net)
+    im, fm = Marking(), Marking()
+    im[places[0]] = 1
+    fm[places[-1]] = 1
+    epnml.export_net(net, im, str(path), fm, hierarchical=False)
+
+
+@pytest.fixture
+def nets(tmp_path):
+    # 'shared' is referenced by the entry and by 'outer'
+    write_chain(tmp_path / 'abstract_heu.pnml', ['shared', 'outer', 'plain'])
+    write_chain(tmp_path / 'outer_heu.pnml', ['x', 'shared'])
+    write_chain(tmp_path / 'shared_heu.pnml', ['a', 'b'])
+    write_chain(tmp_path / 'unused_heu.pnml', ['c'])
+    write_chain(tmp_path / 'other.pnml', ['d'])
+    return tmp_path
+
+
+def groups(net) -> dict[str, ExtendedTransition]:
+    return {t.name: t for t in net.transitions if isinstance(t, ExtendedTransition)}
+
+
+def test_files_indexed_by_net_name(nets):
+    assert wrapper.files(str(nets), '.pnml', '_heu') == {
+        name: str(nets / f'{name}_heu.pnml') for name in ('abstract', 'outer', 'shared', 'unused')}
+
+
+def test_every_file_parsed_once(nets, monkeypatch):
+    parsed = []
+    import_pnml = epnml.import_pnml
+
+    def counted(input_file, *args):
+        if isinstance(input_file, str):
+            # files are opened and read again as streams
+            parsed.append(input_file)
+        return import_pnml(input_file, *args)
+
+    monkeypatch.setattr(epnml, 'import_pnml', counted)
+    assembler = wrapper.Assembler(wrapper.files(str(nets), '.pnml', '_heu'), workers=1)
+    entry = str(nets / 'abstract_heu.pnml')
+    assembler.parse_all(entry)
+    assert sorted(parsed) == sorted(str(nets / f'{name}_heu.pnml') for name in ('abstract', 'outer', 'shared'))
+    assert assembler.references[str(nets / 'shared_heu.pnml')] == 2
+
+
+def test_shared_net_copied_for_each_reference(nets):
+    assembler = wrapper.Assembler(wrapper.files(str(nets), '.pnml', '_heu'), workers=1)
+    entry = str(nets / 'abstract_heu.pnml')
+    assembler.parse_all(entry)
+    (net, im, fm), _ = assembler.wrap(entry)
+    top = groups(net)
+    assert set(top) == {'shared', 'outer'}
+    inner = groups(top['outer'].inner_net)
+    assert set(inner) == {'shared'}
+    first, second = top['shared'].inner_net, inner['shared'].inner_net
+    assert {t.name for t in first.transitions} == {t.name for t in second.transitions} == {'a', 'b'}
+    assert not set(first.places) & set(second.places)
+    assert not set(first.arcs) & set(second.arcs)
+    # the boundary arcs of each copy lead to the places around its own transition
+    for holder, level in ((top['shared'], net), (inner['shared'], top['outer'].inner_net)):
+        around = {a.source for a in holder.in_arcs} | {a.target for a in holder.out_arcs}
+        ends = {a.source for a in holder.inner_net.arcs} | {a.target for a in holder.inner_net.arcs}
+        assert around <= ends
+        assert around <= set(level.places) | set(net.places)
+
+
+def test_recursive_reference_rejected(tmp_path):
+    write_chain(tmp_path / 'abstract_heu.pnml', ['loop'])
+    write_chain(tmp_path / 'loop_heu.pnml', ['loop'])
+    assembler = wrapper.Assembler(wrapper.files(str(tmp_path), '.pnml', '_heu'), workers=1)
+    entry = str(tmp_path / 'abstract_heu.pnml')
+    assembler.parse_all(entry)
+    with pytest.raises(ValueError):
+        assembler.wrap(entry)
+
+
+def test_command_line(nets, monkeypatch, capsys):
+    output = nets / 'out.epnml'
+    monkeypatch.setattr(sys, 'argv', ['wrapper.py', str(nets), '--entry', 'abstract_heu', '--postfix', '_heu',
+                                      '--output', str(output), '--workers', '1'])
+    wrapper.main()
+    net = epnml.import_net(str(output))[0]
+    assert set(groups(net)) == {'shared', 'outer'}
+    assert set(groups(groups(net)['outer'].inner_net)) == {'shared'}
+    printed = capsys.readouterr().out
+    assert 'Parsed 3 nets' in printed and 'total' in printed
+
+
+def test_parsed_in_processes(nets):
+    # the same nets as parsed here
+    entry = str(nets / 'abstract_heu.pnml')
+    parsed = []
+    for workers in (1, 2):
+        assembler = wrapper.Assembler(wrapper.files(str(nets), '.pnml', '_heu'), workers)
+        assembler.parse_all(entry)
+        parsed.append({path: ({p.name for p in net.places}, {t.name for t in net.transitions}, len(net.arcs))
+                       for path, (net, im, fm) in assembler.parsed.items()})
+    assert parsed[0] == parsed[1]
@@ -1,23 +1,32 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from os import listdir
 from os.path import isfile, join, splitext
-from pm4py import read_pnml
 from pm4py.objects.petri_net.obj import PetriNet, Marking
 
-from pnv.importer import epnml
+from pnv.importer import epnml, pnvb
 from pnv.importer.epnml import ExtendedTransition
 
 ENTRY_FILE = 'abstract_heu'
 FILE_POSTFIX = '_heu'
 TARGET_DIR = 'unwrapped'
 TARGET_EXT = '.pnml'
+OUT_FILE = 'wrapped_net.epnml'
+# a worker process first spends seconds importing pm4py, small directories are parsed in this one
+FILES_PER_WORKER = 8
 
-ENTRY_POINT = ENTRY_FILE + TARGET_EXT
 PnmlData = tuple[PetriNet, Marking, Marking]
-NetFile = tuple[str, str]
+# boundary places of a net -> arcs of its inner nets attached to them, with the transition holding the inner net
+Bounds = dict[PetriNet.Place, list[tuple[PetriNet.Arc, ExtendedTransition]]]
 
 
-def files(_dir: str, _ext: str, _postfix: str) -> list[NetFile]:
-    out = []
+def files(_dir: str, _ext: str, _postfix: str) -> dict[str, str]:
+    # net name (file name without the postfix) -> path, transitions are matched against it
+    out = {}
     for file in listdir(_dir):
         full_path = join(_dir, file)
         if not isfile(full_path):
@@ -27,114 +36,217 @@ def files(_dir: str, _ext: str, _postfix: str) -> list[NetFile]:
             continue
         if not filename.endswith(_postfix):
             continue
-
-        nf: NetFile = (filename[:-len(_postfix)], full_path)
-        out.append(nf)
+        out[filename[:-len(_postfix)]] = full_path
     return out
 
 
-def try_wrap(filename: str, _files: list[NetFile]) -> tuple[PnmlData, dict]:
-    data: PnmlData = read_pnml(filename)
-    net, im, fm = data
-
-    _bounds: dict[PetriNet.Place, list[tuple[PetriNet.Arc, PetriNet]]] = dict()
-
-    for tr in list(net.transitions):
-        for name, file in _files:
-            if tr.name == name:
-                break
-        else:
-            continue
-        print(f'-> Reached {name}')
-
-        outer, *_ = [a.target for a in tr.out_arcs]
-        inner, *_ = [a.source for a in tr.in_arcs]
-
-        (_net, _im, _fm), bounds = try_wrap(file, _files)
-        etr = ExtendedTransition(name, name, None, None, tr.properties)
-
-        for place in _net.places:
-            place: PetriNet.Place
-            place.name = f'{name}_{place.name}'
-
-        _inner, *_ = _im.keys()
-        _outer, *_ = _fm.keys()
-
-        inner_bound = []
-        for arc in _inner.out_arcs:
-            arc: PetriNet.Arc
-            new_arc = PetriNet.Arc(inner, arc.target)
-            inner_bound.append((new_arc, _net))
-            arc.target.in_arcs.add(new_arc)
-            arc.target.in_arcs.remove(arc)
-            _net.arcs.remove(arc)
-            _net.arcs.add(new_arc)
-        outer_bound = []
-        for arc in _outer.in_arcs:
-            arc: PetriNet.Arc
-            new_arc = PetriNet.Arc(arc.source, outer)
-            outer_bound.append((new_arc, _net))
-            arc.source.out_arcs.add(new_arc)
-            arc.source.out_arcs.remove(arc)
-            _net.arcs.remove(arc)
-            _net.arcs.add(new_arc)
-        if _inner in bounds:
-            for arc, deep_net in bounds[_inner]:
+def parse_net(path: str, output: str):
+    # runs in a worker process, the net is passed back as a binary net file instead of pickled objects
+    net, im, fm = epnml.import_pnml(path)
+    pnvb.export_net(net, im, output, fm)
+
+
+class Assembler:
+    """
+    Builds one hierarchical net out of the nets of a directory: a transition named after another net is replaced
+    with an extended transition holding that net. Every file is parsed once and wrapped once, a net referenced
+    several times is copied for all but its last reference.
+    """
+
+    def __init__(self, _files: dict[str, str], workers: int):
+        self.files = _files
+        self.workers = workers
+        self.parsed: dict[str, PnmlData] = {}
+        self.wrapped: dict[str, tuple[PnmlData, Bounds]] = {}
+        self.wrapping: set[str] = set()
+        # references of every file not served yet
+        self.references: dict[str, int] = {}
+
+    def referenced(self, net: PetriNet) -> list[str]:
+        return [self.files[tr.name] for tr in net.transitions if tr.name in self.files]
+
+    def add_parsed(self, path: str, data: PnmlData) -> list[str]:
+        self.parsed[path] = data
+        referenced = self.referenced(data[0])
+        for file in referenced:
+            self.references[file] = self.references.get(file, 0) + 1
+        return referenced
+
+    def parse_all(self, entry: str):
+        # the entry and every net reachable from it, new references are parsed as soon as they are found
+        if self.workers <= 1:
+            queue = [entry]
+            while queue:
+                path = queue.pop()
+                if path not in self.parsed:
+                    queue.extend(self.add_parsed(path, epnml.import_pnml(path)))
+            return
+        context = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as outputs, \
+                ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            seen = set()
+            running = {}
+
+            def submit(_path: str):
+                if _path in seen:
+                    return
+                seen.add(_path)
+                _output = join(outputs, f'{len(seen)}.pnvb')
+                running[pool.submit(parse_net, _path, _output)] = (_path, _output)
+
+            submit(entry)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, output = running.pop(future)
+                    future.result()
+                    for file in self.add_parsed(path, pnvb.import_net(output)):
+                        submit(file)
+
+    def reference(self, path: str) -> tuple[PnmlData, Bounds]:
+        # the wrapped net of the file for one referencing transition, it is rewired by the caller
+        data, bounds = self.wrap(path)
+        self.references[path] -= 1
+        if self.references[path] == 0:
+            del self.wrapped[path]
+            return data, bounds
+        copies = {}
+        data = epnml.snapshot_net(*data, copies=copies)
+        return data, {copies[p]: [(copies[a], copies[t]) for a, t in arcs] for p, arcs in bounds.items()}
+
+    def wrap(self, path: str) -> tuple[PnmlData, Bounds]:
+        if path in self.wrapped:
+            return self.wrapped[path]
+        if path in self.wrapping:
+            raise ValueError(f'Recursive reference to {path}!')
+        self.wrapping.add(path)
+        data: PnmlData = self.parsed.pop(path)
+        net, im, fm = data
+
+        _bounds: Bounds = dict()
+
+        for tr in list(net.transitions):
+            name = tr.name
+            file = self.files.get(name)
+            if file is None:
+                continue
+            print(f'-> Reached {name}')
+
+            outer, *_ = [a.target for a in tr.out_arcs]
+            inner, *_ = [a.source for a in tr.in_arcs]
+
+            (_net, _im, _fm), bounds = self.reference(file)
+            etr = ExtendedTransition(name, name, None, None, tr.properties)
+
+            for place in _net.places:
+                place: PetriNet.Place
+                place.name = f'{name}_{place.name}'
+
+            _inner, *_ = _im.keys()
+            _outer, *_ = _fm.keys()
+
+            inner_bound = []
+            for arc in _inner.out_arcs:
                 arc: PetriNet.Arc
                 new_arc = PetriNet.Arc(inner, arc.target)
+                inner_bound.append((new_arc, etr))
                 arc.target.in_arcs.add(new_arc)
                 arc.target.in_arcs.remove(arc)
-                deep_net.arcs.remove(arc)
-                deep_net.arcs.add(new_arc)
-                inner_bound.append((new_arc, _net))
-        if _outer in bounds:
-            for arc, deep_net in bounds[_outer]:
+                _net.arcs.remove(arc)
+                _net.arcs.add(new_arc)
+            outer_bound = []
+            for arc in _outer.in_arcs:
                 arc: PetriNet.Arc
                 new_arc = PetriNet.Arc(arc.source, outer)
+                outer_bound.append((new_arc, etr))
                 arc.source.out_arcs.add(new_arc)
                 arc.source.out_arcs.remove(arc)
-                deep_net.arcs.remove(arc)
-                deep_net.arcs.add(new_arc)
-                outer_bound.append((new_arc, _net))
-        _bounds.update({inner: inner_bound, outer: outer_bound})
-        _net.places.remove(_inner)
-        _net.places.remove(_outer)
-        etr.inject_net(_net, None, None)
-
-        print(f'<- Wrapped {name}')
-
-        for arc in tr.in_arcs:
-            arc: PetriNet.Arc
-            new_arc = PetriNet.Arc(arc.source, etr)
-            etr.in_arcs.add(new_arc)
-            arc.source.out_arcs.add(new_arc)
-            arc.source.out_arcs.remove(arc)
-            net.arcs.remove(arc)
-            net.arcs.add(new_arc)
-        for arc in tr.out_arcs:
-            arc: PetriNet.Arc
-            new_arc = PetriNet.Arc(etr, arc.target)
-            etr.out_arcs.add(new_arc)
-            arc.target.in_arcs.add(new_arc)
-            arc.target.in_arcs.remove(arc)
-            net.arcs.remove(arc)
-            net.arcs.add(new_arc)
-
-        net.transitions.add(etr)
-        net.transitions.remove(tr)
-    return data, _bounds
-
-
-def make_epnml(_dir: str, entry_point: str, _ext: str, _postfix: str):
-    out_file = 'wrapped_net.epnml'
+                _net.arcs.remove(arc)
+                _net.arcs.add(new_arc)
+            if _inner in bounds:
+                for arc, holder in bounds[_inner]:
+                    arc: PetriNet.Arc
+                    new_arc = PetriNet.Arc(inner, arc.target)
+                    arc.target.in_arcs.add(new_arc)
+                    arc.target.in_arcs.remove(arc)
+                    holder.inner_net.arcs.remove(arc)
+                    holder.inner_net.arcs.add(new_arc)
+                    inner_bound.append((new_arc, holder))
+            if _outer in bounds:
+                for arc, holder in bounds[_outer]:
+                    arc: PetriNet.Arc
+                    new_arc = PetriNet.Arc(arc.source, outer)
+                    arc.source.out_arcs.add(new_arc)
+                    arc.source.out_arcs.remove(arc)
+                    holder.inner_net.arcs.remove(arc)
+                    holder.inner_net.arcs.add(new_arc)
+                    outer_bound.append((new_arc, holder))
+            _bounds.update({inner: inner_bound, outer: outer_bound})
+            _net.places.remove(_inner)
+            _net.places.remove(_outer)
+            etr.inject_net(_net, None, None)
+
+            print(f'<- Wrapped {name}')
+
+            for arc in tr.in_arcs:
+                arc: PetriNet.Arc
+                new_arc = PetriNet.Arc(arc.source, etr)
+                etr.in_arcs.add(new_arc)
+                arc.source.out_arcs.add(new_arc)
+                arc.source.out_arcs.remove(arc)
+                net.arcs.remove(arc)
+                net.arcs.add(new_arc)
+            for arc in tr.out_arcs:
+                arc: PetriNet.Arc
+                new_arc = PetriNet.Arc(etr, arc.target)
+                etr.out_arcs.add(new_arc)
+                arc.target.in_arcs.add(new_arc)
+                arc.target.in_arcs.remove(arc)
+                net.arcs.remove(arc)
+                net.arcs.add(new_arc)
+
+            net.transitions.add(etr)
+            net.transitions.remove(tr)
+        self.wrapping.discard(path)
+        self.wrapped[path] = (data, _bounds)
+        return data, _bounds
+
+
+def make_epnml(_dir: str, entry_point: str, _ext: str, _postfix: str, out_file: str = OUT_FILE,
+               workers: int = None):
+    start = time.perf_counter()
     print("Reading files...")
     _files = files(_dir, _ext, _postfix)
+    if workers is None:
+        workers = max(1, min(os.cpu_count() or 1, len(_files) // FILES_PER_WORKER))
+    indexed = time.perf_counter()
+    print(f"Indexed {len(_files)} files in {indexed - start:.3f}s")
+    assembler = Assembler(_files, workers)
+    entry = join(_dir, entry_point)
+    assembler.parse_all(entry)
+    parsed = time.perf_counter()
+    print(f"Parsed {len(assembler.parsed)} nets in {parsed - indexed:.3f}s ({workers} workers)")
     print("Wrapping...")
-    (_net, _im, _fm), _ = try_wrap(join(_dir, entry_point), _files)
-    print("Wrapped. Saving...")
+    (_net, _im, _fm), _ = assembler.wrap(entry)
+    wrapped = time.perf_counter()
+    print(f"Wrapped in {wrapped - parsed:.3f}s. Saving...")
     epnml.export_net(_net, _im, out_file, _fm)
-    print(f"Saved as {out_file}")
+    saved = time.perf_counter()
+    print(f"Saved as {out_file} in {saved - wrapped:.3f}s (total {saved - start:.3f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assembles a hierarchical .epnml out of the nets of a directory, '
+                                                 'transitions named after a net are replaced with that net')
+    parser.add_argument('directory', nargs='?', default=TARGET_DIR)
+    parser.add_argument('--entry', default=ENTRY_FILE, help='name of the top net file, without extension')
+    parser.add_argument('--postfix', default=FILE_POSTFIX, help='file name postfix of the nets to insert')
+    parser.add_argument('--ext', default=TARGET_EXT)
+    parser.add_argument('--output', default=OUT_FILE)
+    parser.add_argument('--workers', type=int, default=None, help='parsing processes, 1 parses in this one (default: by the number of files)')
+    args = parser.parse_args()
+    make_epnml(args.directory, args.entry + args.ext, args.ext, args.postfix, args.output, args.workers)
 
 
 if __name__ == '__main__':
-    make_epnml(TARGET_DIR, ENTRY_POINT, TARGET_EXT, FILE_POSTFIX)
+    main()